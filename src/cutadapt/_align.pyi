@@ -1,4 +1,5 @@
-from typing import Optional, Tuple, Iterable
+import array
+from typing import Callable, List, Optional, Sequence, Tuple, Iterable
 
 class DPMatrix:
     m: int
@@ -17,17 +18,47 @@ class Aligner:
         wildcard_query: bool = False,
         indel_cost: int = 1,
         min_overlap: int = 1,
+        indels: bool = True,
     ): ...
     def __repr__(self) -> str: ...
     def _set_reference(self, reference: str) -> None: ...
     @property
     def dpmatrix(self) -> DPMatrix: ...
     def enable_debug(self) -> None: ...
-    def locate(self, query: str) -> Optional[Tuple[int, int, int, int, int, int]]: ...
+    @property
+    def uses_bitvector(self) -> bool: ...
+    def disable_bitvector(self) -> None: ...
+    @property
+    def alignments(self) -> int: ...
+    @property
+    def matches(self) -> int: ...
+    @property
+    def dp_cells(self) -> int: ...
+    def locate(
+        self, query: str, hits: Optional[Tuple[int, int]] = None
+    ) -> Optional[Tuple[int, int, int, int, int, int]]: ...
+    def locate_many(self, sequences: List[str]) -> array.array[int]: ...
+
+class MultipleAligner:
+    def __init__(
+        self,
+        aligners: Sequence[Aligner],
+        prefilters: Optional[Sequence[Optional[Callable[[str], bool]]]] = None,
+    ): ...
+    def __len__(self) -> int: ...
+    def locate(
+        self, query: str, candidates: Optional[Iterable[int]] = None
+    ) -> Optional[Tuple[int, int, int, int, int, int, int]]: ...
 
 class PrefixComparer:
     @property
     def effective_length(self) -> int: ...
+    @property
+    def alignments(self) -> int: ...
+    @property
+    def matches(self) -> int: ...
+    @property
+    def dp_cells(self) -> int: ...
     def __init__(
         self,
         reference: str,
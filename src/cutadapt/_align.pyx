@@ -3,7 +3,10 @@ from cpython.ref cimport PyObject
 from cpython.bytes cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
 from cpython.mem cimport PyMem_Malloc, PyMem_Free, PyMem_Realloc
 from cpython.unicode cimport PyUnicode_GET_LENGTH
+from libc.stdint cimport uint64_t
 from libc.string cimport memcpy, memset
+from cpython cimport array
+import array
 
 from ._match_tables import _upper_table, _acgt_table, _iupac_table
 
@@ -38,6 +41,7 @@ cdef:
     bytes ACGT_TABLE = _acgt_table()
     bytes IUPAC_TABLE = _iupac_table()
     bytes UPPER_TABLE = _upper_table()
+    array.array _INT_ARRAY_TEMPLATE = array.array("i")
 
 
 cdef translate(object string, bytes table):
@@ -56,6 +60,26 @@ cdef translate(object string, bytes table):
     return retval
 
 
+cdef const unsigned char* ascii_data(str string) except NULL:
+    """Return a pointer to the characters of an ASCII-only string"""
+    if not PyUnicode_IS_COMPACT_ASCII(string):
+        raise ValueError("String must contain only ASCII characters")
+    return <const unsigned char*>PyUnicode_DATA(string)
+
+
+cdef inline const char* query_table(bint wildcard_ref, bint wildcard_query):
+    """
+    Return the table that translates query characters into the representation
+    that is compared to the (translated) reference
+    """
+    if wildcard_query:
+        return PyBytes_AS_STRING(IUPAC_TABLE)
+    elif wildcard_ref:
+        return PyBytes_AS_STRING(ACGT_TABLE)
+    else:
+        return PyBytes_AS_STRING(UPPER_TABLE)
+
+
 class DPMatrix:
     """
     Representation of the dynamic-programming matrix.
@@ -166,6 +190,9 @@ cdef class Aligner:
     If neither flag is set, the full ASCII alphabet is used for comparison.
     If any of the flags is set, all non-IUPAC characters in the sequences
     compare as 'not equal'.
+
+    If indels is False, only mismatches are allowed (and indel_cost is ignored).
+    A faster algorithm is then used that only counts mismatches.
     """
     cdef:
         int m
@@ -190,6 +217,14 @@ cdef class Aligner:
         int _mismatch_score
         int _insertion_score
         int _deletion_score
+        bint _indels
+        bint _bitvector  # whether the bit-vector prefilter is used (see _bitvector_may_match)
+        bint _bitvector_reversed
+        uint64_t _peq[256]  # match masks indexed by query character (see _init_bitvector)
+        # Work done by locate() since the Aligner was created
+        readonly size_t alignments  # number of queries aligned
+        readonly size_t matches  # number of those in which a match was found
+        readonly size_t dp_cells  # number of DP matrix cells computed
 
     def __cinit__(
         self,
@@ -200,6 +235,7 @@ cdef class Aligner:
         bint wildcard_query=False,
         int indel_cost=1,
         int min_overlap=1,
+        bint indels=True,
     ):
         self.max_error_rate = max_error_rate
         self.start_in_reference = flags & 1
@@ -208,14 +244,15 @@ cdef class Aligner:
         self.stop_in_query = flags & 8
         self.wildcard_ref = wildcard_ref
         self.wildcard_query = wildcard_query
-        self._set_reference(reference)
-        self._min_overlap = min_overlap
-        self.debug = False
-        self._dpmatrix = None
         if indel_cost < 1:
             raise ValueError('indel_cost must be at least 1')
         self._insertion_cost = indel_cost
         self._deletion_cost = indel_cost
+        self._indels = indels
+        self._set_reference(reference)
+        self._min_overlap = min_overlap
+        self.debug = False
+        self._dpmatrix = None
 
         self._match_score = MATCH_SCORE
         self._mismatch_score = MISMATCH_SCORE
@@ -235,14 +272,14 @@ cdef class Aligner:
         return flags
 
     def __reduce__(self):
-        return (Aligner, (self.reference, self.max_error_rate, self._compute_flags(), self.wildcard_ref, self.wildcard_query, self._insertion_cost, self._min_overlap))
+        return (Aligner, (self.reference, self.max_error_rate, self._compute_flags(), self.wildcard_ref, self.wildcard_query, self._insertion_cost, self._min_overlap, self._indels))
 
     def __repr__(self):
         return (
             f"Aligner(reference='{self.reference}', max_error_rate={self.max_error_rate}, "
             f"flags={self._compute_flags()}, wildcard_ref={self.wildcard_ref}, "
             f"wildcard_query={self.wildcard_query}, indel_cost={self._insertion_cost}, "
-            f"min_overlap={self._min_overlap})"
+            f"min_overlap={self._min_overlap}, indels={self._indels})"
         )
 
     def _set_reference(self, str reference):
@@ -273,6 +310,117 @@ cdef class Aligner:
         else:
             self._reference = reference.encode('ascii')
         self.reference = reference
+        self._init_bitvector()
+
+    cdef _init_bitvector(self):
+        """
+        Compute the match masks in _peq: Bit i of _peq[c] is set if the query
+        character c matches reference[i] (or reference[m - 1 - i] if
+        _bitvector_reversed is set). They are needed for references of at most
+        64 characters by the bit-vector prefilter and by _locate_hamming().
+
+        The prefilter requires unit costs and works on alignments that start at
+        the beginning of the reference. If only a prefix of the reference may be
+        skipped, reference and query are processed in reverse. If both a prefix
+        and a suffix may be skipped, the length of the aligned part of the
+        reference is unknown and the prefilter would reject almost nothing, so
+        it is not used.
+        """
+        cdef:
+            int b, i
+            unsigned char r, q
+            uint64_t mask
+            bytes table
+            const unsigned char* ref = self._reference
+        self._bitvector = (
+            1 <= self.m <= 64
+            and self._indels
+            and self._insertion_cost == 1
+            and not (self.start_in_reference and self.stop_in_reference)
+        )
+        if not (1 <= self.m <= 64 and (self._bitvector or not self._indels)):
+            return
+        self._bitvector_reversed = self._bitvector and self.start_in_reference
+        if self.wildcard_query:
+            table = IUPAC_TABLE
+        elif self.wildcard_ref:
+            table = ACGT_TABLE
+        else:
+            table = UPPER_TABLE
+        for b in range(256):
+            q = table[b]
+            mask = 0
+            for i in range(self.m):
+                r = ref[self.m - 1 - i] if self._bitvector_reversed else ref[i]
+                if (self.wildcard_ref or self.wildcard_query) and (r & q) != 0:
+                    mask |= (<uint64_t>1) << i
+                elif not (self.wildcard_ref or self.wildcard_query) and r == q:
+                    mask |= (<uint64_t>1) << i
+            self._peq[b] = mask
+
+    cdef bint _bitvector_may_match(self, const unsigned char* query, int n) nogil:
+        """
+        Return whether the query may contain an acceptable alignment.
+
+        This computes edit distances with the bit-parallel algorithm by Myers
+        (in the formulation by Hyyrö) and checks the error rate and minimum
+        overlap for all cells in which an alignment can end. The DP in locate()
+        finds only alignments that have at least these costs, so if this
+        returns False, locate() would not find a match either.
+        """
+        cdef:
+            int m = self.m
+            int i, j
+            int cost = m  # edit distance in the last row
+            bint reversed_ = self._bitvector_reversed
+            # Flags as seen when processing reference and query in reverse
+            bint start_in_query = self.stop_in_query if reversed_ else self.start_in_query
+            bint stop_in_query = self.start_in_query if reversed_ else self.stop_in_query
+            bint stop_in_reference = self.start_in_reference if reversed_ else self.stop_in_reference
+            double max_error_rate = self.max_error_rate
+            double max_errors = self.effective_length * max_error_rate
+            bint long_enough = m >= self._min_overlap
+            int effective_length
+            uint64_t high_bit = (<uint64_t>1) << (m - 1)
+            uint64_t top = 0 if start_in_query else 1
+            uint64_t pv = ~(<uint64_t>0)  # positive vertical differences
+            uint64_t mv = 0  # negative vertical differences
+            uint64_t eq, xv, xh, ph, mh
+        for j in range(n):
+            eq = self._peq[query[n - 1 - j] if reversed_ else query[j]]
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            if ph & high_bit:
+                cost += 1
+            elif mh & high_bit:
+                cost -= 1
+            ph = (ph << 1) | top
+            mh = mh << 1
+            pv = mh | ~(xv | ph)
+            mv = ph & xv
+            if stop_in_query and long_enough and cost <= max_errors:
+                return True
+
+        # Last column
+        cost = 0 if start_in_query else n
+        for i in range(1, m + 1):
+            if pv & ((<uint64_t>1) << (i - 1)):
+                cost += 1
+            elif mv & ((<uint64_t>1) << (i - 1)):
+                cost -= 1
+            if i < self._min_overlap or not (stop_in_reference or i == m):
+                continue
+            effective_length = i
+            if self.wildcard_ref:
+                if reversed_:
+                    effective_length -= self.n_counts[m] - self.n_counts[m - i]
+                else:
+                    effective_length -= self.n_counts[i]
+            if cost <= effective_length * max_error_rate:
+                return True
+        return False
 
     property dpmatrix:
         """
@@ -289,9 +437,24 @@ cdef class Aligner:
         """
         self.debug = True
 
-    def locate(self, str query):
+    property uses_bitvector:
+        """
+        Whether locate() first runs the bit-vector prefilter. This is chosen
+        automatically and does not change the results of locate().
+        """
+        def __get__(self):
+            return self._bitvector
+
+    def disable_bitvector(self):
         """
-        locate(query) -> (refstart, refstop, querystart, querystop, score, errors)
+        Always compute the full dynamic programming matrix in locate()
+        (for testing).
+        """
+        self._bitvector = False
+
+    def locate(self, str query, hits=None):
+        """
+        locate(query, hits=None) -> (refstart, refstop, querystart, querystop, score, errors)
 
         Find the query within the reference associated with this aligner. The
         intervals (querystart, querystop) and (refstart, refstop) give the
@@ -301,26 +464,100 @@ cdef class Aligner:
         self.reference[refstart:refstop] were found to align best to each other.
 
         The alignment itself is not returned.
+
+        hits can be the result of KmerFinder.hit_positions() for the query,
+        where the k-mer finder must have been created for this reference and
+        its parameters (see create_positions_and_kmers()). Every acceptable
+        alignment then contains one of the k-mer occurrences, and only the
+        columns of the DP matrix in a window around them are computed.
+        """
+        cdef:
+            int result[6]
+            int start = 0
+            int stop = len(query)
+            int span
+        if hits is not None and not self.debug:
+            # An alignment spans at most m + k query characters
+            span = self.m + <int>(self.max_error_rate * self.m)
+            # The window can only be narrowed on a side on which the query may
+            # be skipped but the reference may not (otherwise, the alignment
+            # could also end at the window boundary).
+            if self.start_in_query and not self.start_in_reference:
+                start = max(0, <int>hits[0] - span)
+            if self.stop_in_query and not self.stop_in_reference:
+                stop = min(stop, <int>hits[1] + span)
+        if not self._locate(query, result, start, stop):
+            return None
+        return (result[0], result[1], result[2], result[3], result[4], result[5])
+
+    def locate_many(self, sequences):
+        """
+        locate_many(sequences) -> array.array
+
+        Locate each of the given sequences (a list of str) as with locate().
+
+        Return an array of integers that contains seven entries for each
+        sequence in which a match was found: the index of the sequence in the
+        list followed by the six values that locate() would return. Sequences
+        without a match are omitted.
+        """
+        cdef:
+            list sequences_list = sequences
+            Py_ssize_t i, n_hits = 0
+            int result[6]
+            array.array hits = array.clone(_INT_ARRAY_TEMPLATE, 7 * len(sequences_list), zero=False)
+            int* hits_ptr = hits.data.as_ints
+        for i in range(len(sequences_list)):
+            if self._locate(sequences_list[i], result):
+                hits_ptr[0] = i
+                memcpy(hits_ptr + 1, result, 6 * sizeof(int))
+                hits_ptr += 7
+                n_hits += 1
+        array.resize(hits, 7 * n_hits)
+        return hits
+
+    cdef int _locate(self, str query, int* result, int start=0, int stop=-1) except -1:
+        """
+        Implementation of locate(). If a match was found, store it in
+        result (which must have room for six integers) and return 1.
+        Return 0 otherwise.
+
+        Only query[start:stop] is aligned (stop=-1 means the end of the query),
+        but the returned query positions refer to the full query.
         """
+        if stop == -1:
+            stop = len(query)
+        self.alignments += 1
+        if not self._indels:
+            # All diagonals are evaluated at once, count the full matrix
+            self.dp_cells += <size_t>self.m * (stop - start)
+            if not self._locate_hamming(ascii_data(query) + start, stop - start, result):
+                return 0
+            result[2] += start
+            result[3] += start
+            self.matches += 1
+            return 1
         cdef:
             const char* s1 = PyBytes_AS_STRING(self._reference)
-            bytes query_bytes
-            const char* s2
+            # The query is not translated as a whole. Instead, each character
+            # is translated when its column is computed.
+            const unsigned char* s2 = ascii_data(query) + start
+            const char* table = query_table(self.wildcard_ref, self.wildcard_query)
+            char c2
             int m = self.m
-            int n = len(query)
+            int n = stop - start
             _Entry* column = self.column  # Current column of the DP matrix
             double max_error_rate = self.max_error_rate
             bint stop_in_query = self.stop_in_query
-            bint compare_ascii = False
-
-        if self.wildcard_query:
-            query_bytes = translate(query, IUPAC_TABLE)
-        elif self.wildcard_ref:
-            query_bytes = translate(query, ACGT_TABLE)
-        else:
-            query_bytes = translate(query, UPPER_TABLE)
-            compare_ascii = True
-        s2 = query_bytes
+            bint compare_ascii = not (self.wildcard_ref or self.wildcard_query)
+
+        if (
+            self._bitvector
+            and not self.debug
+            and n > 0
+            and not self._bitvector_may_match(s2, n)
+        ):
+            return 0
         """
         DP Matrix:
                    query (j)
@@ -401,6 +638,7 @@ cdef class Aligner:
             int ref_start
             int cur_effective_length
             int last_filled_i = 0
+            size_t dp_cells = 0
             int best_length
             int origin_increment = 1 if self.start_in_query else 0
             int insertion_cost_increment = self._insertion_cost if not self.start_in_query else 0
@@ -428,11 +666,13 @@ cdef class Aligner:
                 # fill in first entry in this column
                 column[0].origin += origin_increment
                 column[0].cost += insertion_cost_increment
+                c2 = table[s2[j-1]]
+                dp_cells += last
                 for i in range(1, last + 1):
                     if compare_ascii:
-                        characters_equal = (s1[i-1] == s2[j-1])
+                        characters_equal = (s1[i-1] == c2)
                     else:
-                        characters_equal = (s1[i-1] & s2[j-1]) != 0
+                        characters_equal = (s1[i-1] & c2) != 0
                     if characters_equal:
                         # If the characters match, we can skip computing costs for
                         # insertion and deletion as they are at least as high.
@@ -524,18 +764,20 @@ cdef class Aligner:
                             break
                 # column finished
 
+        self.dp_cells += dp_cells
         if max_n == n:
             first_i = 0 if self.stop_in_reference else m
             # search in last column
             for i in reversed(range(first_i, last_filled_i + 1)):
-                length = i + min(column[i].origin, 0)
+                origin = column[i].origin
+                length = i + min(origin, 0)
                 cost = column[i].cost
                 score = column[i].score
                 if self.wildcard_ref:
                     if length < m:
                         # Recompute effective length so that it only takes into
                         # account the matching part of the reference
-                        ref_start = -min(column[i].origin, 0)
+                        ref_start = -min(origin, 0)
                         assert 0 <= ref_start <= m
                         cur_effective_length = length - (self.n_counts[i] - self.n_counts[ref_start])
                     else:
@@ -558,14 +800,14 @@ cdef class Aligner:
                 ):
                     best.score = score
                     best.cost = cost
-                    best.origin = column[i].origin
+                    best.origin = origin
                     best.ref_stop = i
                     best.query_stop = n
         if best.cost == m + n + 1:
             # best.cost was initialized with this value.
             # If it is unchanged, no alignment was found that has
             # an error rate within the allowed range.
-            return None
+            return 0
 
         cdef int query_start
         if best.origin >= 0:
@@ -575,13 +817,253 @@ cdef class Aligner:
             ref_start = -best.origin
             query_start = 0
 
-        return (ref_start, best.ref_stop, query_start, best.query_stop, best.score, best.cost)
+        result[0] = ref_start
+        result[1] = best.ref_stop
+        result[2] = query_start + start
+        result[3] = best.query_stop + start
+        result[4] = best.score
+        result[5] = best.cost
+        self.matches += 1
+        return 1
+
+    cdef int _locate_hamming(self, const unsigned char* q, int n, int* result):
+        """
+        Implementation of locate() for the case that indels are not allowed
+
+        Every alignment is then a diagonal of the DP matrix, and only the cell
+        in which the diagonal ends needs to be looked at (in the last row or
+        the last column). The cells are visited in the same order as by the DP
+        in _locate() so that the same alignment is chosen if there are
+        multiple ones with the same score.
+
+        For references of at most 64 characters, the number of mismatches on
+        all diagonals is computed in parallel: For each query character, one
+        bit vector per bit of the mismatch count (up to the maximum no. of
+        errors) is updated with bitwise operations.
+        """
+        cdef:
+            int m = self.m
+            int k = <int> (self.max_error_rate * m)
+            int i, j, p, cost
+            int first_i = 0 if self.stop_in_reference else m
+            int n_planes = 1
+            uint64_t planes[8]  # bit p of the mismatch count of each diagonal
+            uint64_t overflow  # diagonals with too many mismatches or an invalid start
+            uint64_t carry, x
+            _Match best
+        best.ref_stop = m
+        best.query_stop = n
+        best.cost = m + n + 1
+        best.origin = 0
+        best.score = 0
+
+        if 1 <= m <= 64:
+            while (1 << n_planes) <= k:
+                n_planes += 1
+            for p in range(n_planes):
+                planes[p] = 0
+            # Bit i - 1 represents the diagonal through cell (i, j) in column j.
+            # In column 0, a diagonal can only start in row i > 0 if a prefix of
+            # the reference may be skipped.
+            overflow = 0 if self.start_in_reference else ~(<uint64_t>0)
+            for j in range(1, n + 1):
+                x = ~self._peq[q[j - 1]]
+                overflow <<= 1
+                if j > 1 and not self.start_in_query:
+                    overflow |= 1
+                carry = x
+                for p in range(n_planes):
+                    planes[p] <<= 1
+                    x = planes[p] & carry
+                    planes[p] ^= carry
+                    carry = x
+                overflow |= carry
+                if self.stop_in_query and not (overflow >> (m - 1)) & 1:
+                    cost = 0
+                    for p in range(n_planes):
+                        cost |= ((planes[p] >> (m - 1)) & 1) << p
+                    if self._update_best(&best, m, j, cost, n) and cost == 0 and j >= m:
+                        # exact match, stop early
+                        break
+            else:
+                for i in reversed(range(max(first_i, 1), m + 1)):
+                    if (overflow >> (i - 1)) & 1:
+                        continue
+                    cost = 0
+                    for p in range(n_planes):
+                        cost |= ((planes[p] >> (i - 1)) & 1) << p
+                    self._update_best(&best, i, n, cost, n)
+                if first_i == 0 and (n == 0 or self.start_in_query):
+                    self._update_best(&best, 0, n, 0, n)
+        else:
+            if self.stop_in_query:
+                for j in range(1, n + 1):
+                    cost = self._diagonal_cost(q, m, j, k)
+                    if cost <= k and self._update_best(&best, m, j, cost, n) and cost == 0 and j >= m:
+                        break
+                else:
+                    self._hamming_last_column(&best, q, first_i, n, k)
+            else:
+                self._hamming_last_column(&best, q, first_i, n, k)
+
+        if best.cost == m + n + 1:
+            return 0
+        if best.origin >= 0:
+            result[0] = 0
+            result[2] = best.origin
+        else:
+            result[0] = -best.origin
+            result[2] = 0
+        result[1] = best.ref_stop
+        result[3] = best.query_stop
+        result[4] = best.score
+        result[5] = best.cost
+        return 1
+
+    cdef void _hamming_last_column(self, _Match* best, const unsigned char* q, int first_i, int n, int k):
+        cdef int i, cost
+        for i in reversed(range(first_i, self.m + 1)):
+            cost = self._diagonal_cost(q, i, n, k)
+            if cost <= k:
+                self._update_best(best, i, n, cost, n)
+
+    cdef int _diagonal_cost(self, const unsigned char* q, int i, int j, int k):
+        """
+        Return the number of mismatches on the diagonal that ends in cell (i, j)
+        or k + 1 if it is greater than k or if the diagonal cannot start where
+        it would need to start.
+        """
+        cdef:
+            int origin = j - i
+            int ref_start = max(0, -origin)
+            int t
+            int cost = 0
+            const unsigned char* ref = self._reference
+            unsigned char c
+            const char* table = query_table(self.wildcard_ref, self.wildcard_query)
+        if (origin > 0 and not self.start_in_query) or (origin < 0 and not self.start_in_reference):
+            return k + 1
+        for t in range(ref_start, i):
+            c = table[q[t + origin]]
+            if self.wildcard_ref or self.wildcard_query:
+                if (ref[t] & c) == 0:
+                    cost += 1
+            elif ref[t] != c:
+                cost += 1
+            if cost > k:
+                break
+        return cost
+
+    cdef bint _update_best(self, _Match* best, int i, int j, int cost, int n):
+        """
+        Consider the alignment that ends in cell (i, j) and has the given number
+        of mismatches. Replace the best alignment with it using the same
+        criteria as the DP in _locate(). Return whether it was replaced.
+        """
+        cdef:
+            int m = self.m
+            int origin = j - i
+            int length = i + min(origin, 0)
+            int score = length - 2 * cost
+            int cur_effective_length = length
+            int best_length = best.ref_stop + min(best.origin, 0)
+        if self.wildcard_ref:
+            cur_effective_length = length - (self.n_counts[i] - self.n_counts[i - length])
+        if not (
+            length >= self._min_overlap
+            and cost <= cur_effective_length * self.max_error_rate
+        ):
+            return False
+        if (
+            (best.cost == m + n + 1)
+            or (origin <= best.origin + m // 2 and score > best.score)
+            or (length > best_length and score > best.score)
+        ):
+            best.score = score
+            best.cost = cost
+            best.origin = origin
+            best.ref_stop = i
+            best.query_stop = j
+            return True
+        return False
 
     def __dealloc__(self):
         PyMem_Free(self.column)
         PyMem_Free(self.n_counts)
 
 
+cdef class MultipleAligner:
+    """
+    Find the best alignment of a query to any of multiple references.
+
+    This is equivalent to calling locate() on each of the given Aligner
+    objects and choosing the alignment with the highest score (and, if
+    scores are equal, with the fewest errors), but avoids creating
+    intermediate results for the references that do not win.
+
+    If prefilters is given, it must contain one callable (or None) for each
+    aligner. An aligner is skipped if its prefilter returns False for the query.
+    """
+    cdef:
+        list _aligners
+        list _prefilters
+
+    def __cinit__(self, aligners, prefilters=None):
+        self._aligners = list(aligners)
+        for aligner in self._aligners:
+            if not isinstance(aligner, Aligner):
+                raise TypeError("MultipleAligner requires Aligner objects")
+        if prefilters is None:
+            prefilters = [None] * len(self._aligners)
+        self._prefilters = list(prefilters)
+        if len(self._prefilters) != len(self._aligners):
+            raise ValueError("Need exactly one prefilter for each aligner")
+
+    def __reduce__(self):
+        return (MultipleAligner, (self._aligners, self._prefilters))
+
+    def __len__(self):
+        return len(self._aligners)
+
+    def locate(self, str query, candidates=None):
+        """
+        locate(query, candidates=None) -> (index, refstart, refstop, querystart, querystop, score, errors)
+
+        Return the best alignment of the query to any of the references or
+        None if there is none. index is the index of the aligner that found it.
+
+        If candidates is given, only the aligners with the given indices
+        (in increasing order) are used, and prefilters are not run.
+        """
+        cdef:
+            Py_ssize_t i, best_index = -1
+            int result[6]
+            int best[6]
+            object prefilter
+        if candidates is None:
+            candidates = range(len(self._aligners))
+            use_prefilters = True
+        else:
+            use_prefilters = False
+        for i in candidates:
+            if use_prefilters:
+                prefilter = self._prefilters[i]
+                if prefilter is not None and not prefilter(query):
+                    continue
+            if not (<Aligner>self._aligners[i])._locate(query, result):
+                continue
+            if (
+                best_index == -1
+                or result[4] > best[4]
+                or (result[4] == best[4] and result[5] < best[5])
+            ):
+                best_index = i
+                memcpy(best, result, 6 * sizeof(int))
+        if best_index == -1:
+            return None
+        return (best_index, best[0], best[1], best[2], best[3], best[4], best[5])
+
+
 cdef class PrefixComparer:
     """
     A version of the Aligner that is specialized in the following way:
@@ -601,6 +1083,10 @@ cdef class PrefixComparer:
         int max_k  # max. number of errors
         readonly int effective_length
         int min_overlap
+        # Work done by locate() (as in Aligner)
+        readonly size_t alignments
+        readonly size_t matches
+        readonly size_t dp_cells
 
     # __init__ instead of __cinit__ because we need to override this in SuffixComparer
     def __init__(
@@ -649,37 +1135,38 @@ cdef class PrefixComparer:
 
         This function returns a tuple compatible with what Aligner.locate returns.
         """
+        return self._locate(query, False)
+
+    cdef _locate(self, str query, bint reverse_query):
+        """
+        Implementation of locate(). If reverse_query is set, the query is
+        read from its end.
+        """
         cdef:
-            bytes query_bytes
             char* r_ptr = self.reference
-            char* q_ptr
+            const unsigned char* q_ptr = ascii_data(query)
+            const char* table = query_table(self.wildcard_ref, self.wildcard_query)
             int i
             int n = len(query)
             int length = min(self.m, n)
-            bint compare_ascii = False
+            bint compare_ascii = not (self.wildcard_ref or self.wildcard_query)
             int errors = 0
             int score
-
-        if self.wildcard_query:
-            query_bytes = translate(query, IUPAC_TABLE)
-        elif self.wildcard_ref:
-            query_bytes = translate(query, ACGT_TABLE)
-        else:
-            query_bytes = translate(query, UPPER_TABLE)
-            compare_ascii = True
-        q_ptr = query_bytes
-
-        if compare_ascii:
-            for i in range(length):
-                if r_ptr[i] != q_ptr[i]:
-                    errors += 1
-        else:
-            for i in range(length):
-                if (r_ptr[i] & q_ptr[i]) == 0:
+            char c
+
+        self.alignments += 1
+        self.dp_cells += length
+        for i in range(length):
+            c = table[q_ptr[n - 1 - i] if reverse_query else q_ptr[i]]
+            if compare_ascii:
+                if r_ptr[i] != c:
                     errors += 1
+            elif (r_ptr[i] & c) == 0:
+                errors += 1
 
         if errors > self.max_k or length < self.min_overlap:
             return None
+        self.matches += 1
         score = (length - errors) * MATCH_SCORE + errors * MISMATCH_SCORE
         return (0, length, 0, length, score, errors)
 
@@ -698,7 +1185,8 @@ cdef class SuffixComparer(PrefixComparer):
 
     def locate(self, str query):
         cdef int n = len(query)
-        result = super().locate(query[::-1])
+        # The reference is stored reversed, compare it to the reversed query
+        result = self._locate(query, True)
         if result is None:
             return None
         _, length, _, _, score, errors = result
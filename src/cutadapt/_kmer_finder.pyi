@@ -10,3 +10,13 @@ class KmerFinder:
         query_wildcards: bool = False,
     ): ...
     def kmers_present(self, __sequence: str) -> bool: ...
+    def hit_positions(self, __sequence: str) -> Optional[Tuple[int, int]]: ...
+    @property
+    def searched(self) -> int: ...
+    @property
+    def rejected(self) -> int: ...
+
+class MultipleKmerFinder:
+    def __init__(self, kmer_finders: List[KmerFinder]): ...
+    def __len__(self) -> int: ...
+    def candidates(self, __sequence: str) -> List[int]: ...
@@ -1,6 +1,6 @@
 # cython: profile=False, emit_code_comments=False, language_level=3
 
-from cpython.mem cimport PyMem_Realloc, PyMem_Free
+from cpython.mem cimport PyMem_Malloc, PyMem_Realloc, PyMem_Free
 from libc.string cimport memcpy, memset, strlen
 
 from cpython.unicode cimport PyUnicode_CheckExact, PyUnicode_GET_LENGTH
@@ -42,6 +42,12 @@ if the combined length of the words exceeds a machine integer, but for
 cutadapt the words that are searched are usually smaller. (Illumina adapter
 is 33 bases for example).
 
+Words that are longer than a machine integer get a search of their own that
+uses a bitmask of several machine words. The state is shifted word by word,
+carrying the highest bit of each word over into the next one. The masks for
+all machine words that belong to one character are stored next to each other,
+so for a search using n words, the masks for character c start at c * n.
+
 """
 # Dnaio conveniently ensures that all sequences are ASCII only.
 DEF BITMASK_INDEX_SIZE = 128
@@ -57,10 +63,11 @@ cdef extern from "Python.h":
 
 ctypedef struct KmerSearchEntry:
     size_t mask_offset
+    size_t number_of_words  # Number of machine words per bitmask
     ssize_t search_start
     ssize_t search_stop  # 0 if going to end of sequence.
     bitmask_t init_mask
-    bitmask_t found_mask
+    bitmask_t found_mask  # Applies to the last machine word
 
 
 cdef class KmerFinder:
@@ -98,27 +105,36 @@ cdef class KmerFinder:
     cdef:
         KmerSearchEntry *search_entries
         bitmask_t *search_masks
+        bitmask_t *state
         size_t number_of_searches
+        size_t number_of_masks
+        size_t max_number_of_words
         readonly object positions_and_kmers
         readonly bint ref_wildcards
         readonly bint query_wildcards
+        readonly size_t searched  # number of sequences searched
+        readonly size_t rejected  # number of those in which no kmer was found
 
     def __cinit__(self, positions_and_kmers, ref_wildcards=False, query_wildcards=False):
         cdef char[64] search_word
         self.search_masks = NULL
         self.search_entries = NULL
+        self.state = NULL
         self.number_of_searches = 0
+        self.number_of_masks = 0
+        self.max_number_of_words = 1
         self.ref_wildcards = ref_wildcards
         self.query_wildcards = query_wildcards
-        self.number_of_searches = 0
-        cdef size_t mask_offset = 0
         cdef char *kmer_ptr
         cdef size_t offset
         cdef bitmask_t init_mask, found_mask
         cdef Py_ssize_t kmer_length
+        cdef size_t number_of_words
 
         match_lookup = matches_lookup(ref_wildcards, query_wildcards)
         for (start, stop, kmers) in positions_and_kmers:
+            if stop is None:  # Encode 'end of sequence' as 0.
+                stop = 0
             index = 0 
             while index < len(kmers):
                 memset(search_word, 0, 64)
@@ -135,35 +151,63 @@ cdef class KmerFinder:
                     if not PyUnicode_IS_COMPACT_ASCII(kmer):
                         raise ValueError("Only ASCII strings are supported")
                     kmer_length = PyUnicode_GET_LENGTH(kmer)
+                    kmer_ptr = <char *> PyUnicode_DATA(kmer)
                     if kmer_length > MAX_WORD_SIZE:
-                        raise ValueError(f"{kmer} of length {kmer_length} is longer "
-                                         f"than the maximum of {MAX_WORD_SIZE}.")
+                        if offset == 0:
+                            # A long kmer gets a search of its own.
+                            number_of_words = (kmer_length + MAX_WORD_SIZE - 1) // MAX_WORD_SIZE
+                            self._add_search(
+                                start, stop, kmer_ptr, kmer_length, number_of_words,
+                                1ULL, <bitmask_t>1ULL << ((kmer_length - 1) % MAX_WORD_SIZE),
+                                match_lookup)
+                            index += 1
+                        break
                     if (offset + kmer_length) > MAX_WORD_SIZE:
                         break
                     init_mask |= <bitmask_t>1ULL << offset
-                    kmer_ptr = <char *> PyUnicode_DATA(kmer)
                     memcpy(search_word + offset, kmer_ptr, kmer_length)
                     # Set the found bit at the last character.
                     found_mask |= <bitmask_t>1ULL << (offset + kmer_length - 1)
                     offset = offset + kmer_length
                     index += 1
-                i = self.number_of_searches  # Save the index position for the mask and entry
-                self.number_of_searches += 1
-                self.search_entries = <KmerSearchEntry *>PyMem_Realloc(self.search_entries, self.number_of_searches * sizeof(KmerSearchEntry))
-                self.search_masks = <bitmask_t *>PyMem_Realloc(self.search_masks, self.number_of_searches * sizeof(bitmask_t) * BITMASK_INDEX_SIZE)
-                mask_offset = i * BITMASK_INDEX_SIZE
-                self.search_entries[i].search_start  = start
-                if stop is None:  # Encode 'end of sequence' as 0.
-                    stop = 0
-                self.search_entries[i].search_stop = stop
-                self.search_entries[i].mask_offset = mask_offset
-                self.search_entries[i].init_mask = init_mask
-                self.search_entries[i].found_mask = found_mask
-                # Offset -1 because we don't count the last NULL byte
-                populate_needle_mask(self.search_masks + mask_offset, search_word, offset,
-                                     match_lookup)
+                if offset > 0:
+                    self._add_search(start, stop, search_word, offset, 1,
+                                     init_mask, found_mask, match_lookup)
+        self.state = <bitmask_t *>PyMem_Realloc(
+            self.state, self.max_number_of_words * sizeof(bitmask_t))
+        if self.state == NULL:
+            raise MemoryError()
         self.positions_and_kmers = positions_and_kmers
 
+    cdef _add_search(self, ssize_t start, ssize_t stop, const char *word,
+                     size_t word_length, size_t number_of_words,
+                     bitmask_t init_mask, bitmask_t found_mask, match_lookup):
+        cdef size_t i = self.number_of_searches  # Save the index position for the entry
+        cdef size_t mask_offset = self.number_of_masks
+        cdef size_t mask_size = number_of_words * BITMASK_INDEX_SIZE
+        cdef KmerSearchEntry *search_entries = <KmerSearchEntry *>PyMem_Realloc(
+            self.search_entries, (i + 1) * sizeof(KmerSearchEntry))
+        if search_entries == NULL:
+            raise MemoryError()
+        self.search_entries = search_entries
+        cdef bitmask_t *search_masks = <bitmask_t *>PyMem_Realloc(
+            self.search_masks, (mask_offset + mask_size) * sizeof(bitmask_t))
+        if search_masks == NULL:
+            raise MemoryError()
+        self.search_masks = search_masks
+        self.number_of_searches += 1
+        self.number_of_masks += mask_size
+        if number_of_words > self.max_number_of_words:
+            self.max_number_of_words = number_of_words
+        self.search_entries[i].search_start = start
+        self.search_entries[i].search_stop = stop
+        self.search_entries[i].mask_offset = mask_offset
+        self.search_entries[i].number_of_words = number_of_words
+        self.search_entries[i].init_mask = init_mask
+        self.search_entries[i].found_mask = found_mask
+        populate_needle_mask(self.search_masks + mask_offset, word, word_length,
+                             number_of_words, match_lookup)
+
     def __reduce__(self):
         return KmerFinder, (self.positions_and_kmers, self.ref_wildcards, self.query_wildcards)
 
@@ -183,59 +227,102 @@ cdef class KmerFinder:
             raise ValueError("Only ASCII strings are supported")
         cdef const char *seq = <char *>PyUnicode_DATA(sequence)
         cdef Py_ssize_t seq_length = PyUnicode_GET_LENGTH(sequence)
+        self.searched += 1
         for i in range(self.number_of_searches):
             entry = self.search_entries[i]
-            start = entry.search_start 
-            stop = entry.search_stop
-            if start < 0:
-                start = seq_length + start
-                if start < 0:
-                    start = 0
-            elif start > seq_length:
+            if not search_region(entry.search_start, entry.search_stop, seq_length,
+                                 &start, &stop):
                 continue
-            if stop < 0:
-                stop = seq_length + stop
-                if stop <= 0:  # No need to search
-                    continue
-            elif stop == 0:  # stop == 0 means go to end of sequence.
-                stop = seq_length
             search_length = stop - start
-            if search_length <= 0:
-                continue
             search_ptr = seq + start
             init_mask = entry.init_mask
             found_mask = entry.found_mask
             mask_ptr = self.search_masks + entry.mask_offset
-            search_result = shift_and_multiple_is_present(
-                search_ptr, search_length, mask_ptr, init_mask, found_mask)
+            if entry.number_of_words == 1:
+                search_result = shift_and_multiple_is_present(
+                    search_ptr, search_length, mask_ptr, init_mask, found_mask)
+            else:
+                search_result = shift_and_multiword_hits(
+                    search_ptr, search_length, mask_ptr, entry.number_of_words,
+                    found_mask, self.state, NULL) != -1
             if search_result:
                 return True
+        self.rejected += 1
         return False
 
+    def hit_positions(self, str sequence):
+        """
+        hit_positions(sequence) -> (leftmost, rightmost) or None
+
+        Return None if kmers_present(sequence) would return False. Otherwise,
+        return the end positions (exclusive) of the leftmost and of the
+        rightmost kmer occurrence in the sequence (considering only
+        occurrences within their search regions).
+        """
+        cdef:
+            KmerSearchEntry *entry
+            size_t i
+            ssize_t start, stop
+            ssize_t first, last
+            ssize_t leftmost = -1
+            ssize_t rightmost = -1
+            const bitmask_t *mask_ptr
+        if not PyUnicode_IS_COMPACT_ASCII(sequence):
+            raise ValueError("Only ASCII strings are supported")
+        cdef const char *seq = <char *>PyUnicode_DATA(sequence)
+        cdef Py_ssize_t seq_length = PyUnicode_GET_LENGTH(sequence)
+        self.searched += 1
+        for i in range(self.number_of_searches):
+            entry = self.search_entries + i
+            if not search_region(entry.search_start, entry.search_stop, seq_length,
+                                 &start, &stop):
+                continue
+            mask_ptr = self.search_masks + entry.mask_offset
+            if entry.number_of_words == 1:
+                first = shift_and_multiple_hits(
+                    seq + start, stop - start, mask_ptr, entry.init_mask,
+                    entry.found_mask, &last)
+            else:
+                first = shift_and_multiword_hits(
+                    seq + start, stop - start, mask_ptr, entry.number_of_words,
+                    entry.found_mask, self.state, &last)
+            if first == -1:
+                continue
+            if leftmost == -1 or start + first < leftmost:
+                leftmost = start + first
+            if start + last > rightmost:
+                rightmost = start + last
+        if leftmost == -1:
+            self.rejected += 1
+            return None
+        return (leftmost + 1, rightmost + 1)
+
     def __dealloc__(self):
         PyMem_Free(self.search_masks)
         PyMem_Free(self.search_entries)
+        PyMem_Free(self.state)
 
 
-cdef void set_masks(bitmask_t *needle_mask, size_t pos, const char *chars):
-    cdef char c
+cdef void set_masks(bitmask_t *needle_mask, size_t pos, size_t number_of_words,
+                    const char *chars):
     cdef size_t i
+    cdef size_t word = pos // MAX_WORD_SIZE
+    cdef bitmask_t bit = <bitmask_t>1ULL << (pos % MAX_WORD_SIZE)
     for i in range(strlen(chars)):
-        needle_mask[<uint8_t>chars[i]] |= <bitmask_t>1ULL << pos
+        needle_mask[<uint8_t>chars[i] * number_of_words + word] |= bit
 
 cdef populate_needle_mask(bitmask_t *needle_mask, const char *needle, size_t needle_length,
-                          match_lookup):
+                          size_t number_of_words, match_lookup):
     cdef size_t i
     cdef char c
-    cdef uint8_t j
-    if needle_length > MAX_WORD_SIZE:
+    if needle_length > MAX_WORD_SIZE * number_of_words:
         raise ValueError("The pattern is too long!")
-    memset(needle_mask, 0, sizeof(bitmask_t) * BITMASK_INDEX_SIZE)
+    memset(needle_mask, 0, sizeof(bitmask_t) * BITMASK_INDEX_SIZE * number_of_words)
     for i in range(needle_length):
         c = needle[i]
         if c == 0:
             continue
-        set_masks(needle_mask, i, match_lookup[c])
+        set_masks(needle_mask, i, number_of_words, match_lookup[c])
 
 
 cdef bint shift_and_multiple_is_present(
@@ -255,3 +342,345 @@ cdef bint shift_and_multiple_is_present(
         if (R & found_mask):
             return True
     return False
+
+
+cdef ssize_t shift_and_multiple_hits(
+    const char *haystack,
+    size_t haystack_length,
+    const bitmask_t *needle_mask,
+    bitmask_t init_mask,
+    bitmask_t found_mask,
+    ssize_t *last):
+    """
+    Return the position of the last character of the first occurrence of
+    any of the words or -1 if there is none. The position of the last
+    character of the last occurrence is stored in last.
+    """
+    cdef:
+        bitmask_t R = 0
+        size_t i
+        ssize_t first = -1
+
+    for i in range(haystack_length):
+        R <<= 1
+        R |= init_mask
+        R &= needle_mask[<uint8_t>haystack[i]]
+        if (R & found_mask):
+            if first == -1:
+                first = i
+            last[0] = i
+    return first
+
+
+cdef ssize_t shift_and_multiword_hits(
+    const char *haystack,
+    size_t haystack_length,
+    const bitmask_t *needle_mask,
+    size_t number_of_words,
+    bitmask_t found_mask,
+    bitmask_t *R,
+    ssize_t *last):
+    """
+    Shift-and for a single word that is longer than a machine integer.
+    R is the state and must have room for number_of_words bitmasks.
+
+    Return the position of the last character of the first occurrence or -1
+    if there is none. If last is NULL, return immediately after the first
+    occurrence. Otherwise, store the position of the last character of the
+    last occurrence in it.
+    """
+    cdef:
+        size_t i, w
+        bitmask_t carry, r
+        const bitmask_t *char_mask
+        size_t last_word = number_of_words - 1
+        ssize_t first = -1
+
+    memset(R, 0, number_of_words * sizeof(bitmask_t))
+    for i in range(haystack_length):
+        char_mask = needle_mask + <uint8_t>haystack[i] * number_of_words
+        carry = 1  # Start a new match at every position
+        for w in range(number_of_words):
+            r = R[w]
+            R[w] = ((r << 1) | carry) & char_mask[w]
+            carry = r >> (MAX_WORD_SIZE - 1)
+        if R[last_word] & found_mask:
+            if last == NULL:
+                return i
+            if first == -1:
+                first = i
+            last[0] = i
+    return first
+
+
+cdef inline bint search_region(
+    ssize_t search_start,
+    ssize_t search_stop,
+    Py_ssize_t seq_length,
+    ssize_t *start,
+    ssize_t *stop):
+    """
+    Convert the search start and stop of an entry into an interval of a
+    sequence of the given length. Return False if the interval is empty.
+    """
+    if search_start < 0:
+        search_start = seq_length + search_start
+        if search_start < 0:
+            search_start = 0
+    elif search_start > seq_length:
+        return False
+    if search_stop < 0:
+        search_stop = seq_length + search_stop
+        if search_stop <= 0:  # No need to search
+            return False
+    elif search_stop == 0 or search_stop > seq_length:  # 0 means go to end of sequence.
+        search_stop = seq_length
+    start[0] = search_start
+    stop[0] = search_stop
+    return search_stop - search_start > 0
+
+
+ctypedef struct KmerSearchGroup:
+    ssize_t search_start
+    ssize_t search_stop  # 0 if going to end of sequence.
+    size_t number_of_words
+    size_t mask_offset  # Offset into search_masks
+    size_t word_offset  # Offset into init_masks, found_masks and owners
+
+
+cdef class MultipleKmerFinder:
+    """
+    Run the searches of multiple KmerFinder objects on a sequence at once.
+
+    The kmers of all KmerFinders that are searched in the same region of the
+    sequence are combined into a single (possibly multi-word) bitmask, so that
+    the region is scanned only once for all of them. Each found bit is mapped
+    back to the KmerFinder the kmer belongs to.
+
+    Use it like this:
+
+        finders = [KmerFinder(...), KmerFinder(...), ...]
+        multiple_kmer_finder = MultipleKmerFinder(finders)
+        for sequence in sequences:
+            for index in multiple_kmer_finder.candidates(sequence):
+                # finders[index].kmers_present(sequence) is True
+                pass
+    """
+    cdef:
+        KmerSearchGroup *search_groups
+        size_t number_of_groups
+        bitmask_t *search_masks
+        bitmask_t *init_masks
+        bitmask_t *found_masks
+        Py_ssize_t *owners
+        bitmask_t *state
+        bitmask_t *active_found_masks
+        char *is_candidate
+        Py_ssize_t number_of_finders
+        readonly list kmer_finders
+
+    def __cinit__(self, kmer_finders):
+        cdef:
+            size_t group_index, number_of_words, total_words = 0, max_words = 1
+            size_t total_masks = 0
+            size_t bit, mask_offset, word_offset, i
+            Py_ssize_t kmer_length
+            const char *kmer_ptr
+            KmerSearchGroup *group
+        self.search_groups = NULL
+        self.search_masks = NULL
+        self.init_masks = NULL
+        self.found_masks = NULL
+        self.owners = NULL
+        self.state = NULL
+        self.active_found_masks = NULL
+        self.is_candidate = NULL
+        self.kmer_finders = list(kmer_finders)
+        self.number_of_finders = len(self.kmer_finders)
+
+        # Collect the kmers of all finders per search region
+        regions = {}
+        for finder_index, kmer_finder in enumerate(self.kmer_finders):
+            if not isinstance(kmer_finder, KmerFinder):
+                raise TypeError("MultipleKmerFinder requires KmerFinder objects")
+            match_lookup = matches_lookup(kmer_finder.ref_wildcards, kmer_finder.query_wildcards)
+            for start, stop, kmers in kmer_finder.positions_and_kmers:
+                if stop is None:  # Encode 'end of sequence' as 0.
+                    stop = 0
+                for kmer in kmers:
+                    if not PyUnicode_CheckExact(kmer):
+                        raise TypeError(f"Kmer should be a string not {type(kmer)}")
+                    if not PyUnicode_IS_COMPACT_ASCII(kmer):
+                        raise ValueError("Only ASCII strings are supported")
+                    if kmer:
+                        regions.setdefault((start, stop), []).append(
+                            (kmer, finder_index, match_lookup))
+
+        self.number_of_groups = len(regions)
+        self.search_groups = <KmerSearchGroup *>PyMem_Malloc(
+            max(self.number_of_groups, 1) * sizeof(KmerSearchGroup))
+        if self.search_groups == NULL:
+            raise MemoryError()
+        group_index = 0
+        for (start, stop), entries in regions.items():
+            group = self.search_groups + group_index
+            total_length = sum(len(kmer) for kmer, _, _ in entries)
+            number_of_words = (total_length + MAX_WORD_SIZE - 1) // MAX_WORD_SIZE
+            group.search_start = start
+            group.search_stop = stop
+            group.number_of_words = number_of_words
+            group.mask_offset = total_masks
+            group.word_offset = total_words
+            total_masks += number_of_words * BITMASK_INDEX_SIZE
+            total_words += number_of_words
+            if number_of_words > max_words:
+                max_words = number_of_words
+            group_index += 1
+
+        self.search_masks = <bitmask_t *>PyMem_Malloc(max(total_masks, 1) * sizeof(bitmask_t))
+        self.init_masks = <bitmask_t *>PyMem_Malloc(max(total_words, 1) * sizeof(bitmask_t))
+        self.found_masks = <bitmask_t *>PyMem_Malloc(max(total_words, 1) * sizeof(bitmask_t))
+        self.owners = <Py_ssize_t *>PyMem_Malloc(
+            max(total_words, 1) * MAX_WORD_SIZE * sizeof(Py_ssize_t))
+        self.state = <bitmask_t *>PyMem_Malloc(max_words * sizeof(bitmask_t))
+        self.active_found_masks = <bitmask_t *>PyMem_Malloc(max_words * sizeof(bitmask_t))
+        self.is_candidate = <char *>PyMem_Malloc(max(self.number_of_finders, 1))
+        if (self.search_masks == NULL or self.init_masks == NULL or self.found_masks == NULL
+                or self.owners == NULL or self.state == NULL
+                or self.active_found_masks == NULL or self.is_candidate == NULL):
+            raise MemoryError()
+        memset(self.search_masks, 0, max(total_masks, 1) * sizeof(bitmask_t))
+        memset(self.init_masks, 0, max(total_words, 1) * sizeof(bitmask_t))
+        memset(self.found_masks, 0, max(total_words, 1) * sizeof(bitmask_t))
+
+        # The kmers of a group are concatenated. A kmer may extend into the next
+        # machine word as the state is shifted across word boundaries.
+        group_index = 0
+        for entries in regions.values():
+            group = self.search_groups + group_index
+            number_of_words = group.number_of_words
+            mask_offset = group.mask_offset
+            word_offset = group.word_offset
+            bit = 0
+            for kmer, finder_index, match_lookup in entries:
+                kmer_length = PyUnicode_GET_LENGTH(kmer)
+                kmer_ptr = <char *>PyUnicode_DATA(kmer)
+                self.init_masks[word_offset + bit // MAX_WORD_SIZE] |= (
+                    <bitmask_t>1ULL << (bit % MAX_WORD_SIZE))
+                for i in range(<size_t>kmer_length):
+                    set_masks(self.search_masks + mask_offset, bit + i, number_of_words,
+                              match_lookup[kmer_ptr[i]])
+                bit += kmer_length - 1
+                self.found_masks[word_offset + bit // MAX_WORD_SIZE] |= (
+                    <bitmask_t>1ULL << (bit % MAX_WORD_SIZE))
+                self.owners[word_offset * MAX_WORD_SIZE + bit] = finder_index
+                bit += 1
+            group_index += 1
+
+    def __reduce__(self):
+        return MultipleKmerFinder, (self.kmer_finders,)
+
+    def __len__(self):
+        return self.number_of_finders
+
+    def candidates(self, str sequence):
+        """
+        Return the indices (in increasing order) of the KmerFinders for which
+        kmers_present(sequence) is True
+        """
+        cdef:
+            size_t i
+            ssize_t start, stop
+            Py_ssize_t remaining = self.number_of_finders
+            Py_ssize_t index
+            KmerSearchGroup *group
+            KmerFinder kmer_finder
+            list result
+        if not PyUnicode_IS_COMPACT_ASCII(sequence):
+            raise ValueError("Only ASCII strings are supported")
+        cdef const char *seq = <char *>PyUnicode_DATA(sequence)
+        cdef Py_ssize_t seq_length = PyUnicode_GET_LENGTH(sequence)
+        memset(self.is_candidate, 0, self.number_of_finders)
+        for i in range(self.number_of_groups):
+            group = self.search_groups + i
+            if not search_region(group.search_start, group.search_stop, seq_length,
+                                 &start, &stop):
+                continue
+            remaining = self._search_group(group, seq + start, stop - start, remaining)
+            if remaining == 0:
+                break
+        result = []
+        for index in range(self.number_of_finders):
+            # Count the search as if each KmerFinder had been run on its own
+            kmer_finder = <KmerFinder>self.kmer_finders[index]
+            kmer_finder.searched += 1
+            if self.is_candidate[index]:
+                result.append(index)
+            else:
+                kmer_finder.rejected += 1
+        return result
+
+    cdef Py_ssize_t _search_group(
+        self,
+        const KmerSearchGroup *group,
+        const char *haystack,
+        size_t haystack_length,
+        Py_ssize_t remaining,
+    ):
+        """
+        Shift-and over all words of the group simultaneously. Mark the owners
+        of found kmers as candidates and return the number of finders that
+        are not candidates yet.
+        """
+        cdef:
+            size_t i, w, b
+            size_t number_of_words = group.number_of_words
+            const bitmask_t *needle_mask = self.search_masks + group.mask_offset
+            const bitmask_t *init_mask = self.init_masks + group.word_offset
+            const Py_ssize_t *owners = self.owners + group.word_offset * MAX_WORD_SIZE
+            const bitmask_t *char_mask
+            bitmask_t *R = self.state
+            bitmask_t *found_mask = self.active_found_masks
+            bitmask_t r, carry, hits, found
+            Py_ssize_t owner
+
+        memset(R, 0, number_of_words * sizeof(bitmask_t))
+        # Found bits are removed once reported so that each kmer is reported once
+        memcpy(found_mask, self.found_masks + group.word_offset,
+               number_of_words * sizeof(bitmask_t))
+        for i in range(haystack_length):
+            char_mask = needle_mask + <uint8_t>haystack[i] * number_of_words
+            carry = 0
+            hits = 0
+            for w in range(number_of_words):
+                r = R[w]
+                R[w] = ((r << 1) | carry | init_mask[w]) & char_mask[w]
+                carry = r >> (MAX_WORD_SIZE - 1)
+                hits |= R[w] & found_mask[w]
+            if not hits:
+                continue
+            for w in range(number_of_words):
+                found = R[w] & found_mask[w]
+                if not found:
+                    continue
+                found_mask[w] &= ~found
+                for b in range(MAX_WORD_SIZE):
+                    if not (found >> b) & 1:
+                        continue
+                    owner = owners[w * MAX_WORD_SIZE + b]
+                    if not self.is_candidate[owner]:
+                        self.is_candidate[owner] = 1
+                        remaining -= 1
+                        if remaining == 0:
+                            return 0
+        return remaining
+
+    def __dealloc__(self):
+        PyMem_Free(self.search_groups)
+        PyMem_Free(self.search_masks)
+        PyMem_Free(self.init_masks)
+        PyMem_Free(self.found_masks)
+        PyMem_Free(self.owners)
+        PyMem_Free(self.state)
+        PyMem_Free(self.active_found_masks)
+        PyMem_Free(self.is_candidate)
@@ -7,20 +7,30 @@ The ...Match classes trim the reads.
 import logging
 from enum import IntFlag
 from collections import defaultdict
-from typing import Optional, Tuple, Sequence, Dict, Any, List, Union
+from copy import deepcopy
+from functools import cached_property
+from typing import Optional, Tuple, Sequence, Dict, Any, List, Mapping, Union
 from abc import ABC, abstractmethod
 import time
 
-from ._kmer_finder import KmerFinder
+from ._kmer_finder import KmerFinder, MultipleKmerFinder
 from .align import (
     EndSkip,
     Aligner,
+    MultipleAligner,
     PrefixComparer,
     SuffixComparer,
     edit_environment,
     hamming_sphere,
 )
-from .kmer_heuristic import create_positions_and_kmers, kmer_probability_analysis
+from .kmer_heuristic import (
+    KmerModel,
+    KmerProbability,
+    create_positions_and_kmers,
+    kmer_probability_analysis,
+    reversed_kmer_probability,
+)
+from .sharedindex import SharedIndex
 
 logger = logging.getLogger()
 
@@ -132,10 +142,47 @@ class EndStatistics:
         return probabilities
 
 
+class SearchStatistics:
+    """
+    How often an adapter was searched for and how much work that took
+
+    This shows how well the k-mer heuristic works for the adapter: A read in
+    which none of the k-mers is found is rejected without being aligned.
+    """
+
+    def __init__(self):
+        # With --times or --revcomp, a read may be searched more than once
+        self.reads_searched = 0
+        self.prefilter_rejected = 0
+        self.alignments = 0
+        self.alignments_with_match = 0
+        self.dp_cells = 0
+
+    def __repr__(self):
+        return (
+            f"SearchStatistics(reads_searched={self.reads_searched}, "
+            f"prefilter_rejected={self.prefilter_rejected}, "
+            f"alignments={self.alignments}, "
+            f"alignments_with_match={self.alignments_with_match}, "
+            f"dp_cells={self.dp_cells})"
+        )
+
+    def __iadd__(self, other: Any):
+        if not isinstance(other, SearchStatistics):
+            raise ValueError("Cannot add")
+        self.reads_searched += other.reads_searched
+        self.prefilter_rejected += other.prefilter_rejected
+        self.alignments += other.alignments
+        self.alignments_with_match += other.alignments_with_match
+        self.dp_cells += other.dp_cells
+        return self
+
+
 class AdapterStatistics(ABC):
     reverse_complemented: int = 0
     name: str
     adapter: "Adapter"
+    search: SearchStatistics
 
     @abstractmethod
     def __iadd__(self, other):
@@ -149,6 +196,13 @@ class AdapterStatistics(ABC):
     def add_match(self, match) -> None:
         pass
 
+    def update_search_statistics(self) -> None:
+        """
+        Take over the current counts from the adapter
+        (see Adapter.search_statistics())
+        """
+        self.search = self.adapter.search_statistics()
+
 
 class SingleAdapterStatistics(AdapterStatistics, ABC):
     """
@@ -160,6 +214,7 @@ class SingleAdapterStatistics(AdapterStatistics, ABC):
         self.name = adapter.name
         self.adapter = adapter
         self.end = EndStatistics(adapter)
+        self.search = SearchStatistics()
 
     def __repr__(self):
         return f"SingleAdapterStatistics(name={self.name}, end={self.end})"
@@ -169,6 +224,7 @@ class SingleAdapterStatistics(AdapterStatistics, ABC):
             raise ValueError("Cannot iadd")
         self.end += other.end
         self.reverse_complemented += other.reverse_complemented
+        self.search += other.search
         return self
 
 
@@ -209,6 +265,7 @@ class LinkedAdapterStatistics(AdapterStatistics):
         self.front = EndStatistics(front)
         self.back = EndStatistics(back)
         self.reverse_complemented = 0
+        self.search = SearchStatistics()
 
     def __repr__(self):
         return f"LinkedAdapterStatistics(name={self.name}, front={self.front}, back={self.back})"
@@ -219,6 +276,7 @@ class LinkedAdapterStatistics(AdapterStatistics):
         self.front += other.front
         self.back += other.back
         self.reverse_complemented += other.reverse_complemented
+        self.search += other.search
         return self
 
     def add_match(self, match: "LinkedMatch"):
@@ -252,6 +310,7 @@ class AnywhereAdapterStatistics(AdapterStatistics):
         self.front = EndStatistics(adapter)
         self.back = EndStatistics(adapter)
         self.reverse_complemented = 0
+        self.search = SearchStatistics()
 
     def __repr__(self):
         return f"AnywhereAdapterStatistics(name={self.name}, front={self.front}, back={self.back})"
@@ -262,6 +321,7 @@ class AnywhereAdapterStatistics(AdapterStatistics):
         self.front += other.front
         self.back += other.back
         self.reverse_complemented += other.reverse_complemented
+        self.search += other.search
         return self
 
     def add_match(self, match: Union["RemoveBeforeMatch", "RemoveAfterMatch"]) -> None:
@@ -500,6 +560,19 @@ class Matchable(ABC):
     def match_to(self, sequence: str):
         pass
 
+    def match_many(self, sequences: List[str]) -> List[Optional[Match]]:
+        """
+        Match all given sequences. Return a list with the result of
+        match_to() for each sequence.
+        """
+        return [self.match_to(sequence) for sequence in sequences]
+
+    def set_kmer_model(self, kmer_model: Optional[KmerModel]) -> None:
+        """
+        Use the given model to choose the k-mers for the k-mer heuristic.
+        This has no influence on which matches are found.
+        """
+
 
 class Adapter(Matchable, ABC):
     description = "adapter with one component"  # this is overriden in subclasses
@@ -512,6 +585,13 @@ class Adapter(Matchable, ABC):
     def create_statistics(self) -> AdapterStatistics:
         pass
 
+    @abstractmethod
+    def search_statistics(self) -> SearchStatistics:
+        """
+        Return how often this adapter was searched for so far and how much
+        work that took
+        """
+
     @abstractmethod
     def descriptive_identifier(self) -> str:
         pass
@@ -548,10 +628,20 @@ class SingleAdapter(Adapter, ABC):
             unique number.
 
         indels: Whether indels are allowed in the alignment.
+
+        kmer_model: Model for the probability that a k-mer occurs in a read by
+            chance. It is used to choose k-mers for the k-mer heuristic that
+            rarely lead to unnecessary alignments.
     """
 
     allows_partial_matches: bool = True
 
+    # If this is not None, match_to() passes the read unchanged to the k-mer
+    # finder and to the aligner and creates an instance of this class from
+    # the alignment. This allows to match many reads or many adapters at once
+    # (see match_many() and MultipleAdapters).
+    match_class: Optional[type] = None
+
     def __init__(
         self,
         sequence: str,
@@ -561,6 +651,7 @@ class SingleAdapter(Adapter, ABC):
         adapter_wildcards: bool = True,
         name: Optional[str] = None,
         indels: bool = True,
+        kmer_model: Optional[KmerModel] = None,
     ):
         self.name: str = _generate_adapter_name() if name is None else name
         super().__init__(self.name)
@@ -586,22 +677,37 @@ class SingleAdapter(Adapter, ABC):
         ) <= set("ACGT")
         self.read_wildcards: bool = read_wildcards
         self.indels: bool = indels
-        self.aligner = self._aligner()
-        self.kmer_finder = self._kmer_finder()
+        self.kmer_model: Optional[KmerModel] = kmer_model
+
+    @cached_property
+    def aligner(self):
+        aligner = self._aligner()
+        if self._debug:
+            aligner.enable_debug()
+        return aligner
+
+    @cached_property
+    def kmer_finder(self):
+        return self._kmer_finder()
+
+    def __getstate__(self):
+        # Do not pickle the aligner and k-mer finder. They are re-created when
+        # they are first needed, which may be never (such as for adapters in an
+        # AdapterIndex).
+        state = self.__dict__.copy()
+        state.pop("aligner", None)
+        state.pop("kmer_finder", None)
+        return state
 
     def _make_aligner(self, sequence: str, flags: int) -> Aligner:
-        # TODO
-        # Indels are suppressed by setting their cost very high, but a different algorithm
-        # should be used instead.
-        indel_cost = 1 if self.indels else 100000
         return Aligner(
             sequence,
             self.max_error_rate,
             flags=flags,
             wildcard_ref=self.adapter_wildcards,
             wildcard_query=self.read_wildcards,
-            indel_cost=indel_cost,
             min_overlap=self.min_overlap,
+            indels=self.indels,
         )
 
     def _make_kmer_finder(
@@ -610,7 +716,16 @@ class SingleAdapter(Adapter, ABC):
         back_adapter: bool,
         front_adapter: bool,
         internal: bool = True,
-    ) -> Union[KmerFinder, MockKmerFinder]:
+        reverse: bool = False,
+    ) -> KmerFinder:
+        """
+        reverse must be True if the k-mer finder is used on reversed reads
+        """
+        kmer_probability: Optional[KmerProbability] = None
+        if self.kmer_model is not None:
+            kmer_probability = self.kmer_model.probability
+        if reverse:
+            kmer_probability = reversed_kmer_probability(kmer_probability)
         positions_and_kmers = create_positions_and_kmers(
             sequence,
             self.min_overlap,
@@ -618,16 +733,13 @@ class SingleAdapter(Adapter, ABC):
             back_adapter,
             front_adapter,
             internal,
+            kmer_probability,
         )
         if self._debug:
-            print(kmer_probability_analysis(positions_and_kmers))
-        try:
-            return KmerFinder(
-                positions_and_kmers, self.adapter_wildcards, self.read_wildcards
-            )
-        except ValueError:
-            # Kmers too long.
-            return MockKmerFinder()
+            print(kmer_probability_analysis(positions_and_kmers, 150, kmer_probability))
+        return KmerFinder(
+            positions_and_kmers, self.adapter_wildcards, self.read_wildcards
+        )
 
     def __repr__(self):
         return (
@@ -650,6 +762,28 @@ class SingleAdapter(Adapter, ABC):
         self._debug = True
         self.aligner.enable_debug()
 
+    def set_kmer_model(self, kmer_model: Optional[KmerModel]) -> None:
+        self.kmer_model = kmer_model
+        # Re-create the k-mer finder when it is needed next time
+        self.__dict__.pop("kmer_finder", None)
+
+    def search_statistics(self) -> SearchStatistics:
+        statistics = SearchStatistics()
+        # The aligner and k-mer finder do not exist if they were never used
+        aligner = self.__dict__.get("aligner")
+        kmer_finder = self.__dict__.get("kmer_finder")
+        if aligner is not None:
+            statistics.alignments = aligner.alignments
+            statistics.alignments_with_match = aligner.matches
+            statistics.dp_cells = aligner.dp_cells
+        if isinstance(kmer_finder, KmerFinder):
+            statistics.reads_searched = kmer_finder.searched
+            statistics.prefilter_rejected = kmer_finder.rejected
+        else:
+            # Without k-mer heuristic, each read is aligned
+            statistics.reads_searched = statistics.alignments
+        return statistics
+
     @abstractmethod
     def _aligner(self):
         pass
@@ -668,6 +802,27 @@ class SingleAdapter(Adapter, ABC):
         overlap length, maximum error rate).
         """
 
+    def match_many(self, sequences: List[str]) -> List[Optional[Match]]:
+        """
+        Match all given sequences. If possible, all candidate reads are
+        aligned in a single call to Aligner.locate_many().
+        """
+        aligner = self.aligner
+        if self.match_class is None or self._debug or not isinstance(aligner, Aligner):
+            return super().match_many(sequences)
+        kmers_present = self.kmer_finder.kmers_present
+        candidates = [
+            i for i, sequence in enumerate(sequences) if kmers_present(sequence)
+        ]
+        hits = aligner.locate_many([sequences[i] for i in candidates])
+        matches: List[Optional[Match]] = [None] * len(sequences)
+        for k in range(0, len(hits), 7):
+            i = candidates[hits[k]]
+            matches[i] = self.match_class(
+                *hits[k + 1 : k + 7], adapter=self, sequence=sequences[i]
+            )
+        return matches
+
     def __len__(self) -> int:
         return len(self.sequence)
 
@@ -676,6 +831,7 @@ class FrontAdapter(SingleAdapter):
     """A 5' adapter"""
 
     description = "regular 5'"
+    match_class: Optional[type] = RemoveBeforeMatch
 
     def __init__(self, *args, **kwargs):
         self._force_anywhere = kwargs.pop("force_anywhere", False)
@@ -703,10 +859,11 @@ class FrontAdapter(SingleAdapter):
         return None if no match was found given the matching criteria (minimum
         overlap length, maximum error rate).
         """
-        if not self.kmer_finder.kmers_present(sequence):
+        hits = self.kmer_finder.hit_positions(sequence)
+        if hits is None:
             return None
         alignment: Optional[Tuple[int, int, int, int, int, int]] = self.aligner.locate(
-            sequence
+            sequence, hits
         )
         if self._debug:
             print(self.aligner.dpmatrix)
@@ -725,6 +882,8 @@ class RightmostFrontAdapter(FrontAdapter):
     """A 5' adapter that prefers rightmost matches"""
 
     description = "rightmost 5'"
+    # The read is reversed before it is aligned
+    match_class = None
 
     # def __init__(self, *args, **kwargs):
     #     self._force_anywhere = kwargs.pop("force_anywhere", False)
@@ -742,7 +901,10 @@ class RightmostFrontAdapter(FrontAdapter):
 
     def _kmer_finder(self):
         kmer_finder = self._make_kmer_finder(
-            self.sequence[::-1], back_adapter=True, front_adapter=self._force_anywhere
+            self.sequence[::-1],
+            back_adapter=True,
+            front_adapter=self._force_anywhere,
+            reverse=True,
         )
         return kmer_finder
 
@@ -755,10 +917,11 @@ class RightmostFrontAdapter(FrontAdapter):
         overlap length, maximum error rate).
         """
         reversed_sequence = sequence[::-1]
-        if not self.kmer_finder.kmers_present(reversed_sequence):
+        hits = self.kmer_finder.hit_positions(reversed_sequence)
+        if hits is None:
             return None
         alignment: Optional[Tuple[int, int, int, int, int, int]] = self.aligner.locate(
-            reversed_sequence
+            reversed_sequence, hits
         )
         if self._debug:
             print(self.aligner.dpmatrix)
@@ -784,6 +947,7 @@ class BackAdapter(SingleAdapter):
     """A 3' adapter"""
 
     description = "regular 3'"
+    match_class: Optional[type] = RemoveAfterMatch
 
     def __init__(self, *args, **kwargs):
         self._force_anywhere = kwargs.pop("force_anywhere", False)
@@ -811,10 +975,11 @@ class BackAdapter(SingleAdapter):
         return None if no match was found given the matching criteria (minimum
         overlap length, maximum error rate).
         """
-        if not self.kmer_finder.kmers_present(sequence):
+        hits = self.kmer_finder.hit_positions(sequence)
+        if hits is None:
             return None
         alignment: Optional[Tuple[int, int, int, int, int, int]] = self.aligner.locate(
-            sequence
+            sequence, hits
         )
         if self._debug:
             print(self.aligner.dpmatrix)  # pragma: no cover
@@ -1148,6 +1313,18 @@ class LinkedAdapter(Adapter):
         self.front_adapter.enable_debug()
         self.back_adapter.enable_debug()
 
+    def set_kmer_model(self, kmer_model: Optional[KmerModel]) -> None:
+        self.front_adapter.set_kmer_model(kmer_model)
+        self.back_adapter.set_kmer_model(kmer_model)
+
+    def search_statistics(self) -> SearchStatistics:
+        """
+        Return the sum of the counts of the two component adapters
+        """
+        statistics = self.front_adapter.search_statistics()
+        statistics += self.back_adapter.search_statistics()
+        return statistics
+
     def match_to(self, sequence: str) -> Optional[LinkedMatch]:
         """
         Match the two linked adapters against a string
@@ -1191,6 +1368,19 @@ class MultipleAdapters(Matchable):
     def enable_debug(self):
         for a in self._adapters:
             a.enable_debug()
+        # Debugging requires that each adapter is matched individually
+        self.__dict__.pop("_matchers", None)
+
+    def set_kmer_model(self, kmer_model: Optional[KmerModel]) -> None:
+        for a in self._adapters:
+            a.set_kmer_model(kmer_model)
+        # The adapter groups use the k-mer finders of the adapters
+        self.__dict__.pop("_matchers", None)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_matchers", None)
+        return state
 
     def __getitem__(self, item):
         return self._adapters[item]
@@ -1198,6 +1388,27 @@ class MultipleAdapters(Matchable):
     def __len__(self):
         return len(self._adapters)
 
+    @cached_property
+    def _matchers(self) -> List[Matchable]:
+        """
+        The adapters, but with runs of consecutive adapters that can be
+        aligned together replaced by an _AdapterGroup
+        """
+        matchers: List[Matchable] = []
+        run: List[SingleAdapter] = []
+        for adapter in list(self._adapters) + [None]:
+            if _AdapterGroup.is_acceptable(adapter):
+                run.append(adapter)  # type: ignore
+                continue
+            if len(run) > 1:
+                matchers.append(_AdapterGroup(run))
+            else:
+                matchers.extend(run)
+            run = []
+            if adapter is not None:
+                matchers.append(adapter)
+        return matchers
+
     def match_to(self, sequence: str) -> Optional[SingleMatch]:
         """
         Find the adapter that best matches the sequence.
@@ -1205,7 +1416,7 @@ class MultipleAdapters(Matchable):
         Return either a Match instance or None if there are no matches.
         """
         best_match = None
-        for adapter in self._adapters:
+        for adapter in self._matchers:
             match = adapter.match_to(sequence)
             if match is None:
                 continue
@@ -1221,6 +1432,66 @@ class MultipleAdapters(Matchable):
                 best_match = match
         return best_match
 
+    def match_many(self, sequences: List[str]) -> List[Optional[Match]]:
+        """
+        Find the best-matching adapter for each of the sequences (as with
+        match_to()), processing one adapter at a time.
+        """
+        best_matches: List[Any] = [None] * len(sequences)
+        match: Any
+        for adapter in self._matchers:
+            for i, match in enumerate(adapter.match_many(sequences)):
+                if match is None:
+                    continue
+                best_match = best_matches[i]
+                if (
+                    best_match is None
+                    or match.score > best_match.score
+                    or (
+                        match.score == best_match.score
+                        and match.errors < best_match.errors
+                    )
+                ):
+                    best_matches[i] = match
+        return best_matches
+
+
+class _AdapterGroup(Matchable):
+    """
+    Adapters that are aligned to a read in a single call to MultipleAligner.locate()
+
+    This finds the same match as MultipleAdapters.match_to() on the same adapters
+    would, but a Match object is created only for the best-matching adapter.
+    The k-mer heuristic is run for all adapters in a single pass over the read,
+    and only the adapters that pass it are aligned.
+    """
+
+    def __init__(self, adapters: Sequence[SingleAdapter]):
+        super().__init__(name="adapter_group")
+        self._adapters = adapters
+        self._aligner = MultipleAligner([adapter.aligner for adapter in adapters])
+        self._kmer_finder = MultipleKmerFinder(
+            [adapter.kmer_finder for adapter in adapters]
+        )
+
+    @staticmethod
+    def is_acceptable(adapter) -> bool:
+        return (
+            isinstance(adapter, SingleAdapter)
+            and adapter.match_class is not None
+            and not adapter._debug
+            and isinstance(adapter.aligner, Aligner)
+            and isinstance(adapter.kmer_finder, KmerFinder)
+        )
+
+    def match_to(self, sequence: str):
+        result = self._aligner.locate(sequence, self._kmer_finder.candidates(sequence))
+        if result is None:
+            return None
+        adapter = self._adapters[result[0]]
+        assert adapter.match_class is not None
+        return adapter.match_class(*result[1:], adapter=adapter, sequence=sequence)
+
 
 class AdapterIndex:
     """
@@ -1237,7 +1508,13 @@ class AdapterIndex:
     Use the is_acceptable() method to check individual adapters.
     """
 
-    AdapterIndexDict = Dict[str, Tuple[SingleAdapter, int, int]]
+    # Map a string to the position of the adapter in the adapter list, the
+    # number of errors and the number of matches
+    AdapterIndexDict = Dict[str, Tuple[int, int, int]]
+
+    # When an index with at least this many strings is pickled (to be sent to
+    # worker processes), it is converted to a SharedIndex
+    shared_index_min_size = 100_000
 
     def __init__(self, adapters, prefix: bool):
         """All given adapters must be of the same type"""
@@ -1246,6 +1523,7 @@ class AdapterIndex:
         for adapter in adapters:
             self._accept(adapter, prefix)
         self._adapters = adapters
+        self._index: Mapping[str, Tuple[int, int, int]]
         self._lengths, self._index = self._make_index()
         logger.debug(
             "String lengths in the index: %s", sorted(self._lengths, reverse=True)
@@ -1265,6 +1543,24 @@ class AdapterIndex:
     def __repr__(self):
         return f"{self.__class__.__name__}(adapters={self._adapters!r})"
 
+    def __getstate__(self):
+        if (
+            isinstance(self._index, dict)
+            and len(self._index) >= self.shared_index_min_size
+        ):
+            # Worker processes map the same file instead of each unpickling
+            # their own copy of the index
+            self._index = SharedIndex.create(self._index)
+        return self.__dict__.copy()
+
+    def __deepcopy__(self, memo):
+        # The index is never modified and can be shared
+        new = object.__new__(self.__class__)
+        memo[id(self)] = new
+        for key, value in self.__dict__.items():
+            new.__dict__[key] = value if key == "_index" else deepcopy(value, memo)
+        return new
+
     @staticmethod
     def _make_suffix(s, n):
         return s[-n:]
@@ -1331,23 +1627,25 @@ class AdapterIndex:
     def _make_index(self) -> Tuple[List[int], "AdapterIndexDict"]:
         start_time = time.time()
         logger.info("Building index of %s adapters ...", len(self._adapters))
-        index: Dict[str, Tuple[SingleAdapter, int, int]] = dict()
+        index: AdapterIndex.AdapterIndexDict = dict()
         lengths = set()
         has_warned = False
-        for adapter in self._adapters:
+        for i, adapter in enumerate(self._adapters):
             sequence = adapter.sequence
             k = int(adapter.max_error_rate * len(sequence))
 
             if adapter.indels:
                 for s, errors, matches in edit_environment(sequence, k):
                     if s in index:
-                        other_adapter, other_errors, other_matches = index[s]
+                        other_i, other_errors, other_matches = index[s]
                         if matches < other_matches:
                             continue
                         if other_matches == matches and not has_warned:
-                            self._warn_similar(adapter, other_adapter, k, s, matches)
+                            self._warn_similar(
+                                adapter, self._adapters[other_i], k, s, matches
+                            )
                             has_warned = True
-                    index[s] = (adapter, errors, matches)
+                    index[s] = (i, errors, matches)
                     lengths.add(len(s))
             else:
                 n = len(sequence)
@@ -1355,15 +1653,15 @@ class AdapterIndex:
                     for s in hamming_sphere(sequence, errors):
                         matches = n - errors
                         if s in index:
-                            other_adapter, other_errors, other_matches = index[s]
+                            other_i, other_errors, other_matches = index[s]
                             if matches < other_matches:
                                 continue
                             if other_matches == matches and not has_warned:
                                 self._warn_similar(
-                                    adapter, other_adapter, k, s, matches
+                                    adapter, self._adapters[other_i], k, s, matches
                                 )
                                 has_warned = True
-                        index[s] = (adapter, errors, matches)
+                        index[s] = (i, errors, matches)
                 lengths.add(n)
         elapsed = time.time() - start_time
         logger.info(
@@ -1400,9 +1698,10 @@ class AdapterIndex:
             adapter, e, m = result
         else:
             try:
-                adapter, e, m = self._index[affix]
+                i, e, m = self._index[affix]
             except KeyError:
                 return None
+            adapter = self._adapters[i]
         return self._make_match(adapter, self._length, m, e, sequence)
 
     def _match_to_multiple_lengths(self, sequence: str):
@@ -1431,9 +1730,10 @@ class AdapterIndex:
                 adapter, e, m = result
             else:
                 try:
-                    adapter, e, m = self._index[affix]
+                    i, e, m = self._index[affix]
                 except KeyError:
                     continue
+                adapter = self._adapters[i]
 
             if m > best_m or (m == best_m and e < best_e):
                 # TODO this could be made to work:
@@ -1460,7 +1760,7 @@ class AdapterIndex:
         # The looked up number of matches and errors is too low if
         # the adapter actually has an A where the N is in the query.
         # Fix this by re-doing the alignment.
-        adapter = result[0]
+        adapter = self._adapters[result[0]]
         match = adapter.match_to(affix)
         if match is None:
             return None
@@ -1,6 +1,7 @@
 __all__ = [
     "EndSkip",
     "Aligner",
+    "MultipleAligner",
     "PrefixComparer",
     "SuffixComparer",
     "hamming_sphere",
@@ -14,6 +15,7 @@ from typing import Iterator, Tuple
 
 from cutadapt._align import (
     Aligner,
+    MultipleAligner,
     PrefixComparer,
     SuffixComparer,
     hamming_sphere,
@@ -53,6 +53,8 @@ Run "cutadapt --help" to see all command-line options.
 See https://cutadapt.readthedocs.io/ for full documentation.
 """
 import copy
+import functools
+import os
 import sys
 import time
 import shutil
@@ -60,8 +62,20 @@ import logging
 import platform
 import itertools
 import multiprocessing
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Tuple, Optional, Sequence, List, Any, Iterator, Union, Dict, Iterable
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 from argparse import ArgumentParser, SUPPRESS, HelpFormatter
 
 import dnaio
@@ -70,6 +84,7 @@ import xopen as xopen
 from cutadapt import __version__
 from cutadapt.adapters import warn_duplicate_adapters, Adapter, InvalidCharacter
 from cutadapt.json import OneLine, dumps as json_dumps
+from cutadapt.kmer_heuristic import KmerModel
 from cutadapt.parser import make_adapters_from_specifications
 from cutadapt.modifiers import (
     SingleEndModifier,
@@ -94,7 +109,7 @@ from cutadapt.modifiers import (
 )
 from cutadapt.report import full_report, minimal_report, Statistics
 from cutadapt.pipeline import SingleEndPipeline, PairedEndPipeline
-from cutadapt.runners import Pipeline, run_pipeline
+from cutadapt.runners import Pipeline, WorkerPool, run_pipeline
 from cutadapt.files import InputPaths, OutputFiles, FileOpener, OutputPaths
 from cutadapt.utils import available_cpu_count, Progress, DummyProgress
 from cutadapt.log import setup_logging, REPORT
@@ -155,13 +170,34 @@ def get_argument_parser() -> ArgumentParser:
     group.add_argument("--profile", action="store_true", default=False, help=SUPPRESS)
     group.add_argument("-j", "--cores", type=int, default=1,
         help='Number of CPU cores to use. Use 0 to auto-detect. Default: %(default)s')
+    group.add_argument("--max-reads", type=int, default=None, metavar="N",
+        help="Process only the first N reads (or read pairs) and ignore the rest "
+            "of the input.")
+    group.add_argument("--sample", type=float, default=None, metavar="FRACTION",
+        help="Only compute statistics for a pseudo-random subset of about FRACTION "
+            "of the reads (between 0 and 1). No reads are written.")
+    group.add_argument("--batch", metavar="MANIFEST", default=None,
+        help="Process multiple samples with the same options. MANIFEST is a "
+            "tab-separated file that lists input and output files for each "
+            "sample. See documentation.")
+    group.add_argument("--server", metavar="SOCKET", default=None,
+        help="Run in server mode: Instead of processing input files, wait for jobs "
+            "sent to the Unix socket SOCKET. See documentation.")
 
     # Hidden options
     # GC content as a percentage
     group.add_argument("--gc-content", type=float, default=50,
         help=SUPPRESS)
-    # Buffer size for the reader process when running in parallel
-    group.add_argument("--buffer-size", type=int, default=4000000,
+    # Maximum and minimum size of the chunks that the reader process sends to
+    # the workers when running in parallel. The chunk size is adjusted between
+    # these bounds while running.
+    group.add_argument("--buffer-size", type=int, default=None,
+        help=SUPPRESS)
+    group.add_argument("--min-buffer-size", type=int, default=None,
+        help=SUPPRESS)
+    # Maximum size of the processed chunks the main process keeps in memory while
+    # waiting for an earlier chunk when running in parallel
+    group.add_argument("--max-buffered-bytes", type=int, default=1024**3,
         help=SUPPRESS)
     # Compression level for gzipped output files. Not exposed since we have -Z
     group.add_argument("--compression-level", type=int, default=5,
@@ -313,6 +349,13 @@ def get_argument_parser() -> ArgumentParser:
         help="Which type of report to print: 'full' or 'minimal'. Default: full")
     group.add_argument("--json", metavar="FILE",
         help="Dump report in JSON format to FILE")
+    group.add_argument("--json-snapshot", metavar="FILE", default=None,
+        help="While running on multiple cores, regularly write the statistics "
+            "collected so far in JSON format to FILE. It is replaced atomically.")
+    group.add_argument("--json-snapshot-interval", metavar="SECONDS", type=float,
+        default=60,
+        help="Minimum time between updates of the --json-snapshot file. "
+            "Default: %(default)s")
     group.add_argument("-o", "--output", metavar="FILE",
         help="Write trimmed reads to FILE. FASTQ or FASTA format is chosen "
             "depending on input. Summary report is sent to standard output. "
@@ -322,6 +365,9 @@ def get_argument_parser() -> ArgumentParser:
         help="Output FASTA to standard output even on FASTQ input.")
     group.add_argument("-Z", action="store_const", const=1, dest="compression_level",
         help="Use compression level 1 for gzipped output files (faster, but uses more space)")
+    group.add_argument("--unordered", default=False, action="store_true",
+        help="When using multiple cores, write reads in the order in which they "
+            "are processed instead of the input order. Paired reads stay in sync.")
     group.add_argument("--info-file", metavar="FILE",
         help="Write information about each read and its adapter matches into FILE. "
             "See the documentation for the file format.")
@@ -755,6 +801,9 @@ def make_input_paths(
 
 
 def check_arguments(args, paired: bool) -> None:
+    if args.max_reads is not None and args.max_reads < 0:
+        raise CommandLineError("Value for --max-reads cannot be negative")
+
     if not paired:
         if args.untrimmed_paired_output:
             raise CommandLineError(
@@ -934,6 +983,7 @@ def adapters_from_args(args) -> Tuple[List[Adapter], List[Adapter]]:
         read_wildcards=args.match_read_wildcards,
         adapter_wildcards=args.match_adapter_wildcards,
         indels=args.indels,
+        kmer_model=KmerModel(gc_content=args.gc_content / 100),
     )
     try:
         adapters = make_adapters_from_specifications(args.adapters, search_parameters)
@@ -1074,6 +1124,374 @@ def log_header(cmdlineargs):
     logger.info("Command line parameters: %s", " ".join(cmdlineargs))
 
 
+def make_pipeline(
+    args, paired: bool
+) -> Tuple[Pipeline, List[Optional[str]], List[Optional[str]]]:
+    """
+    Set up the pipeline for the parsed command-line arguments and return it
+    together with the names of the adapters for R1 and R2.
+    """
+    adapters, adapters2 = adapters_from_args(args)
+    log_adapters(adapters, adapters2 if paired else None)
+
+    pipeline = PipelineMaker(args, paired, adapters, adapters2).make()
+    adapter_names: List[Optional[str]] = [a.name for a in adapters]
+    adapter_names2: List[Optional[str]] = [a.name for a in adapters2]
+    return pipeline, adapter_names, adapter_names2
+
+
+# Options (their dest attributes) that specify the path to a file that is written
+FILE_OPTIONS = (
+    "output",
+    "paired_output",
+    "untrimmed_output",
+    "untrimmed_paired_output",
+    "too_short_output",
+    "too_short_paired_output",
+    "too_long_output",
+    "too_long_paired_output",
+    "info_file",
+    "rest_file",
+    "wildcard_file",
+    "json",
+    "json_snapshot",
+)
+
+
+class PipelineCache:
+    """
+    Keep pipelines around so that they need not be set up again when further inputs
+    are processed with the same options
+
+    Setting up a pipeline can take long when many adapters are used because the
+    adapter indexes need to be built. Pipelines keep state (such as statistics), so
+    get() returns a copy of the cached pipeline. The copy contains copies of the
+    adapter indexes, but the aligners and k-mer finders of the adapters are
+    re-created (which is fast).
+
+    Adapters that are read from a file (``-a file:...``) are not re-read when the
+    file changes.
+    """
+
+    # For these options, only whether they are set influences the pipeline
+    path_options = ("inputs",) + FILE_OPTIONS
+
+    def __init__(self, max_size: int = 16):
+        self._max_size = max_size
+        self._pipelines: Dict[str, Any] = {}
+
+    def _key(self, args, paired: bool) -> str:
+        # Adapter file paths (-a file:...) may be relative
+        return repr(
+            (
+                os.getcwd(),
+                paired,
+                sorted(
+                    (name, bool(value) if name in self.path_options else value)
+                    for name, value in vars(args).items()
+                ),
+            )
+        )
+
+    def get(
+        self, args, paired: bool
+    ) -> Tuple[Pipeline, List[Optional[str]], List[Optional[str]]]:
+        """
+        Return a pipeline for the parsed command-line arguments and the names of the
+        adapters for R1 and R2 (like make_pipeline())
+        """
+        key = self._key(args, paired)
+        if key in self._pipelines:
+            logger.debug("Re-using previously set up pipeline")
+            # Move to the end to mark it as most recently used
+            cached = self._pipelines.pop(key)
+        else:
+            cached = make_pipeline(args, paired)
+            if len(self._pipelines) >= self._max_size:
+                del self._pipelines[next(iter(self._pipelines))]
+        self._pipelines[key] = cached
+        return copy.deepcopy(cached)
+
+
+def run_cutadapt(
+    args,
+    cores: int,
+    progress: Union[Progress, DummyProgress],
+    default_outfile,
+    pool: Optional[WorkerPool] = None,
+    pipeline_cache: Optional[PipelineCache] = None,
+    cmdlineargs: Sequence[str] = (),
+) -> Tuple[Statistics, InputPaths, bool]:
+    """
+    Process the input files according to the parsed command-line arguments
+
+    If pool is given, its worker processes are used (see run_pipeline()). If
+    pipeline_cache is given, the pipeline is taken from it. cmdlineargs are only
+    used for the --json-snapshot file.
+
+    Return the statistics, the paths to the input files and whether the input
+    was paired.
+    """
+    file_opener = FileOpener(
+        compression_level=args.compression_level,
+        threads=estimate_compression_threads(cores),
+        compress_in_workers=cores > 1,
+    )
+    if args.sample is not None:
+        args = sampling_args(args)
+    paired = determine_paired(args)
+    is_interleaved_input = args.interleaved and len(args.inputs) == 1
+    input_paths = make_input_paths(args.inputs, paired, is_interleaved_input)
+    check_arguments(args, paired)
+    if pipeline_cache is not None:
+        pipeline, adapter_names, adapter_names2 = pipeline_cache.get(args, paired)
+    else:
+        pipeline, adapter_names, adapter_names2 = make_pipeline(args, paired)
+    outfiles = open_output_files(
+        args, default_outfile, file_opener, adapter_names, adapter_names2
+    )
+    logger.info(
+        "Processing %s reads on %d core%s ...",
+        {False: "single-end", True: "paired-end"}[pipeline.paired],
+        cores,
+        "s" if cores > 1 else "",
+    )
+    stats_callback: Optional[Callable[[Statistics], None]] = None
+    if args.json_snapshot is not None:
+        stats_callback = functools.partial(
+            write_json_report,
+            args.json_snapshot,
+            cmdlineargs=list(cmdlineargs),
+            input_paths=input_paths,
+            cores=cores,
+            paired=paired,
+            gc_content=args.gc_content / 100.0,
+        )
+
+    try:
+        stats = run_pipeline(
+            pipeline,
+            input_paths,
+            outfiles,
+            cores,
+            progress,
+            args.buffer_size,
+            args.min_buffer_size,
+            ordered=not args.unordered,
+            max_buffered_bytes=args.max_buffered_bytes,
+            pool=pool,
+            stats_callback=stats_callback,
+            stats_interval=args.json_snapshot_interval,
+            max_reads=args.max_reads,
+            sample_fraction=args.sample,
+        )
+    except BaseException:
+        # The runner closes the output files only if it could be created
+        outfiles.close()
+        raise
+    if stats_callback is not None:
+        stats_callback(stats)
+    return stats, input_paths, paired
+
+
+def sampling_args(args):
+    """
+    Check the arguments for --sample and return a copy in which the reads are
+    written to /dev/null
+    """
+    if not 0 < args.sample <= 1:
+        raise CommandLineError("The --sample fraction must be between 0 and 1")
+    for name in FILE_OPTIONS:
+        if name not in ("json", "json_snapshot") and getattr(args, name) is not None:
+            option = "--" + name.replace("_", "-")
+            raise CommandLineError(
+                f"Option {option} cannot be used with --sample because no reads "
+                "are written"
+            )
+    args = copy.copy(args)
+    args.output = os.devnull
+    if len(args.inputs) == 2:
+        args.paired_output = os.devnull
+    logger.info(
+        "Processing only a sample of about %.3g%% of the reads", 100 * args.sample
+    )
+    return args
+
+
+def make_progress(args) -> Union[Progress, DummyProgress]:
+    if sys.stderr.isatty() and not args.quiet and not args.debug:
+        return Progress()
+    else:
+        return DummyProgress()
+
+
+def report_results(
+    args,
+    cmdlineargs: List[str],
+    stats: Statistics,
+    elapsed: float,
+    input_paths: InputPaths,
+    cores: int,
+    paired: bool,
+) -> None:
+    """Log the report and write it in JSON format if requested"""
+    if args.report == "minimal":
+        report = minimal_report
+    else:
+        report = full_report
+    logger.log(REPORT, "%s", report(stats, elapsed, args.gc_content / 100.0))
+    if args.debug:
+        log_search_statistics(stats)
+    if args.json is not None:
+        write_json_report(
+            args.json,
+            stats,
+            cmdlineargs,
+            input_paths,
+            cores,
+            paired,
+            args.gc_content / 100.0,
+        )
+
+
+def write_json_report(
+    path: str,
+    stats: Statistics,
+    cmdlineargs: List[str],
+    input_paths: InputPaths,
+    cores: int,
+    paired: bool,
+    gc_content: float,
+) -> None:
+    """
+    Write the report in JSON format to path. The file is first written under a
+    temporary name and then renamed, so that readers never see a partial file.
+    """
+    json_dict = json_report(
+        stats=stats,
+        cmdlineargs=cmdlineargs,
+        path1=input_paths.paths[0],
+        path2=input_paths.paths[1] if len(input_paths.paths) > 1 else None,
+        cores=cores,
+        paired=paired,
+        gc_content=gc_content,
+    )
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json_dumps(json_dict))
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def read_batch_manifest(path: str) -> List[Dict[str, str]]:
+    """
+    Read a batch manifest and return one dict per sample that maps option names
+    (attributes of the parsed arguments) to paths.
+
+    The manifest is a tab-separated file. The first line is a header that names the
+    columns: input1, input2 (optional) and the long names of any of the options that
+    specify an output file (such as output, paired-output and json).
+    """
+    allowed = {name.replace("_", "-"): name for name in FILE_OPTIONS}
+    allowed["input1"] = "input1"
+    allowed["input2"] = "input2"
+    with open(path) as f:
+        lines = [line.rstrip("\r\n") for line in f if line.strip()]
+    if not lines:
+        raise CommandLineError(f"Batch manifest '{path}' is empty")
+    header = lines[0].split("\t")
+    for column in header:
+        if column not in allowed:
+            raise CommandLineError(
+                f"Unknown column '{column}' in batch manifest '{path}'. "
+                "Allowed are: " + ", ".join(sorted(allowed))
+            )
+    if "input1" not in header or "output" not in header:
+        raise CommandLineError(
+            f"Batch manifest '{path}' needs at least the columns input1 and output"
+        )
+    if len(set(header)) != len(header):
+        raise CommandLineError(f"Duplicate column in batch manifest '{path}'")
+    samples = []
+    for line_number, line in enumerate(lines[1:], start=2):
+        fields = line.split("\t")
+        if len(fields) != len(header) or not all(fields):
+            raise CommandLineError(
+                f"Line {line_number} in batch manifest '{path}' must have "
+                f"{len(header)} non-empty fields"
+            )
+        samples.append(
+            {allowed[column]: field for column, field in zip(header, fields)}
+        )
+    return samples
+
+
+def run_batch(
+    args, cmdlineargs: List[str], cores: int, start_time: float
+) -> Statistics:
+    """
+    Process all samples listed in the batch manifest (args.batch) with the same
+    options and return the statistics summed over all samples
+
+    The pipeline is set up only once and, when multiple cores are used, the same
+    worker processes are used for all samples. A report is logged for each
+    sample (and written to the file in the json column if there is one).
+    """
+    samples = read_batch_manifest(args.batch)
+    for name in FILE_OPTIONS:
+        if getattr(args, name) is not None:
+            option = "--" + name.replace("_", "-")
+            raise CommandLineError(
+                f"Option {option} cannot be used together with --batch. "
+                "Add a column to the batch manifest instead."
+            )
+    n_input_files = 2 if samples and "input2" in samples[0] else 1
+    pipeline_cache = PipelineCache()
+    total_stats = Statistics()
+    with ExitStack() as stack:
+        pool = None
+        if cores > 1:
+            # Start the workers before any output files are opened. They would
+            # otherwise inherit the file descriptors.
+            pool = stack.enter_context(
+                WorkerPool(cores, args.buffer_size, n_input_files)
+            )
+        for i, sample in enumerate(samples, start=1):
+            sample_start_time = time.time()
+            sample_args = copy.copy(args)
+            sample_args.inputs = [sample.pop("input1")]
+            if "input2" in sample:
+                sample_args.inputs.append(sample.pop("input2"))
+            for name, path in sample.items():
+                setattr(sample_args, name, path)
+            logger.info(
+                "Sample %d of %d: %s", i, len(samples), " ".join(sample_args.inputs)
+            )
+            stats, input_paths, paired = run_cutadapt(
+                sample_args,
+                cores,
+                make_progress(args),
+                None,
+                pool=pool,
+                pipeline_cache=pipeline_cache,
+                cmdlineargs=cmdlineargs,
+            )
+            report_results(
+                sample_args,
+                cmdlineargs,
+                stats,
+                time.time() - sample_start_time,
+                input_paths,
+                cores,
+                paired,
+            )
+            total_stats += stats
+    logger.info(
+        "Processed %d samples in %.2f s", len(samples), time.time() - start_time
+    )
+    return total_stats
+
+
 def main_cli():  # pragma: no cover
     """Entry point for command-line script"""
     multiprocessing.freeze_support()
@@ -1117,37 +1535,22 @@ def main(cmdlineargs, default_outfile=sys.stdout.buffer) -> Statistics:
         parser.error("Value for --cores cannot be negative")
 
     cores = available_cpu_count() if args.cores == 0 else args.cores
-    file_opener = FileOpener(
-        compression_level=args.compression_level,
-        threads=estimate_compression_threads(cores),
-    )
-    if sys.stderr.isatty() and not args.quiet and not args.debug:
-        progress = Progress()
-    else:
-        progress = DummyProgress()
-    paired = determine_paired(args)
+    progress = make_progress(args)
 
     try:
-        is_interleaved_input = args.interleaved and len(args.inputs) == 1
-        input_paths = make_input_paths(args.inputs, paired, is_interleaved_input)
-        check_arguments(args, paired)
-        adapters, adapters2 = adapters_from_args(args)
-        log_adapters(adapters, adapters2 if paired else None)
-
-        pipeline = PipelineMaker(args, paired, adapters, adapters2).make()
-        adapter_names: List[Optional[str]] = [a.name for a in adapters]
-        adapter_names2: List[Optional[str]] = [a.name for a in adapters2]
-        outfiles = open_output_files(
-            args, default_outfile, file_opener, adapter_names, adapter_names2
-        )
-        logger.info(
-            "Processing %s reads on %d core%s ...",
-            {False: "single-end", True: "paired-end"}[pipeline.paired],
-            cores,
-            "s" if cores > 1 else "",
-        )
-        stats = run_pipeline(
-            pipeline, input_paths, outfiles, cores, progress, args.buffer_size
+        if args.server is not None:
+            from cutadapt.server import serve
+
+            if args.inputs:
+                parser.error("Input files cannot be given in server mode")
+            serve(args.server, cores, args.buffer_size)
+            return Statistics()
+        if args.batch is not None:
+            if args.inputs:
+                parser.error("Input files cannot be given when using --batch")
+            return run_batch(args, cmdlineargs, cores, start_time)
+        stats, input_paths, paired = run_cutadapt(
+            args, cores, progress, default_outfile, cmdlineargs=cmdlineargs
         )
     except KeyboardInterrupt:
         if args.debug:
@@ -1170,25 +1573,9 @@ def main(cmdlineargs, default_outfile=sys.stdout.buffer) -> Statistics:
         exit_code = 2 if isinstance(e, CommandLineError) else 1
         sys.exit(exit_code)
 
-    elapsed = time.time() - start_time
-    if args.report == "minimal":
-        report = minimal_report
-    else:
-        report = full_report
-    logger.log(REPORT, "%s", report(stats, elapsed, args.gc_content / 100.0))
-    if args.json is not None:
-        with open(args.json, "w") as f:
-            json_dict = json_report(
-                stats=stats,
-                cmdlineargs=cmdlineargs,
-                path1=input_paths.paths[0],
-                path2=input_paths.paths[1] if len(input_paths.paths) > 1 else None,
-                cores=cores,
-                paired=paired,
-                gc_content=args.gc_content / 100.0,
-            )
-            f.write(json_dumps(json_dict))
-            f.write("\n")
+    report_results(
+        args, cmdlineargs, stats, time.time() - start_time, input_paths, cores, paired
+    )
     if profiler is not None:
         import pstats
 
@@ -1218,6 +1605,29 @@ def log_adapters(adapters, adapters2):
             logger.debug("- (%d more)", len(adapters2) - 20)
 
 
+def log_search_statistics(stats: Statistics) -> None:
+    for i, adapter_statistics in enumerate(stats.adapter_stats):
+        if not adapter_statistics:
+            continue
+        logger.debug(
+            "Adapter search statistics%s:", f" for R{i + 1}" if stats.paired else ""
+        )
+        for astats in adapter_statistics:
+            search = astats.search
+            rejected = search.prefilter_rejected / max(search.reads_searched, 1)
+            logger.debug(
+                "- %s: %d reads searched, %d (%.1f%%) rejected by the k-mer "
+                "heuristic, %d aligned, %d with match, %d DP cells",
+                astats.name,
+                search.reads_searched,
+                search.prefilter_rejected,
+                100 * rejected,
+                search.alignments,
+                search.alignments_with_match,
+                search.dp_cells,
+            )
+
+
 def setup_profiler_if_requested(requested):
     if requested:
         import cProfile
@@ -1274,7 +1684,7 @@ def json_report(
 ) -> Dict:
     d = {
         "tag": "Cutadapt report",
-        "schema_version": OneLine([0, 3]),
+        "schema_version": OneLine([0, 4]),
         "cutadapt_version": __version__,
         "python_version": platform.python_version(),
         "command_line_arguments": cmdlineargs,
@@ -1,8 +1,14 @@
+import collections
 import contextlib
 import errno
+import gzip
 import io
+import os
+import struct
 import sys
-from typing import BinaryIO, Optional, Dict, Tuple, List, Callable
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Optional, Dict, Tuple, List, Callable, Deque
 
 import dnaio
 from xopen import xopen
@@ -15,18 +21,166 @@ except ImportError:
     # Windows
     resource = None  # type: ignore
 
+try:
+    from isal import igzip, isal_zlib
+except ImportError:
+    igzip = None  # type: ignore
+    isal_zlib = None  # type: ignore
+
+try:
+    from zlib_ng import gzip_ng
+except ImportError:
+    gzip_ng = None  # type: ignore
+
 
-def xopen_rb_raise_limit(path: str):
+def xopen_rb_raise_limit(path: str, threads: int = 0):
     """
     Open a (possibly compressed) file for reading in binary mode, trying to avoid the
     "Too many open files" problem using `open_raise_limit`.
+
+    threads -- If 0, decompress in the current thread. Otherwise, use
+        a background thread or external process for decompression.
     """
     mode = "rb"
-    f = open_raise_limit(xopen, path, mode, threads=0)
+    f = open_raise_limit(xopen, path, mode, threads=threads)
     logger.debug("Opening '%s', mode '%s' with xopen resulted in %s", path, mode, f)
     return f
 
 
+def is_bgzf(path: str) -> bool:
+    """
+    Return whether the file at path is a regular file in BGZF format (blocked gzip
+    as used by samtools and bgzip)
+    """
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        header = f.read(16)
+    # gzip magic, compression method deflate, FEXTRA flag set, and an
+    # extra field that starts with the "BC" subfield
+    return (
+        len(header) == 16
+        and header[:4] == b"\x1f\x8b\x08\x04"
+        and header[12:16] == b"BC\x02\x00"
+    )
+
+
+def _decompress_bgzf_blocks(blocks: List[bytes]) -> bytes:
+    decompress = zlib.decompress if isal_zlib is None else isal_zlib.decompress
+    return b"".join(decompress(block, 31) for block in blocks)
+
+
+class BgzfReader(io.RawIOBase):
+    """
+    Read and decompress a BGZF file using multiple threads.
+
+    A BGZF file is a series of gzip members ("blocks") that store their own
+    compressed size in the gzip header. This allows splitting the file into
+    blocks without decompressing it first. Groups of blocks are decompressed in
+    a thread pool (zlib and ISA-L release the GIL while decompressing), and
+    the results are returned in order.
+    """
+
+    def __init__(self, path: str, threads: int, blocks_per_task: int = 16):
+        self._file = open(path, "rb")
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._max_pending = 2 * threads
+        self._blocks_per_task = blocks_per_task
+        self._pending: Deque[Future] = collections.deque()
+        # Decompressed data that has not been read yet
+        self._chunks: Deque[memoryview] = collections.deque()
+        self._buffered = 0
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _read_block(self) -> Optional[bytes]:
+        header = self._file.read(12)
+        if not header:
+            return None
+        if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04":
+            raise OSError(f"{self._file.name}: Not a valid BGZF file")
+        (xlen,) = struct.unpack("<H", header[10:12])
+        extra = self._file.read(xlen)
+        i = 0
+        while i + 4 <= len(extra):
+            (slen,) = struct.unpack("<H", extra[i + 2 : i + 4])
+            if extra[i : i + 2] == b"BC" and slen == 2:
+                (bsize,) = struct.unpack("<H", extra[i + 4 : i + 6])
+                break
+            i += 4 + slen
+        else:
+            raise OSError(f"{self._file.name}: BGZF block size field missing")
+        rest = self._file.read(bsize + 1 - 12 - xlen)
+        if len(rest) != bsize + 1 - 12 - xlen:
+            raise OSError(f"{self._file.name}: Truncated BGZF block")
+        return header + extra + rest
+
+    def _submit_tasks(self) -> None:
+        while not self._eof and len(self._pending) < self._max_pending:
+            blocks: List[bytes] = []
+            while len(blocks) < self._blocks_per_task:
+                block = self._read_block()
+                if block is None:
+                    self._eof = True
+                    break
+                blocks.append(block)
+            if blocks:
+                self._pending.append(
+                    self._executor.submit(_decompress_bgzf_blocks, blocks)
+                )
+
+    def _fill(self, size: int) -> None:
+        """Make sure the buffer contains at least size bytes unless EOF is reached"""
+        while self._buffered < size:
+            self._submit_tasks()
+            if not self._pending:
+                return
+            data = self._pending.popleft().result()
+            if data:
+                self._chunks.append(memoryview(data))
+                self._buffered += len(data)
+
+    def peek(self, size: int = 0) -> bytes:
+        size = max(size, 1)
+        self._fill(size)
+        parts = []
+        n = 0
+        for chunk in self._chunks:
+            if n >= size:
+                break
+            parts.append(chunk[: size - n])
+            n += len(parts[-1])
+        return b"".join(parts)
+
+    def readinto(self, b) -> int:
+        """Read len(b) bytes into b (fewer only at the end of the file)"""
+        out = memoryview(b).cast("B")
+        self._fill(len(out))
+        n = 0
+        while n < len(out) and self._chunks:
+            chunk = self._chunks[0]
+            k = min(len(out) - n, len(chunk))
+            out[n : n + k] = chunk[:k]
+            n += k
+            if k == len(chunk):
+                self._chunks.popleft()
+            else:
+                self._chunks[0] = chunk[k:]
+        self._buffered -= n
+        return n
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        for future in self._pending:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        self._file.close()
+        super().close()
+
+
 def open_raise_limit(func, *args, **kwargs):
     """
     Run 'func' (which should be some kind of open() function) and return its result.
@@ -52,17 +206,97 @@ def raise_open_files_limit(n):
     resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
 
 
+def compress_gzip_member(data: bytes, compression_level: int) -> bytes:
+    """
+    Compress data into a complete gzip member. Like xopen, use ISA-L for
+    compression levels 1 and 2 and zlib-ng if available.
+    """
+    if igzip is not None and compression_level in (1, 2):
+        return igzip.compress(data, compression_level, mtime=0)
+    if gzip_ng is not None:
+        return gzip_ng.compress(
+            data, 2 if compression_level == 1 else compression_level, mtime=0
+        )
+    return gzip.compress(data, compression_level, mtime=0)
+
+
+class GzipMemberWriter(io.RawIOBase):
+    """
+    Write a gzip-compressed file as a sequence of independently compressed
+    gzip members. Decompressors treat such a file the same as one that has been
+    compressed in one go.
+
+    This allows the worker processes of a ParallelPipelineRunner to do the
+    compression: They compress each chunk of output using compress_gzip_member()
+    and the main process writes the result with write_compressed().
+    """
+
+    def __init__(self, file: BinaryIO, compression_level: int):
+        self._file = file
+        self.compression_level = compression_level
+        self._empty = True
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:  # type: ignore
+        """Compress data into a new gzip member and write it"""
+        self.write_compressed(compress_gzip_member(bytes(data), self.compression_level))
+        return len(data)
+
+    def write_compressed(self, member: bytes) -> None:
+        """Write data that has already been compressed with compress_gzip_member()"""
+        if member:
+            self._file.write(member)
+            self._empty = False
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self._empty:
+            # An empty file is not a valid gzip file
+            self._file.write(compress_gzip_member(b"", self.compression_level))
+        self._file.close()
+        super().close()
+
+
 class FileOpener:
-    def __init__(self, compression_level: int = 6, threads: Optional[int] = None):
+    def __init__(
+        self,
+        compression_level: int = 6,
+        threads: Optional[int] = None,
+        compress_in_workers: bool = False,
+    ):
         """
         threads -- no. of external compression threads.
             0: write in-process
             None: min(cpu_count(), 4)
+        compress_in_workers -- If True, open gzip-compressed output files as
+            GzipMemberWriter so that the workers of a ParallelPipelineRunner
+            compress the data.
         """
         self.compression_level = compression_level
         self.threads = threads
+        self.compress_in_workers = compress_in_workers
 
     def xopen(self, path, mode):
+        if (
+            self.compress_in_workers
+            and "w" in mode
+            and os.fspath(path).endswith(".gz")
+            and self.compression_level > 0
+        ):
+            f = GzipMemberWriter(
+                open_raise_limit(open, path, "wb"), self.compression_level
+            )
+            logger.debug(
+                "Opening '%s', mode '%s' for compression by worker processes "
+                "(compression level %s)",
+                path,
+                mode,
+                self.compression_level,
+            )
+            return f
         threads = self.threads if "w" in mode else 0
         f = open_raise_limit(
             xopen, path, mode, compresslevel=self.compression_level, threads=threads
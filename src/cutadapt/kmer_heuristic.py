@@ -1,13 +1,159 @@
 import io
-from typing import List, Optional, Set, Tuple
-from collections import defaultdict
+import itertools
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from collections import Counter, defaultdict
 
+# Return the probability that a k-mer occurs at a given position within the
+# region (start, stop) of a read (as in sequence[start:stop])
+KmerProbability = Callable[[str, int, Optional[int]], float]
 
-def kmer_chunks(sequence: str, chunks: int) -> Set[str]:
+_ACGT_RUN = re.compile("[ACGT]+")
+
+
+class KmerModel:
+    """
+    Estimate the probability that a k-mer occurs at a random position of a read
+
+    This is a Markov model in which each base depends on the three preceding
+    ones. Without sample sequences, bases are independent and occur with the
+    frequencies implied by the GC content. Sample sequences (such as the first
+    reads of the input) make the model reflect their k-mer frequencies, so that
+    for example poly-G stretches are recognized as frequent.
+
+    Because the composition of reads often depends on the position (poly-G
+    tails occur at the 3' end only), frequencies are estimated separately for
+    the first and last end_length bases of the reads. These are used for k-mers
+    that are searched only within such a region.
+
+    Characters other than A, C, G and T (IUPAC wildcards in the k-mer) are
+    assumed to match any base.
+    """
+
+    order = 3
+    # Weight of the GC content prior in number of sampled k-mers
+    prior_weight = 1000
+    end_length = 40
+
+    def __init__(self, gc_content: float = 0.5, sequences: Iterable[str] = ()):
+        if not 0.0 <= gc_content <= 1.0:
+            raise ValueError("gc_content must be between 0 and 1")
+        self.gc_content = gc_content
+        sequences = [sequence.upper() for sequence in sequences]
+        self._probabilities = self._estimate(sequences)
+        self._start_probabilities = self._estimate(
+            sequence[: self.end_length] for sequence in sequences
+        )
+        self._end_probabilities = self._estimate(
+            sequence[-self.end_length :] for sequence in sequences
+        )
+
+    def _estimate(self, sequences: Iterable[str]) -> Dict[str, float]:
+        """
+        Return the probabilities of all k-mers with length 1 to order + 1
+        """
+        base_probabilities = {
+            "A": (1.0 - self.gc_content) / 2,
+            "C": self.gc_content / 2,
+            "G": self.gc_content / 2,
+            "T": (1.0 - self.gc_content) / 2,
+        }
+        k = self.order + 1
+        counts: Counter = Counter()
+        for sequence in sequences:
+            counts.update(sequence[i : i + k] for i in range(len(sequence) - k + 1))
+        total = sum(n for kmer, n in counts.items() if _ACGT_RUN.fullmatch(kmer))
+        probabilities: Dict[str, float] = {}
+        for kmer_tuple in itertools.product("ACGT", repeat=k):
+            kmer = "".join(kmer_tuple)
+            prior = 1.0
+            for c in kmer:
+                prior *= base_probabilities[c]
+            probability = (counts[kmer] + self.prior_weight * prior) / (
+                total + self.prior_weight
+            )
+            for i in range(1, k + 1):
+                prefix = kmer[:i]
+                probabilities[prefix] = probabilities.get(prefix, 0.0) + probability
+        return probabilities
+
+    def probability(
+        self, kmer: str, start: int = 0, stop: Optional[int] = None
+    ) -> float:
+        """
+        Return the probability that the k-mer occurs at a given position
+        within sequence[start:stop]
+        """
+        if start < 0 and stop is None and -start <= self.end_length:
+            probabilities = self._end_probabilities
+        elif start == 0 and stop is not None and 0 < stop <= self.end_length:
+            probabilities = self._start_probabilities
+        else:
+            probabilities = self._probabilities
+        probability = 1.0
+        for run in _ACGT_RUN.findall(kmer.upper()):
+            probability *= self._run_probability(run, probabilities)
+        return probability
+
+    def _run_probability(self, run: str, probabilities: Dict[str, float]) -> float:
+        k = self.order + 1
+        probability = probabilities[run[:k]]
+        for i in range(k, len(run)):
+            probability *= probabilities[run[i - k + 1 : i + 1]]
+            probability /= probabilities[run[i - k + 1 : i]]
+        return probability
+
+
+def reversed_kmer_probability(
+    kmer_probability: Optional[KmerProbability],
+) -> Optional[KmerProbability]:
+    """
+    Return a function that gives the probability for k-mers of reversed reads
+
+    The k-mer and the region are both mirrored before kmer_probability is
+    called. Regions must start at the beginning or stop at the end of the read.
+    """
+    if kmer_probability is None:
+        return None
+    forward_kmer_probability = kmer_probability
+
+    def probability(kmer: str, start: int, stop: Optional[int]) -> float:
+        return forward_kmer_probability(
+            kmer[::-1], 0 if stop is None else -stop, None if start == 0 else -start
+        )
+
+    return probability
+
+
+def region_kmer_probability(
+    kmer_probability: Optional[KmerProbability], start: int, stop: Optional[int]
+) -> Optional[Callable[[str], float]]:
+    """
+    Return a function that gives the probability for k-mers searched in the
+    region (start, stop)
+    """
+    if kmer_probability is None:
+        return None
+    forward_kmer_probability = kmer_probability
+    return lambda kmer: forward_kmer_probability(kmer, start, stop)
+
+
+def kmer_chunks(
+    sequence: str,
+    chunks: int,
+    kmer_probability: Optional[Callable[[str], float]] = None,
+) -> Set[str]:
     """
     Partition a sequence in almost equal sized chunks. Returns the shortest
     possibility. AABCABCABC, 3 returns {"AABC", "ABC"}
+
+    If kmer_probability is given, the chunk lengths may deviate a bit from
+    each other, and the partition is chosen for which the sum of the
+    probabilities of the chunks is lowest. Among partitions that are equally
+    good, longer chunks come first.
     """
+    if kmer_probability is not None and len(sequence) >= 2 * chunks > 2:
+        return set(_best_partition(sequence, chunks, kmer_probability))
     chunk_size = len(sequence) // (chunks)
     remainder = len(sequence) % (chunks)
     chunk_sizes: List[int] = remainder * [chunk_size + 1] + (chunks - remainder) * [
@@ -21,6 +167,46 @@ def kmer_chunks(sequence: str, chunks: int) -> Set[str]:
     return chunk_set
 
 
+def _best_partition(
+    sequence: str, chunks: int, kmer_probability: Callable[[str], float]
+) -> List[str]:
+    """
+    Return the partition of the sequence into the given number of chunks
+    whose lengths differ by at most two from the average length, for which
+    the sum of the chunk probabilities is minimal.
+    """
+    n = len(sequence)
+    chunk_size = n // chunks
+    lengths = range(chunk_size + 2, max(chunk_size - 2, 1) - 1, -1)
+    infinity = float("inf")
+    # cost[c][i]: lowest sum of probabilities for splitting sequence[i:] into c chunks
+    # length[c][i]: the length of the first chunk in that case
+    cost = [[infinity] * (n + 1) for _ in range(chunks + 1)]
+    length = [[0] * (n + 1) for _ in range(chunks + 1)]
+    cost[0][n] = 0.0
+    probabilities: Dict[Tuple[int, int], float] = {}
+    for c in range(1, chunks + 1):
+        for i in range(n):
+            for chunk_length in lengths:
+                j = i + chunk_length
+                if j > n or cost[c - 1][j] == infinity:
+                    continue
+                if (i, j) not in probabilities:
+                    probabilities[i, j] = kmer_probability(sequence[i:j])
+                total = probabilities[i, j] + cost[c - 1][j]
+                # Tolerate rounding errors so that ties go to the longer chunk
+                if total < cost[c][i] * (1 - 1e-9):
+                    cost[c][i] = total
+                    length[c][i] = chunk_length
+    assert cost[chunks][0] != infinity
+    partition = []
+    i = 0
+    for c in range(chunks, 0, -1):
+        partition.append(sequence[i : i + length[c][i]])
+        i += length[c][i]
+    return partition
+
+
 # A SearchSet is a start and stop combined with a set of strings to search
 # for at that position
 SearchSet = Tuple[int, Optional[int], Set[str]]
@@ -85,7 +271,10 @@ def remove_redundant_kmers(
 
 
 def create_back_overlap_searchsets(
-    adapter: str, min_overlap: int, error_rate: float
+    adapter: str,
+    min_overlap: int,
+    error_rate: float,
+    kmer_probability: Optional[KmerProbability] = None,
 ) -> List[SearchSet]:
     adapter_length = len(adapter)
     error_lengths = []
@@ -111,7 +300,11 @@ def create_back_overlap_searchsets(
                     search_set = (-i, None, {adapter[:i]})
                     search_sets.append(search_set)
                 minimum_length = min_overlap_kmer_length
-        kmer_sets = kmer_chunks(adapter[:minimum_length], max_errors + 1)
+        kmer_sets = kmer_chunks(
+            adapter[:minimum_length],
+            max_errors + 1,
+            region_kmer_probability(kmer_probability, -length, None),
+        )
         search_sets.append((-length, None, kmer_sets))
         minimum_length = length + 1
     return search_sets
@@ -124,6 +317,7 @@ def create_positions_and_kmers(
     back_adapter: bool,
     front_adapter: bool,
     internal: bool = True,
+    kmer_probability: Optional[KmerProbability] = None,
 ) -> List[Tuple[int, Optional[int], List[str]]]:
     """
     Create a set of position and words combinations where at least one of the
@@ -138,12 +332,17 @@ def create_positions_and_kmers(
 
     This function returns the positions and the accompanying words while also
     taking into account partial overlap for back and front adapters.
+
+    If kmer_probability is given, it is used to choose the words such that
+    they are unlikely to occur by chance (see kmer_chunks()).
     """
     max_errors = int(len(adapter) * error_rate)
     search_sets = []
     if back_adapter:
         search_sets.extend(
-            create_back_overlap_searchsets(adapter, min_overlap, error_rate)
+            create_back_overlap_searchsets(
+                adapter, min_overlap, error_rate, kmer_probability
+            )
         )
     if front_adapter:
         # To create a front adapter the code is practically the same except
@@ -151,7 +350,10 @@ def create_positions_and_kmers(
         # the back adapter code and reversing all the kmers and positions has
         # the same effect without needing to duplicate the code.
         reversed_back_search_sets = create_back_overlap_searchsets(
-            adapter[::-1], min_overlap, error_rate
+            adapter[::-1],
+            min_overlap,
+            error_rate,
+            reversed_kmer_probability(kmer_probability),
         )
         front_search_sets = []
         for start, stop, kmer_set in reversed_back_search_sets:
@@ -159,7 +361,9 @@ def create_positions_and_kmers(
             front_search_sets.append((0, -start, new_kmer_set))
         search_sets.extend(front_search_sets)
     if internal:
-        kmer_sets = kmer_chunks(adapter, max_errors + 1)
+        kmer_sets = kmer_chunks(
+            adapter, max_errors + 1, region_kmer_probability(kmer_probability, 0, None)
+        )
         search_sets.append((0, None, kmer_sets))
     return remove_redundant_kmers(search_sets)
 
@@ -167,12 +371,14 @@ def create_positions_and_kmers(
 def kmer_probability_analysis(
     kmers_and_offsets: List[Tuple[int, Optional[int], List[str]]],
     default_length: int = 150,
+    kmer_probability: Optional[KmerProbability] = None,
 ) -> str:  # pragma: no cover  # only for debugging use
     """
     Returns a tab separated table with for each kmer a start, stop, the number
     of considered sites and the hit chance on a randomly generated sequence
     containing only A, C, G and T. Assumes kmers only consist of A, C, G and T
-    too.
+    too. If kmer_probability is given, it is used instead of assuming that all
+    bases are equally likely.
 
     Useful for investigating whether the create_positions_and_kmers function
     creates a useful runtime heuristic.
@@ -182,7 +388,8 @@ def kmer_probability_analysis(
         "kmer\tstart\tstop\tconsidered sites\thit chance by random sequence (%)\n"
     )
     accumulated_not_hit_chance = 1.0
-    for start, stop, kmers in kmers_and_offsets:
+    for region_start, stop, kmers in kmers_and_offsets:
+        start = region_start
         if stop is None:
             check_length = -start if start < 0 else default_length - start
         else:
@@ -191,7 +398,10 @@ def kmer_probability_analysis(
         for kmer in kmers:
             kmer_length = len(kmer)
             considered_sites = check_length - kmer_length + 1
-            single_kmer_hit_chance = 1 / 4**kmer_length
+            if kmer_probability is None:
+                single_kmer_hit_chance = 1 / 4**kmer_length
+            else:
+                single_kmer_hit_chance = kmer_probability(kmer, region_start, stop)
             not_hit_chance = (1 - single_kmer_hit_chance) ** considered_sites
             accumulated_not_hit_chance *= not_hit_chance
             out.write(
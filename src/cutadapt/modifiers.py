@@ -23,6 +23,7 @@ from .adapters import (
     Adapter,
     AdapterIndex,
 )
+from .kmer_heuristic import KmerModel
 from .tokenizer import tokenize_braces, TokenizeError, Token, BraceToken
 from .info import ModificationInfo
 
@@ -38,6 +39,18 @@ class SingleEndModifier(ABC):
     def __call__(self, read: SequenceRecord, info: ModificationInfo):
         pass
 
+    def process_batch(
+        self, reads: List[SequenceRecord], infos: List[ModificationInfo]
+    ) -> List[SequenceRecord]:
+        """
+        Modify a batch of reads. infos[i] is the ModificationInfo for reads[i].
+        Return the list of modified reads.
+
+        Subclasses can override this if they can process many reads faster
+        than one at a time.
+        """
+        return [self(read, info) for read, info in zip(reads, infos)]
+
 
 class PairedEndModifier(ABC):
     @abstractmethod
@@ -119,6 +132,7 @@ class AdapterCutter(SingleEndModifier):
             self.adapters = MultipleAdapters(adapters)
         if action == "retain" and times > 1:
             raise ValueError("'retain' cannot be combined with times > 1")
+        self._kmer_model_estimated = False
         if self.times == 1 and self.action == "trim":
             self.match_and_trim = self._match_and_trim_once_action_trim  # type: ignore
 
@@ -198,12 +212,37 @@ class AdapterCutter(SingleEndModifier):
 
     def __call__(self, read, info: ModificationInfo):
         trimmed_read, matches = self.match_and_trim(read)
+        self._add_matches(matches, info)
+        return trimmed_read
+
+    def process_batch(self, reads, infos):
+        """
+        Search for adapters in a batch of reads. The first adapter removal
+        round is done for all reads at once (see MultipleAdapters.match_many).
+        """
+        if self.action == "lowercase":
+            for read in reads:
+                read.sequence = read.sequence.upper()
+        sequences = [read.sequence for read in reads]
+        if not self._kmer_model_estimated:
+            # Choose the k-mers for the k-mer heuristic such that they are rare
+            # in the first reads
+            self.adapters.set_kmer_model(KmerModel(sequences=sequences[:1000]))
+            self._kmer_model_estimated = True
+        first_matches = self.adapters.match_many(sequences)
+        trimmed_reads = []
+        for read, info, match in zip(reads, infos, first_matches):
+            trimmed_read, matches = self._trim(read, match)
+            self._add_matches(matches, info)
+            trimmed_reads.append(trimmed_read)
+        return trimmed_reads
+
+    def _add_matches(self, matches: Sequence[Match], info: ModificationInfo) -> None:
         if matches:
             self.with_adapters += 1
             for match in matches:
                 self.adapter_statistics[match.adapter].add_match(match)
         info.matches.extend(matches)  # TODO extend or overwrite?
-        return trimmed_read
 
     def match_and_trim(self, read):
         """
@@ -217,12 +256,20 @@ class AdapterCutter(SingleEndModifier):
 
         Return a pair (trimmed_read, matches), where matches is a list of Match instances.
         """
-        matches = []
         if self.action == "lowercase":  # TODO this should not be needed
             read.sequence = read.sequence.upper()
+        return self._trim(read, self.adapters.match_to(read.sequence))
+
+    def _trim(self, read, first_match: Optional[Match]):
+        """
+        Do the work of match_and_trim() given the match found in the first round
+        """
+        matches = []
         trimmed_read = read
-        for _ in range(self.times):
-            match = self.adapters.match_to(trimmed_read.sequence)
+        match = first_match
+        for round_ in range(self.times):
+            if round_ > 0:
+                match = self.adapters.match_to(trimmed_read.sequence)
             if match is None:
                 # if nothing found, attempt no further rounds
                 break
@@ -1,4 +1,5 @@
 import io
+import itertools
 import logging
 from abc import ABC, abstractmethod
 from pathlib import Path
@@ -244,6 +245,7 @@ class Pipeline(ABC):
         infiles: InputFiles,
         outfiles: OutputFiles,
         progress: Optional[Progress] = None,
+        max_reads: Optional[int] = None,
     ) -> Tuple[int, int, Optional[int]]:
         pass
 
@@ -275,6 +277,9 @@ class SingleEndPipeline(Pipeline):
     Processing pipeline for single-end reads
     """
 
+    # Number of reads that are passed to the modifiers at once
+    batch_size = 1000
+
     def __init__(self, modifiers: List[SingleEndModifier]):
         super().__init__()
         self._modifiers: List[SingleEndModifier] = modifiers
@@ -284,27 +289,37 @@ class SingleEndPipeline(Pipeline):
         infiles: InputFiles,
         outfiles: OutputFiles,
         progress: Optional[Progress] = None,
+        max_reads: Optional[int] = None,
     ) -> Tuple[int, int, Optional[int]]:
-        """Run the pipeline. Return statistics"""
+        """
+        Run the pipeline on at most max_reads reads (all if None). Return statistics
+        """
         self._infiles = infiles
         self._reader = infiles.open()
         self._set_output(outfiles)
         n = 0  # no. of processed reads
         total_bp = 0
-        for read in self._reader:
-            n += 1
-            if n % 10000 == 0 and progress is not None:
-                progress.update(10000)
-            total_bp += len(read)
-            info = ModificationInfo(read)
+        reads_iterator = itertools.islice(self._reader, max_reads)
+        while True:
+            # Modifiers are applied to batches of reads to allow them to
+            # process many reads at once (see SingleEndModifier.process_batch)
+            reads = list(itertools.islice(reads_iterator, self.batch_size))
+            if not reads:
+                break
+            n += len(reads)
+            if progress is not None:
+                progress.update(len(reads))
+            infos = []
+            for read in reads:
+                total_bp += len(read)
+                infos.append(ModificationInfo(read))
             for modifier in self._modifiers:
-                read = modifier(read, info)
-            for filter_ in self._steps:
-                read = filter_(read, info)
-                if read is None:
-                    break
-        if progress is not None:
-            progress.update(n % 10000)
+                reads = modifier.process_batch(reads, infos)
+            for read, info in zip(reads, infos):
+                for filter_ in self._steps:
+                    read = filter_(read, info)
+                    if read is None:
+                        break
         return (n, total_bp, None)
 
     def _make_filter(
@@ -410,6 +425,7 @@ class PairedEndPipeline(Pipeline):
         infiles: InputFiles,
         outfiles: OutputFiles,
         progress: Optional[Progress] = None,
+        max_reads: Optional[int] = None,
     ) -> Tuple[int, int, Optional[int]]:
         self._infiles = infiles
         self._reader = infiles.open()
@@ -418,7 +434,7 @@ class PairedEndPipeline(Pipeline):
         total1_bp = 0
         total2_bp = 0
         assert self._reader is not None
-        for reads in self._reader:
+        for reads in itertools.islice(self._reader, max_reads):
             n += 1
             if n % 10000 == 0 and progress is not None:
                 progress.update(10000)
@@ -86,7 +86,7 @@ class Statistics:
 
         if self.paired is None:
             self.paired = other.paired
-        elif self.paired != other.paired:
+        elif other.paired is not None and self.paired != other.paired:
             raise ValueError("Incompatible Statistics: paired is not equal")
 
         self.reverse_complemented = add_if_not_none(
@@ -163,7 +163,9 @@ class Statistics:
         if isinstance(m, PairedAdapterCutter):
             for i in 0, 1:
                 self.with_adapters[i] = m.with_adapters
-                self.adapter_stats[i] = list(m.adapter_statistics[i].values())
+                self.adapter_stats[i] = self._adapter_statistics(
+                    m.adapter_statistics[i]
+                )
             return
         if isinstance(m, PairedEndModifierWrapper):
             modifiers_list = [(0, m._modifier1), (1, m._modifier2)]
@@ -179,15 +181,26 @@ class Statistics:
             elif isinstance(modifier, AdapterCutter):
                 assert self.with_adapters[i] is None
                 self.with_adapters[i] = modifier.with_adapters
-                self.adapter_stats[i] = list(modifier.adapter_statistics.values())
+                self.adapter_stats[i] = self._adapter_statistics(
+                    modifier.adapter_statistics
+                )
             elif isinstance(modifier, ReverseComplementer):
                 assert self.with_adapters[i] is None
                 self.with_adapters[i] = modifier.adapter_cutter.with_adapters
-                self.adapter_stats[i] = list(
-                    modifier.adapter_cutter.adapter_statistics.values()
+                self.adapter_stats[i] = self._adapter_statistics(
+                    modifier.adapter_cutter.adapter_statistics
                 )
                 self.reverse_complemented = modifier.reverse_complemented
 
+    @staticmethod
+    def _adapter_statistics(
+        adapter_statistics: Dict[Any, AdapterStatistics]
+    ) -> List[AdapterStatistics]:
+        statistics = list(adapter_statistics.values())
+        for astats in statistics:
+            astats.update_search_statistics()
+        return statistics
+
     def as_json(self, gc_content: float = 0.5, one_line: bool = False) -> Dict:
         """
         Return a dict representation suitable for dumping in JSON format
@@ -295,6 +308,7 @@ class Statistics:
             )
             total_trimmed_reads += total
 
+        search = adapter_statistics.search
         on_reverse_complement = (
             adapter_statistics.reverse_complemented
             if self.reverse_complemented
@@ -307,6 +321,13 @@ class Statistics:
             "linked": isinstance(adapter, LinkedAdapter),
             "five_prime_end": ends[0],
             "three_prime_end": ends[1],
+            "search": {
+                "reads_searched": search.reads_searched,
+                "prefilter_rejected": search.prefilter_rejected,
+                "alignments": search.alignments,
+                "alignments_with_match": search.alignments_with_match,
+                "dp_cells": search.dp_cells,
+            },
         }
 
     @staticmethod
@@ -1,17 +1,52 @@
+import collections
+import concurrent.futures
+import copy
 import io
 import logging
 import multiprocessing
 import os
+import random
+import shutil
+import struct
 import sys
+import threading
+import time
 import traceback
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import ExitStack
 from multiprocessing.connection import Connection
-from typing import Any, List, Optional, Tuple, Sequence, Iterator, TYPE_CHECKING, Union
+from multiprocessing.reduction import ForkingPickler
+from multiprocessing.shared_memory import SharedMemory
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Deque,
+    List,
+    Optional,
+    Tuple,
+    Sequence,
+    Set,
+    Iterable,
+    Iterator,
+    TYPE_CHECKING,
+    Union,
+)
 
 import dnaio
 
-from cutadapt.files import InputFiles, OutputFiles, InputPaths, xopen_rb_raise_limit
+from cutadapt.files import (
+    InputFiles,
+    OutputFiles,
+    InputPaths,
+    GzipMemberWriter,
+    BgzfReader,
+    compress_gzip_member,
+    is_bgzf,
+    xopen_rb_raise_limit,
+)
 from cutadapt.pipeline import Pipeline
 from cutadapt.report import Statistics
 from cutadapt.utils import Progress, DummyProgress
@@ -27,6 +62,316 @@ else:
     mpctx_Process = mpctx.Process
 
 
+class ChunkSizeTuner:
+    """
+    Adjust the size of the chunks that are sent to the workers while running
+
+    Workers report how long they needed to process their previous chunk. From this,
+    the throughput of a worker (in bytes per second) is estimated, and the chunk size
+    is chosen such that processing a chunk takes about `target_time` seconds.
+
+    The target time itself is adjusted depending on how long the reader needs to
+    wait for a worker to become available:
+
+    - If a worker is already waiting, the workers process chunks faster than the
+      reader can hand them out. Larger chunks reduce the per-chunk overhead.
+    - If the reader needs to wait, all workers are busy. Smaller chunks are then
+      preferable because they distribute the work more evenly, in particular
+      towards the end of the input, where workers would otherwise become idle
+      while the last few large chunks are still being processed.
+    """
+
+    # A worker that has been waiting for less than this (in seconds) is considered busy
+    min_wait_time = 0.001
+    min_target_time = 0.1
+    max_target_time = 10.0
+
+    def __init__(self, minimum: int, maximum: int, target_time: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.size = minimum
+        self.target_time = target_time
+        self._throughput: Optional[float] = None
+
+    def update(
+        self, chunk_size: int, processing_time: Optional[float], wait_time: float
+    ) -> None:
+        """
+        Args:
+            chunk_size: Size of the chunk that the worker processed previously
+            processing_time: Time the worker needed for processing that chunk
+                (None if this is the first time the worker asks for work)
+            wait_time: Time the reader waited for the worker to ask for work
+        """
+        if wait_time < self.min_wait_time:
+            self.target_time = min(self.target_time * 1.1, self.max_target_time)
+        else:
+            self.target_time = max(self.target_time / 1.1, self.min_target_time)
+        if processing_time is not None and processing_time > 0 and chunk_size > 0:
+            throughput = chunk_size / processing_time
+            if self._throughput is None:
+                self._throughput = throughput
+            else:
+                # Exponential moving average
+                self._throughput = 0.75 * self._throughput + 0.25 * throughput
+        if self._throughput is not None:
+            size = int(self._throughput * self.target_time)
+            self.size = max(self.minimum, min(size, self.maximum))
+
+
+class LimitedReader:
+    """
+    Wrap a binary file such that readinto() reads at most `limit` bytes at a time.
+
+    dnaio.read_chunks() calls readinto() once per chunk, so the limit determines
+    the size of the chunks.
+
+    dnaio.read_paired_chunks() fails if a call to readinto() does not provide at
+    least one complete record. If min_newlines is set, readinto() therefore continues
+    reading beyond the limit (as far as the buffer allows) until the data read
+    contains at least that many newline characters. Eight newlines guarantee
+    a complete FASTQ record.
+    """
+
+    def __init__(self, file: BinaryIO, limit: int, min_newlines: int = 0):
+        self._file = file
+        self.limit = limit
+        self._min_newlines = min_newlines
+
+    def readinto(self, b) -> int:
+        view = memoryview(b)
+        n = self._file.readinto(view[: self.limit])  # type: ignore
+        if self._min_newlines == 0:
+            return n
+        newlines = view[:n].tobytes().count(b"\n")
+        while newlines < self._min_newlines and n < len(view):
+            m = self._file.readinto(view[n : n + self.limit])  # type: ignore
+            if m == 0:
+                break
+            newlines += view[n : n + m].tobytes().count(b"\n")
+            n += m
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+
+def _default_buffer_size(n_workers: int) -> int:
+    """Return the default maximum chunk size when running with n_workers workers"""
+    return max(4, n_workers // 4) * 1024**2
+
+
+def _decompression_threads(n_workers: int) -> int:
+    """Return the number of threads to use for decompressing BGZF input"""
+    # One decompression thread can keep about eight workers busy
+    return min(1 + n_workers // 8, 8)
+
+
+def _compression_levels(outfiles: OutputFiles) -> List[Optional[int]]:
+    """
+    Return for each output file the level at which processed chunks need to be
+    compressed before they are written, or None if they are written uncompressed
+    """
+    return [
+        f.compression_level if isinstance(f, GzipMemberWriter) else None
+        for f in outfiles
+    ]
+
+
+def _processed_chunks(
+    outfiles: OutputFiles, compression_levels: List[Optional[int]]
+) -> List[bytes]:
+    """
+    Return the contents of the BytesIO output files, compressed where needed
+    (see _compression_levels())
+    """
+    processed_chunks = []
+    for f, compression_level in zip(outfiles, compression_levels):
+        f.flush()
+        assert isinstance(f, io.BytesIO)
+        processed_chunk = f.getvalue()
+        if compression_level is not None and processed_chunk:
+            processed_chunk = compress_gzip_member(processed_chunk, compression_level)
+        processed_chunks.append(processed_chunk)
+    return processed_chunks
+
+
+# Header of a message with processed chunks: number of reads and number of entries.
+# Each entry consists of an output file index and the length of the data.
+_FRAME_HEADER = struct.Struct("<QI")
+_FRAME_ENTRY = struct.Struct("<IQ")
+
+
+def _pack_chunks(n_reads: int, processed_chunks: Sequence[bytes]) -> bytes:
+    """
+    Pack the non-empty processed chunks into a single message so that only one
+    message needs to be sent per chunk even when there are many (mostly empty)
+    output files, such as when demultiplexing. See _unpack_chunks().
+    """
+    entries = [
+        (file_index, chunk)
+        for file_index, chunk in enumerate(processed_chunks)
+        if chunk
+    ]
+    parts = [_FRAME_HEADER.pack(n_reads, len(entries))]
+    parts.extend(
+        _FRAME_ENTRY.pack(file_index, len(chunk)) for file_index, chunk in entries
+    )
+    parts.extend(chunk for _, chunk in entries)
+    return b"".join(parts)
+
+
+def _unpack_chunks(message: bytes) -> Tuple[int, List[Tuple[int, memoryview]]]:
+    """
+    Unpack a message created by _pack_chunks() and return the number of reads and
+    a list of (output file index, data) tuples for the non-empty chunks
+    """
+    view = memoryview(message)
+    n_reads, n_entries = _FRAME_HEADER.unpack_from(view)
+    entry_offset = _FRAME_HEADER.size
+    data_offset = entry_offset + n_entries * _FRAME_ENTRY.size
+    chunks = []
+    for _ in range(n_entries):
+        file_index, length = _FRAME_ENTRY.unpack_from(view, entry_offset)
+        entry_offset += _FRAME_ENTRY.size
+        chunks.append((file_index, view[data_offset : data_offset + length]))
+        data_offset += length
+    return n_reads, chunks
+
+
+def _modifier_statistics(pipeline: Pipeline) -> Statistics:
+    """Return the statistics collected by the modifiers of the pipeline"""
+    modifiers = getattr(pipeline, "_modifiers", None)
+    assert modifiers is not None
+    return Statistics().collect(0, 0, 0 if pipeline.paired else None, modifiers, [])
+
+
+def _open_input(path: str, n_paths: int, decompression_threads: int):
+    """
+    Open an input file for reading chunks from it.
+
+    BGZF files are decompressed with decompression_threads threads. For
+    paired-end input (n_paths == 2), other files are decompressed in a
+    background thread or process so that both files are decompressed in parallel.
+    """
+    if path != "-" and is_bgzf(path):
+        logger.debug(
+            "Decompressing BGZF file '%s' with %d threads",
+            path,
+            decompression_threads,
+        )
+        return BgzfReader(path, threads=decompression_threads)
+    return xopen_rb_raise_limit(path, threads=1 if n_paths == 2 else 0)
+
+
+def _read_chunks(files, buffer_size: int) -> Iterator[Tuple[memoryview, ...]]:
+    if len(files) == 1:
+        for chunk in dnaio.read_chunks(files[0], buffer_size):
+            yield (chunk,)
+    elif len(files) == 2:
+        for chunks in dnaio.read_paired_chunks(files[0], files[1], buffer_size):
+            yield chunks
+    else:
+        raise NotImplementedError
+
+
+def _chunk_format(chunk: memoryview) -> str:
+    """Return the format of the records in a chunk produced by dnaio.read_chunks()"""
+    first = bytes(chunk[:1])
+    if first == b"@":
+        return "fastq"
+    elif first in (b">", b"#"):
+        return "fasta"
+    else:
+        return "bam"
+
+
+def _first_records(chunk: memoryview, n: int, format: str) -> Tuple[int, int]:
+    """
+    Return a tuple (length, count), where length is the number of bytes taken up by
+    the first n records in the chunk and count is the number of records within
+    those bytes. If the chunk contains fewer than n records, length is the length
+    of the chunk.
+    """
+    if format == "bam":
+        # Each record starts with its length as a 32-bit integer
+        offset = count = 0
+        while offset < len(chunk) and count < n:
+            offset += 4 + int.from_bytes(chunk[offset : offset + 4], "little")
+            count += 1
+        return offset, count
+    data = bytes(chunk)
+    if format == "fastq":
+        total = data.count(b"\n") // 4
+        if total <= n:
+            return len(data), total
+        end = -1
+        for _ in range(4 * n):
+            end = data.find(b"\n", end + 1)
+        return end + 1, n
+    else:
+        # FASTA records start with ">" at the beginning of a line
+        total = data.count(b"\n>") + (data[:1] == b">")
+        if total <= n:
+            return len(data), total
+        start = 0 if data[:1] == b">" else -1
+        for _ in range(n):
+            start = data.find(b"\n>", start + 1)
+        return start + 1, n
+
+
+def _sample_chunks(
+    chunks: Iterable[Tuple[memoryview, ...]], fraction: Optional[float]
+) -> Iterator[Tuple[memoryview, ...]]:
+    """
+    Yield a pseudo-random subset of the chunks, each chunk being selected with
+    probability fraction. The selection is deterministic: For the same sequence of
+    chunks, the same ones are selected.
+    """
+    if fraction is None:
+        yield from chunks
+        return
+    rng = random.Random(0)
+    for chunk_tuple in chunks:
+        if rng.random() < fraction:
+            yield chunk_tuple
+
+
+def _max_records(max_reads: Optional[int], inpaths: InputPaths) -> Optional[int]:
+    """Return the number of records per input file that make up max_reads reads"""
+    if max_reads is None:
+        return None
+    return 2 * max_reads if inpaths.interleaved else max_reads
+
+
+def _limit_chunks(
+    chunks: Iterable[Tuple[memoryview, ...]], max_records: Optional[int]
+) -> Iterator[Tuple[memoryview, ...]]:
+    """
+    Yield the chunks, but stop after max_records records (per input file) and
+    shorten the last chunk if necessary. No further chunks are read after that.
+    """
+    if max_records is None:
+        yield from chunks
+        return
+    if max_records <= 0:
+        return
+    remaining = max_records
+    format = None
+    for chunk_tuple in chunks:
+        if format is None:
+            format = _chunk_format(chunk_tuple[0])
+        limited = []
+        count = 0
+        for chunk in chunk_tuple:
+            length, count = _first_records(chunk, remaining, format)
+            limited.append(chunk[:length])
+        yield tuple(limited)
+        remaining -= count
+        if remaining <= 0:
+            return
+
+
 class ReaderProcess(mpctx_Process):
     """
     Read chunks of FASTA or FASTQ data (single-end or paired) and send them to a worker.
@@ -38,6 +383,26 @@ class ReaderProcess(mpctx_Process):
     - sends the chunk to connections[index]
 
     and finally sends the stop token -1 ("poison pills") to all connections.
+
+    BGZF-compressed input files are decompressed using multiple threads.
+    For paired-end input, each of the two files is decompressed in its own
+    background thread (or process), so that both are decompressed in parallel.
+
+    If shared memory buffers are provided, the chunk is not sent over the connection.
+    Instead, it is copied into the shared memory buffer of the worker, and only the
+    lengths of the chunks are sent.
+
+    If min_buffer_size is smaller than buffer_size, the size of the chunks is adjusted
+    between these bounds using a ChunkSizeTuner.
+
+    The main process can clear the writer_ready Event to stop the reader from handing
+    out more work.
+
+    If sample_fraction is given, only a pseudo-random subset of the chunks
+    (see _sample_chunks()) is sent to the workers; the others are skipped.
+
+    If max_records is given, the reader stops after that many records (per input
+    file) and does not read the rest of the input.
     """
 
     def __init__(
@@ -47,15 +412,33 @@ class ReaderProcess(mpctx_Process):
         queue: multiprocessing.Queue,
         buffer_size: int,
         stdin_fd,
+        shared_buffers: Optional[Sequence[SharedMemory]] = None,
+        decompression_threads: int = 1,
+        min_buffer_size: Optional[int] = None,
+        writer_ready: Optional[Any] = None,
+        max_records: Optional[int] = None,
+        sample_fraction: Optional[float] = None,
     ):
         """
         Args:
             paths: path to input files
             connections: a list of Connection objects, one for each worker.
-            queue: a Queue of worker indices. A worker writes its own index into this
-                queue to notify the reader that it is ready to receive more data.
-            buffer_size:
+            queue: a Queue of (worker index, processing time) tuples. A worker writes
+                its own index into this queue to notify the reader that it is ready
+                to receive more data. The processing time is the time in seconds it
+                needed for its previous chunk (or None if there was none).
+            buffer_size: Maximum size of a chunk
             stdin_fd:
+            shared_buffers: Optional list of SharedMemory objects, one for each worker.
+                Each must be large enough to hold one chunk from each input file.
+            decompression_threads: Number of threads to use for decompressing BGZF
+                input
+            min_buffer_size: Minimum size of a chunk. If None, all chunks are
+                (up to) buffer_size bytes.
+            writer_ready: Optional Event. Before a chunk is sent to a worker, the reader
+                waits until this is set.
+            max_records: Maximum number of records to read from each input file
+            sample_fraction: Fraction of the chunks to send to workers
 
         Note:
             This expects the paths to the input files as strings because these can be pickled
@@ -73,6 +456,16 @@ class ReaderProcess(mpctx_Process):
         self.queue = queue
         self.buffer_size = buffer_size
         self.stdin_fd = stdin_fd
+        self.shared_buffers = shared_buffers
+        self.decompression_threads = decompression_threads
+        self.min_buffer_size = min_buffer_size
+        self.writer_ready = writer_ready
+        self.max_records = max_records
+        self.sample_fraction = sample_fraction
+        self._tuner: Optional[ChunkSizeTuner] = None
+        self._limited_files: List[LimitedReader] = []
+        # Size of the chunk (of the first file) last sent to each worker
+        self._sent_sizes = [0] * len(connections)
 
     def run(self):
         if self.stdin_fd != -1:
@@ -80,12 +473,32 @@ class ReaderProcess(mpctx_Process):
             sys.stdin = os.fdopen(self.stdin_fd)
         try:
             with ExitStack() as stack:
-                files = [
-                    stack.enter_context(xopen_rb_raise_limit(path))
-                    for path in self._paths
-                ]
+                files = [stack.enter_context(self._open(path)) for path in self._paths]
+                minimum = self.min_buffer_size
+                if minimum is not None and minimum < self.buffer_size:
+                    self._tuner = ChunkSizeTuner(minimum, self.buffer_size)
+                    self._limited_files = [
+                        LimitedReader(
+                            f,
+                            self._tuner.size,
+                            min_newlines=8 if len(files) == 2 else 0,
+                        )
+                        for f in files
+                    ]
+                    files = self._limited_files
+                n_chunks = n_bytes = 0
                 for index, chunks in enumerate(self._read_chunks(*files)):
+                    n_chunks += 1
+                    n_bytes += len(chunks[0])
                     self.send_to_worker(index, *chunks)
+            if self._tuner is not None and n_chunks > 0:
+                logger.debug(
+                    "Sent %d chunks with an average size of %.0f bytes to workers "
+                    "(final chunk size limit %d bytes)",
+                    n_chunks,
+                    n_bytes / n_chunks,
+                    self._tuner.size,
+                )
             self.shutdown()
         except Exception as e:
             # TODO better send this to a common "something went wrong" Queue
@@ -93,113 +506,416 @@ class ReaderProcess(mpctx_Process):
                 connection.send(-2)
                 connection.send((e, traceback.format_exc()))
 
+    def _open(self, path: str):
+        return _open_input(path, len(self._paths), self.decompression_threads)
+
     def _read_chunks(self, *files) -> Iterator[Tuple[memoryview, ...]]:
-        if len(files) == 1:
-            for chunk in dnaio.read_chunks(files[0], self.buffer_size):
-                yield (chunk,)
-        elif len(files) == 2:
-            for chunks in dnaio.read_paired_chunks(
-                files[0], files[1], self.buffer_size
-            ):
-                yield chunks
-        else:
-            raise NotImplementedError
+        return _limit_chunks(
+            _sample_chunks(_read_chunks(files, self.buffer_size), self.sample_fraction),
+            self.max_records,
+        )
+
+    def _get_worker(self) -> int:
+        """Wait for a worker to request work and return its index"""
+        start_time = time.perf_counter()
+        worker_index, processing_time = self.queue.get()
+        wait_time = time.perf_counter() - start_time
+        if self._tuner is not None:
+            self._tuner.update(
+                self._sent_sizes[worker_index], processing_time, wait_time
+            )
+            for f in self._limited_files:
+                f.limit = self._tuner.size
+        return worker_index
 
     def send_to_worker(self, chunk_index, chunk1, chunk2=None):
-        worker_index = self.queue.get()
+        if self.writer_ready is not None:
+            # Wait until the main process has caught up with writing
+            self.writer_ready.wait()
+        worker_index = self._get_worker()
+        self._sent_sizes[worker_index] = len(chunk1)
         connection = self.connections[worker_index]
         connection.send(chunk_index)
-        connection.send_bytes(chunk1)
-        if chunk2 is not None:
-            connection.send_bytes(chunk2)
+        chunks = (chunk1,) if chunk2 is None else (chunk1, chunk2)
+        if self.shared_buffers is None:
+            for chunk in chunks:
+                connection.send_bytes(chunk)
+            return
+        # The worker has requested work, so it is done with the previous
+        # chunk and we can overwrite its buffer
+        buf = self.shared_buffers[worker_index].buf
+        assert buf is not None
+        offset = 0
+        for chunk in chunks:
+            buf[offset : offset + len(chunk)] = chunk
+            offset += len(chunk)
+        connection.send(tuple(len(chunk) for chunk in chunks))
 
     def shutdown(self):
         # Send poison pills to all workers
         for _ in range(len(self.connections)):
-            worker_index = self.queue.get()
+            worker_index, _ = self.queue.get()
             self.connections[worker_index].send(-1)
 
 
+class MemoryViewReader(io.RawIOBase):
+    """
+    Binary file-like object for reading from a memoryview without copying it first
+    """
+
+    def __init__(self, buf: memoryview):
+        self._buf = buf
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._buf) - self._pos)
+        b[:n] = self._buf[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def peek(self, size: int = 0) -> bytes:
+        return bytes(self._buf[self._pos : self._pos + max(size, 1)])
+
+    def close(self) -> None:
+        self._buf.release()
+        super().close()
+
+
+class StatisticsAggregator:
+    """
+    Combine statistics updates sent by the workers while they are running
+
+    Each update consists of the statistics for the chunks that a worker has
+    processed since its previous update (read counts, filter and length
+    statistics), which are added up, and the statistics collected by the modifiers
+    of the worker’s pipeline (such as adapter statistics). The modifiers keep
+    accumulating their statistics for the whole run, so for these, the latest
+    update of each worker replaces the previous one.
+
+    If a callback is given, it is called with the total statistics at most every
+    interval seconds.
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[Statistics], None]] = None,
+        interval: float = 60,
+    ):
+        self._chunk_stats = Statistics()
+        self._modifier_stats: Dict[int, Statistics] = {}
+        self._callback = callback
+        self._interval = interval
+        self._last_callback_time = time.monotonic()
+
+    def update(
+        self, worker_id: int, chunk_stats: Statistics, modifier_stats: Statistics
+    ) -> None:
+        self._chunk_stats += chunk_stats
+        self._modifier_stats[worker_id] = modifier_stats
+        now = time.monotonic()
+        if (
+            self._callback is not None
+            and now - self._last_callback_time >= self._interval
+        ):
+            self._last_callback_time = now
+            self._callback(self.total())
+
+    def total(self) -> Statistics:
+        # Statistics.__iadd__ may take over objects from the added Statistics,
+        # so add copies
+        total = copy.deepcopy(self._chunk_stats)
+        for stats in self._modifier_stats.values():
+            total += copy.deepcopy(stats)
+        return total
+
+
+class WorkerJob:
+    """
+    Everything a worker process needs to know to run a pipeline: The pipeline itself
+    and a description of the input and output files
+
+    If stats_interval is not None, workers send statistics updates (see
+    StatisticsAggregator) at most every stats_interval seconds while running.
+    """
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        inpaths: InputPaths,
+        outfiles: OutputFiles,
+        stats_interval: Optional[float] = None,
+    ):
+        self.pipeline = pipeline
+        self.stats_interval = stats_interval
+        self.n_input_files = len(inpaths.paths)
+        self.interleaved = inpaths.interleaved
+        # Do not store outfiles directly because it contains
+        # _io.BufferedWriter attributes, which cannot be pickled.
+        self.outfiles = outfiles.as_bytesio()
+        self.compression_levels = _compression_levels(outfiles)
+
+
 class WorkerProcess(mpctx_Process):
     """
     The worker repeatedly reads chunks of data from the read_pipe, runs the pipeline on it
     and sends the processed chunks to the write_pipe.
 
+    A worker can run multiple jobs one after another (see WorkerPool). At the start of
+    each job, it receives a WorkerJob over the read_pipe. If it receives -3 instead,
+    it exits.
+
     To notify the reader process that it wants data, it puts its own identifier into the
-    need_work_queue before attempting to read data from the read_pipe.
+    need_work_queue before attempting to read data from the read_pipe. Along with it,
+    it sends the time it needed to process the previous chunk.
+
+    At the end of a job, the worker sends -1 followed by a (chunk statistics,
+    modifier statistics) tuple (see StatisticsAggregator). If requested in the
+    WorkerJob, the same is sent regularly while running, preceded by -4 instead.
+
+    If a shared_buffer is given, the reader puts the chunks into it and only sends
+    their lengths over the read_pipe.
+
+    Processed chunks for output files that are GzipMemberWriter instances are
+    compressed by the worker before they are sent. Only the chunks that are not
+    empty are sent, packed into a single message (see _pack_chunks()).
     """
 
     def __init__(
         self,
         id_: int,
-        pipeline: Pipeline,
-        inpaths: InputPaths,
-        orig_outfiles: OutputFiles,
         read_pipe: Connection,
         write_pipe: Connection,
         need_work_queue: multiprocessing.Queue,
+        shared_buffer: Optional[SharedMemory] = None,
     ):
         super().__init__()
         self._id = id_
-        self._pipeline = pipeline
-        self._n_input_files = len(inpaths.paths)
-        self._interleaved_input = inpaths.interleaved
         self._read_pipe = read_pipe
         self._write_pipe = write_pipe
         self._need_work_queue = need_work_queue
-        # Do not store orig_outfiles directly because it contains
-        # _io.BufferedWriter attributes, which cannot be pickled.
-        self._original_outfiles = orig_outfiles.as_bytesio()
+        self._shared_buffer = shared_buffer
 
     def run(self):
+        while True:
+            job = self._read_pipe.recv()
+            if job == -3:
+                break
+            try:
+                self._run_job(job)
+            except Exception as e:
+                self._write_pipe.send(-2)
+                self._write_pipe.send((e, traceback.format_exc()))
+                break
+
+    def _run_job(self, job: WorkerJob) -> None:
+        pipeline = job.pipeline
+        stats = Statistics()
+        processing_time = None
+        last_stats_time = time.monotonic()
+        while True:
+            # Notify reader that we need data
+            self._need_work_queue.put((self._id, processing_time))
+            chunk_index = self._read_pipe.recv()
+            if chunk_index == -1:
+                # reader is done
+                break
+            elif chunk_index == -2:
+                # An exception has occurred in the reader
+                e, tb_str = self._read_pipe.recv()
+                logger.error("%s", tb_str)
+                raise e
+
+            start_time = time.perf_counter()
+            files = self._receive_chunks(job.n_input_files)
+            infiles = InputFiles(*files, interleaved=job.interleaved)
+            outfiles = job.outfiles.as_bytesio()
+            (n, bp1, bp2) = pipeline.process_reads(infiles, outfiles)
+            pipeline.flush()
+            cur_stats = Statistics().collect(n, bp1, bp2, [], pipeline._steps)
+            stats += cur_stats
+            self._send_outfiles(outfiles, chunk_index, n, job.compression_levels)
+            pipeline.close()
+            processing_time = time.perf_counter() - start_time
+            if (
+                job.stats_interval is not None
+                and time.monotonic() - last_stats_time >= job.stats_interval
+            ):
+                self._write_pipe.send(-4)
+                self._write_pipe.send((stats, _modifier_statistics(pipeline)))
+                stats = Statistics()
+                last_stats_time = time.monotonic()
+
+        self._write_pipe.send(-1)
+        self._write_pipe.send((stats, _modifier_statistics(pipeline)))
+
+    def _receive_chunks(self, n_input_files: int) -> List[BinaryIO]:
+        if self._shared_buffer is None:
+            return [
+                io.BytesIO(self._read_pipe.recv_bytes()) for _ in range(n_input_files)
+            ]
+        lengths = self._read_pipe.recv()
+        buf = self._shared_buffer.buf
+        assert buf is not None
+        files: List[BinaryIO] = []
+        offset = 0
+        for length in lengths:
+            files.append(MemoryViewReader(buf[offset : offset + length]))  # type: ignore
+            offset += length
+        return files
+
+    def _send_outfiles(
+        self,
+        outfiles: OutputFiles,
+        chunk_index: int,
+        n_reads: int,
+        compression_levels: List[Optional[int]],
+    ):
+        self._write_pipe.send(chunk_index)
+        self._write_pipe.send_bytes(
+            _pack_chunks(n_reads, _processed_chunks(outfiles, compression_levels))
+        )
+
+
+class WorkerPool:
+    """
+    A set of worker processes that can run multiple pipelines one after another
+    (see ParallelPipelineRunner)
+
+    The worker processes are started and the shared memory buffers are allocated
+    only once. This saves time when many small inputs need to be processed.
+    The pool can only be used for inputs consisting of at most n_input_files files.
+
+    Use close() to stop the workers when the pool is no longer needed.
+    """
+
+    def __init__(
+        self,
+        n_workers: int,
+        buffer_size: Optional[int] = None,
+        n_input_files: int = 2,
+    ):
+        if buffer_size is None:
+            buffer_size = _default_buffer_size(n_workers)
+        self.n_workers = n_workers
+        self.buffer_size = buffer_size
+        self.n_input_files = n_input_files
+        self.closed = False
+        self.writer_ready = mpctx.Event()
+        self.writer_ready.set()
+        self.need_work_queue: multiprocessing.Queue = mpctx.Queue()
+        self.shared_buffers = self._create_shared_buffers(
+            n_workers, buffer_size * n_input_files
+        )
+        # Jobs and chunks are sent to the workers through these connections
+        self.input_connections: List[Connection] = []
+        # Processed chunks are received from the workers through these connections
+        self.output_connections: List[Connection] = []
+        self._workers: List[WorkerProcess] = []
+        for index in range(n_workers):
+            input_r, input_w = mpctx.Pipe(duplex=False)
+            output_r, output_w = mpctx.Pipe(duplex=False)
+            worker = WorkerProcess(
+                index,
+                input_r,
+                output_w,
+                self.need_work_queue,
+                None if self.shared_buffers is None else self.shared_buffers[index],
+            )
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+            self.input_connections.append(input_w)
+            self.output_connections.append(output_r)
+
+    @staticmethod
+    def _create_shared_buffers(n: int, size: int) -> Optional[List[SharedMemory]]:
+        """
+        Return a list of n shared memory buffers of the given size or None if they
+        cannot be allocated. (Docker, for example, limits /dev/shm to 64 MB by default.)
+        """
+        if os.path.isdir("/dev/shm") and shutil.disk_usage("/dev/shm").free < n * size:
+            logger.debug("Not enough shared memory available, using pipes instead")
+            return None
+        buffers: List[SharedMemory] = []
         try:
-            stats = Statistics()
-            while True:
-                # Notify reader that we need data
-                self._need_work_queue.put(self._id)
-                chunk_index = self._read_pipe.recv()
-                if chunk_index == -1:
-                    # reader is done
-                    break
-                elif chunk_index == -2:
-                    # An exception has occurred in the reader
-                    e, tb_str = self._read_pipe.recv()
-                    logger.error("%s", tb_str)
-                    raise e
-
-                files = [
-                    io.BytesIO(self._read_pipe.recv_bytes())
-                    for _ in range(self._n_input_files)
-                ]
-                infiles = InputFiles(*files, interleaved=self._interleaved_input)
-                outfiles = self._original_outfiles.as_bytesio()
-                (n, bp1, bp2) = self._pipeline.process_reads(infiles, outfiles)
-                self._pipeline.flush()
-                cur_stats = Statistics().collect(n, bp1, bp2, [], self._pipeline._steps)
-                stats += cur_stats
-                self._send_outfiles(outfiles, chunk_index, n)
-                self._pipeline.close()
+            for _ in range(n):
+                buffers.append(SharedMemory(create=True, size=size))
+        except OSError as e:
+            logger.debug(
+                "Could not allocate shared memory (%s), using pipes instead", e
+            )
+            for buffer in buffers:
+                buffer.close()
+                buffer.unlink()
+            return None
+        return buffers
 
-            m = self._pipeline._modifiers
-            modifier_stats = Statistics().collect(
-                0, 0, 0 if self._pipeline.paired else None, m, []
+    def start_job(
+        self,
+        pipeline: Pipeline,
+        inpaths: InputPaths,
+        outfiles: OutputFiles,
+        stats_interval: Optional[float] = None,
+    ) -> None:
+        """Make all workers wait for chunks to process with the given pipeline"""
+        if self.closed:
+            raise ValueError("Worker pool has been closed")
+        if len(inpaths.paths) > self.n_input_files:
+            raise ValueError(
+                f"Worker pool cannot be used for more than {self.n_input_files} "
+                "input file(s)"
             )
-            stats += modifier_stats
-            self._write_pipe.send(-1)
-            self._write_pipe.send(stats)
-        except Exception as e:
-            self._write_pipe.send(-2)
-            self._write_pipe.send((e, traceback.format_exc()))
+        # Pickle the job only once
+        job = ForkingPickler.dumps(
+            WorkerJob(pipeline, inpaths, outfiles, stats_interval)
+        )
+        for connection in self.input_connections:
+            connection.send_bytes(job)
 
-    def _send_outfiles(self, outfiles: OutputFiles, chunk_index: int, n_reads: int):
-        self._write_pipe.send(chunk_index)
-        self._write_pipe.send(n_reads)
+    def close(self) -> None:
+        """Stop the workers after they have finished the current job"""
+        if self.closed:
+            return
+        for connection in self.input_connections:
+            connection.send(-3)
+        for worker in self._workers:
+            worker.join()
+        self._release()
+
+    def terminate(self) -> None:
+        """Stop the workers immediately"""
+        if self.closed:
+            return
+        for worker in self._workers:
+            worker.terminate()
+            worker.join()
+        self._release()
+
+    def _release(self) -> None:
+        for connection in self.input_connections + self.output_connections:
+            connection.close()
+        if self.shared_buffers is not None:
+            for buffer in self.shared_buffers:
+                buffer.close()
+                buffer.unlink()
+            self.shared_buffers = None
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
-        for f in outfiles:
-            f.flush()
-            assert isinstance(f, io.BytesIO)
-            processed_chunk = f.getvalue()
-            self._write_pipe.send_bytes(processed_chunk)
+
+def _chunk_write_function(outfile):
+    # Chunks for a GzipMemberWriter have already been compressed by the workers
+    if isinstance(outfile, GzipMemberWriter):
+        return outfile.write_compressed
+    return outfile.write
 
 
 class OrderedChunkWriter:
@@ -207,25 +923,83 @@ class OrderedChunkWriter:
     We may receive chunks of processed data from worker processes
     in any order. This class writes them to an output file in
     the correct order.
+
+    Chunks that contain no data for this output file may be omitted. In that
+    case, skip_to() needs to be called with the index of the first chunk that has
+    not been received yet (for any output file) to write the chunks that were
+    waiting for the omitted ones.
     """
 
     def __init__(self, outfile):
         self._chunks = dict()
         self._current_index = 0
-        self._outfile = outfile
+        self._write = _chunk_write_function(outfile)
+        # Total size of the chunks that are waiting to be written
+        self.buffered_bytes = 0
 
     def write(self, data, index):
         """ """
         self._chunks[index] = data
+        self.buffered_bytes += len(data)
+        self._write_consecutive()
+
+    def skip_to(self, index):
+        """
+        Write all chunks with an index lower than the given one. Chunks with
+        these indices that have not been passed to write() are considered empty.
+        """
+        if index <= self._current_index:
+            return
+        for i in sorted(i for i in self._chunks if i < index):
+            self._write_chunk(i)
+        self._current_index = index
+        self._write_consecutive()
+
+    def _write_consecutive(self):
         while self._current_index in self._chunks:
-            self._outfile.write(self._chunks[self._current_index])
-            del self._chunks[self._current_index]
+            self._write_chunk(self._current_index)
             self._current_index += 1
 
+    def _write_chunk(self, index):
+        data = self._chunks.pop(index)
+        self._write(data)
+        self.buffered_bytes -= len(data)
+
     def wrote_everything(self):
         return not self._chunks
 
 
+class UnorderedChunkWriter:
+    """
+    Write chunks of processed data to an output file in the order in which
+    they are received.
+
+    For paired-end output, the chunks for R1 and R2 are still written in the
+    same order because the chunks for all output files are received together.
+    """
+
+    def __init__(self, outfile):
+        self._write = _chunk_write_function(outfile)
+        self.buffered_bytes = 0
+
+    def write(self, data, index):
+        self._write(data)
+
+    def skip_to(self, index):
+        pass
+
+    def wrote_everything(self):
+        return True
+
+
+def _create_chunk_writers(
+    outfiles: OutputFiles, ordered: bool
+) -> List[Union[OrderedChunkWriter, UnorderedChunkWriter]]:
+    if ordered:
+        return [OrderedChunkWriter(f) for f in outfiles]
+    return [UnorderedChunkWriter(f) for f in outfiles]
+
+
 class PipelineRunner(ABC):
     """
     A read processing pipeline
@@ -254,23 +1028,55 @@ class ParallelPipelineRunner(PipelineRunner):
     """
     Run a Pipeline in parallel
 
-    - At construction, a reader process is spawned.
-    - When run() is called, as many worker processes as requested are spawned.
-    - In the main process, results are written to the output files in the correct
-      order, and statistics are aggregated.
+    - The worker processes are taken from a WorkerPool. If no pool is given,
+      a new one with n_workers workers is created and closed when the runner
+      is closed.
+    - At construction, the workers are sent the pipeline and a reader process is
+      spawned.
+    - When run() is called, results are written to the output files in the correct
+      order (or, if ordered is False, in the order in which they are received)
+      in the main process, and statistics are aggregated.
 
-    If a worker needs work, it puts its own index into a Queue() (_need_work_queue).
+    If a worker needs work, it puts its own index into a Queue() (need_work_queue).
     The reader process listens on this queue and sends the raw data to the
     worker that has requested work. For sending the data from reader to worker,
-    a Connection() is used. There is one such connection for each worker (self._pipes).
+    a Connection() is used. There is one such connection for each worker.
 
     For sending the processed data from the worker to the main process, there
     is a second set of connections, again one for each worker.
 
+    If possible, the raw data is not sent over the connection itself, but through
+    a shared memory buffer that is allocated for each worker.
+    A worker only requests new work after it has finished processing the previous
+    chunk, so the reader can then safely overwrite the buffer of that worker.
+
+    The chunk size is adjusted while running to be between min_buffer_size and
+    buffer_size (see ChunkSizeTuner). By default, the maximum is 4 MB (more when
+    there are many workers), and the minimum is 64 kB. If a pool is given,
+    its buffer size is used as the maximum.
+
+    Chunks that arrive out of order are kept in memory until they can be written.
+    If their total size exceeds max_buffered_bytes, the main process clears the
+    writer_ready Event, which makes the reader stop handing out work until the
+    missing chunks have arrived and the buffered ones could be written. This cannot
+    deadlock because the reader sends out chunks in order, so the missing chunks are
+    always already being processed by some worker.
+
     When the reader is finished, it sends 'poison pills' to all workers.
     When a worker receives this, it sends a poison pill to the main process,
-    followed by a Statistics object that contains statistics about all the reads
-    processed by that worker.
+    followed by the statistics about the reads processed by that worker. The worker
+    then waits for the next job.
+
+    If max_reads is given, the reader process stops after that many reads (or
+    pairs). The workers then finish as usual.
+
+    If sample_fraction is given, the reader process skips chunks so that only
+    about that fraction of the reads is processed (see _sample_chunks()).
+    The chunk size is then not adjusted so that the selection is deterministic.
+
+    If a stats_callback is given, workers also send statistics while running, and
+    the callback is called with the statistics collected so far (at most) every
+    stats_interval seconds.
     """
 
     def __init__(
@@ -281,16 +1087,41 @@ class ParallelPipelineRunner(PipelineRunner):
         progress: Progress,
         n_workers: int,
         buffer_size: Optional[int] = None,
+        min_buffer_size: Optional[int] = None,
+        ordered: bool = True,
+        max_buffered_bytes: Optional[int] = None,
+        pool: Optional[WorkerPool] = None,
+        stats_callback: Optional[Callable[[Statistics], None]] = None,
+        stats_interval: float = 60,
+        max_reads: Optional[int] = None,
+        sample_fraction: Optional[float] = None,
     ):
         super().__init__(pipeline, progress)
-        self._n_workers = n_workers
-        self._need_work_queue: multiprocessing.Queue = mpctx.Queue()
-        self._buffer_size = 4 * 1024**2 if buffer_size is None else buffer_size
+        self._owns_pool = pool is None
+        if pool is None:
+            pool = WorkerPool(n_workers, buffer_size, len(inpaths.paths))
+        self._pool = pool
+        self._n_workers = pool.n_workers
+        self._ordered = ordered
+        self._max_buffered_bytes = max_buffered_bytes
+        self._buffer_size = pool.buffer_size
+        if min_buffer_size is None:
+            min_buffer_size = 64 * 1024
+        self._min_buffer_size = min(min_buffer_size, self._buffer_size)
+        if sample_fraction is not None:
+            # The selected chunks must not depend on timing
+            self._min_buffer_size = self._buffer_size
         self._outfiles = outfiles
         self._inpaths = inpaths
-        # the workers read from these connections
-        connections = [mpctx.Pipe(duplex=False) for _ in range(self._n_workers)]
-        self._connections, connw = zip(*connections)
+        self._stats_callback = stats_callback
+        self._stats_interval = stats_interval
+        self._pool.start_job(
+            pipeline,
+            inpaths,
+            outfiles,
+            stats_interval if stats_callback is not None else None,
+        )
+        self._pool.writer_ready.set()
         try:
             fileno = sys.stdin.fileno()
         except io.UnsupportedOperation:
@@ -299,63 +1130,101 @@ class ParallelPipelineRunner(PipelineRunner):
             fileno = -1
         self._reader_process = ReaderProcess(
             *inpaths.paths,
-            connections=connw,
-            queue=self._need_work_queue,
+            connections=pool.input_connections,
+            queue=pool.need_work_queue,
             buffer_size=self._buffer_size,
             stdin_fd=fileno,
+            shared_buffers=pool.shared_buffers,
+            decompression_threads=_decompression_threads(self._n_workers),
+            min_buffer_size=self._min_buffer_size,
+            writer_ready=pool.writer_ready if max_buffered_bytes is not None else None,
+            max_records=_max_records(max_reads, inpaths),
+            sample_fraction=sample_fraction,
         )
         self._reader_process.daemon = True
         self._reader_process.start()
 
-    def _start_workers(self) -> Tuple[List[WorkerProcess], List[Connection]]:
-        workers = []
-        connections = []
-        for index in range(self._n_workers):
-            conn_r, conn_w = mpctx.Pipe(duplex=False)
-            connections.append(conn_r)
-            worker = WorkerProcess(
-                index,
-                self._pipeline,
-                self._inpaths,
-                self._outfiles,
-                self._connections[index],
-                conn_w,
-                self._need_work_queue,
-            )
-            worker.daemon = True
-            worker.start()
-            workers.append(worker)
-        return workers, connections
-
     def run(self) -> Statistics:
-        workers, connections = self._start_workers()
-        writers = []
-        for f in self._outfiles:
-            writers.append(OrderedChunkWriter(f))
-        stats = Statistics()
+        try:
+            return self._run()
+        except BaseException:
+            # The workers may be in an inconsistent state
+            self._pool.terminate()
+            raise
+
+    def _run(self) -> Statistics:
+        connections = list(self._pool.output_connections)
+        writers = _create_chunk_writers(self._outfiles, self._ordered)
+        aggregator = StatisticsAggregator(self._stats_callback, self._stats_interval)
+        peak_buffered_bytes = 0
+        # Indices of the received chunks that are not below next_index
+        received: Set[int] = set()
+        # Index of the first chunk that has not been received
+        next_index = 0
+        # Indices of the writers that may have chunks waiting to be written
+        waiting: Set[int] = set()
         while connections:
             ready_connections: List[Any] = multiprocessing.connection.wait(connections)
             for connection in ready_connections:
                 chunk_index = self._try_receive(connection)
-                if chunk_index == -1:
-                    # the worker is done
-                    cur_stats = self._try_receive(connection)
-                    stats += cur_stats
-                    connections.remove(connection)
+                if chunk_index in (-1, -4):
+                    # -1: the worker is done, -4: statistics update
+                    aggregator.update(
+                        self._pool.output_connections.index(connection),
+                        *self._try_receive(connection),
+                    )
+                    if chunk_index == -1:
+                        connections.remove(connection)
                     continue
 
-                number_of_reads = self._try_receive(connection)
+                number_of_reads, chunks = _unpack_chunks(connection.recv_bytes())
                 self._progress.update(number_of_reads)
-                for writer in writers:
-                    data = connection.recv_bytes()
-                    writer.write(data, chunk_index)
+                for file_index, data in chunks:
+                    writers[file_index].write(data, chunk_index)
+                    waiting.add(file_index)
+                # Chunks that are empty for an output file are not sent, so the
+                # writers need to be told which chunks are complete
+                received.add(chunk_index)
+                while next_index in received:
+                    received.remove(next_index)
+                    next_index += 1
+                for file_index in list(waiting):
+                    writers[file_index].skip_to(next_index)
+                    if writers[file_index].wrote_everything():
+                        waiting.remove(file_index)
+                buffered_bytes = self._update_writer_ready(
+                    self._pool.writer_ready,
+                    [writers[file_index] for file_index in waiting],
+                    self._max_buffered_bytes,
+                )
+                peak_buffered_bytes = max(peak_buffered_bytes, buffered_bytes)
+        logger.debug(
+            "Peak size of processed chunks waiting to be written: %d bytes",
+            peak_buffered_bytes,
+        )
         for writer in writers:
             assert writer.wrote_everything()
-        for w in workers:
-            w.join()
         self._reader_process.join()
         self._progress.close()
-        return stats
+        return aggregator.total()
+
+    @staticmethod
+    def _update_writer_ready(
+        writer_ready,
+        writers: Sequence[Union["OrderedChunkWriter", "UnorderedChunkWriter"]],
+        max_buffered_bytes: Optional[int],
+    ) -> int:
+        """
+        Clear the writer_ready Event if the writers buffer more than max_buffered_bytes
+        and set it otherwise. Return the number of buffered bytes.
+        """
+        buffered_bytes = sum(writer.buffered_bytes for writer in writers)
+        if max_buffered_bytes is not None:
+            if buffered_bytes > max_buffered_bytes:
+                writer_ready.clear()
+            else:
+                writer_ready.set()
+        return buffered_bytes
 
     @staticmethod
     def _try_receive(connection):
@@ -375,6 +1244,162 @@ class ParallelPipelineRunner(PipelineRunner):
             raise e
         return result
 
+    def close(self) -> None:
+        # Workers that were started after the output files were opened have
+        # inherited their file descriptors, so stop them first
+        if self._owns_pool:
+            self._pool.close()
+        self._outfiles.close()
+
+
+class ThreadPipelineRunner(PipelineRunner):
+    """
+    Run a Pipeline in parallel using threads instead of processes
+
+    This only gives a speedup on free-threaded builds of CPython (without the GIL).
+    Since the threads share memory, no data needs to be sent between processes.
+
+    - The main thread reads chunks from the input files and submits them to a
+      thread pool.
+    - Each thread processes chunks with its own copy of the pipeline because
+      modifiers and steps keep state.
+    - The main thread writes the processed chunks to the output files in the correct
+      order (or, if ordered is False, in the order in which they are finished) and
+      aggregates statistics.
+
+    At most two chunks per thread are read ahead, which limits memory usage.
+
+    Because it processes the input in chunks, this runner is also used on a
+    single core when only a sample of the chunks is to be processed
+    (sample_fraction, see _sample_chunks()).
+    """
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        inpaths: InputPaths,
+        outfiles: OutputFiles,
+        progress: Progress,
+        n_workers: int,
+        buffer_size: Optional[int] = None,
+        ordered: bool = True,
+        max_reads: Optional[int] = None,
+        sample_fraction: Optional[float] = None,
+    ):
+        super().__init__(pipeline, progress)
+        self._inpaths = inpaths
+        self._max_records = _max_records(max_reads, inpaths)
+        self._sample_fraction = sample_fraction
+        self._outfiles = outfiles
+        self._n_workers = n_workers
+        if buffer_size is None:
+            buffer_size = _default_buffer_size(n_workers)
+        self._buffer_size = buffer_size
+        self._ordered = ordered
+        self._bytesio_outfiles = outfiles.as_bytesio()
+        self._compression_levels = _compression_levels(outfiles)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pipelines: List[Pipeline] = []
+
+    def _thread_pipeline(self) -> Pipeline:
+        """Return the copy of the pipeline that belongs to the current thread"""
+        pipeline = getattr(self._local, "pipeline", None)
+        if pipeline is None:
+            pipeline = copy.deepcopy(self._pipeline)
+            self._local.pipeline = pipeline
+            with self._lock:
+                self._pipelines.append(pipeline)
+        return pipeline
+
+    def _process_chunks(
+        self, chunks: Tuple[bytes, ...]
+    ) -> Tuple[int, List[bytes], Statistics]:
+        pipeline = self._thread_pipeline()
+        infiles = InputFiles(
+            *(io.BytesIO(chunk) for chunk in chunks),
+            interleaved=self._inpaths.interleaved,
+        )
+        outfiles = self._bytesio_outfiles.as_bytesio()
+        (n, bp1, bp2) = pipeline.process_reads(infiles, outfiles)
+        pipeline.flush()
+        stats = Statistics().collect(n, bp1, bp2, [], pipeline._steps)
+        processed_chunks = _processed_chunks(outfiles, self._compression_levels)
+        pipeline.close()
+        return n, processed_chunks, stats
+
+    def _finished(self, pending: Deque[Tuple[int, Future]]) -> List[Tuple[int, Any]]:
+        """
+        Wait until at least one of the pending futures is done, remove the finished
+        ones from pending and return them as (chunk index, result) tuples
+        """
+        if self._ordered:
+            index, future = pending.popleft()
+            return [(index, future.result())]
+        done, _ = concurrent.futures.wait(
+            [future for _, future in pending],
+            return_when=concurrent.futures.FIRST_COMPLETED,
+        )
+        finished = [(index, future) for index, future in pending if future in done]
+        for item in finished:
+            pending.remove(item)
+        return [(index, future.result()) for index, future in finished]
+
+    def run(self) -> Statistics:
+        writers = _create_chunk_writers(self._outfiles, self._ordered)
+        stats = Statistics()
+        pending: Deque[Tuple[int, Future]] = collections.deque()
+
+        def write_finished():
+            nonlocal stats
+            for index, (n, processed_chunks, cur_stats) in self._finished(pending):
+                self._progress.update(n)
+                for writer, processed_chunk in zip(writers, processed_chunks):
+                    writer.write(processed_chunk, index)
+                stats += cur_stats
+
+        paths = self._inpaths.paths
+        with ExitStack() as stack:
+            files = [
+                stack.enter_context(
+                    _open_input(
+                        path, len(paths), _decompression_threads(self._n_workers)
+                    )
+                )
+                for path in paths
+            ]
+            executor = stack.enter_context(
+                ThreadPoolExecutor(max_workers=self._n_workers)
+            )
+            try:
+                all_chunks = _limit_chunks(
+                    _sample_chunks(
+                        _read_chunks(files, self._buffer_size), self._sample_fraction
+                    ),
+                    self._max_records,
+                )
+                for index, chunks in enumerate(all_chunks):
+                    if len(pending) >= 2 * self._n_workers:
+                        write_finished()
+                    future = executor.submit(
+                        self._process_chunks, tuple(bytes(chunk) for chunk in chunks)
+                    )
+                    pending.append((index, future))
+                while pending:
+                    write_finished()
+            except BaseException:
+                for _, future in pending:
+                    future.cancel()
+                raise
+        for writer in writers:
+            assert writer.wrote_everything()
+        # If no chunk was processed (empty input), no thread has made a copy of the
+        # pipeline, but the statistics should still list the adapters etc.
+        for pipeline in self._pipelines or [self._pipeline]:
+            stats += _modifier_statistics(pipeline)
+        self._progress.close()
+        return stats
+
     def close(self) -> None:
         self._outfiles.close()
 
@@ -390,14 +1415,19 @@ class SerialPipelineRunner(PipelineRunner):
         infiles: InputFiles,
         outfiles: OutputFiles,
         progress: Progress,
+        max_reads: Optional[int] = None,
     ):
         super().__init__(pipeline, progress)
         self._infiles = infiles
         self._outfiles = outfiles
+        self._max_reads = max_reads
 
     def run(self) -> Statistics:
         (n, total1_bp, total2_bp) = self._pipeline.process_reads(
-            self._infiles, self._outfiles, progress=self._progress
+            self._infiles,
+            self._outfiles,
+            progress=self._progress,
+            max_reads=self._max_reads,
         )
         if self._progress is not None:
             self._progress.close()
@@ -412,6 +1442,12 @@ class SerialPipelineRunner(PipelineRunner):
         self._pipeline.close()
 
 
+def _free_threading_enabled() -> bool:
+    """Return whether this is a free-threaded CPython build running without the GIL"""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
 def run_pipeline(
     pipeline: Pipeline,
     inpaths: InputPaths,
@@ -419,11 +1455,22 @@ def run_pipeline(
     cores: int,
     progress: Union[bool, Progress, None] = None,
     buffer_size: Optional[int] = None,
+    min_buffer_size: Optional[int] = None,
+    ordered: bool = True,
+    max_buffered_bytes: Optional[int] = None,
+    pool: Optional[WorkerPool] = None,
+    stats_callback: Optional[Callable[[Statistics], None]] = None,
+    stats_interval: float = 60,
+    max_reads: Optional[int] = None,
+    sample_fraction: Optional[float] = None,
 ) -> Statistics:
     """
     Run a pipeline.
 
-    This uses a SerialPipelineRunner if cores is 1 and a ParallelPipelineRunner otherwise.
+    This uses a SerialPipelineRunner if cores is 1. Otherwise, a ThreadPipelineRunner
+    is used if the GIL is disabled (on free-threaded Python builds) and a
+    ParallelPipelineRunner if not. When sampling on a single core, a
+    ThreadPipelineRunner with one thread is used.
 
     Args:
         inpaths:
@@ -432,7 +1479,30 @@ def run_pipeline(
             processes, there will be one extra process for reading the input file(s))
         progress: Set to False for no progress bar, True for Cutadapt’s default progress bar,
             or use an object that supports .update() and .close() (e.g. a tqdm instance)
-        buffer_size: Forwarded to `ParallelPipelineRunner()`. Ignored if cores is 1.
+        buffer_size: Forwarded to `ParallelPipelineRunner()` or `ThreadPipelineRunner()`.
+            Ignored if cores is 1.
+        min_buffer_size: Forwarded to `ParallelPipelineRunner()`. Ignored if cores is 1
+            or if a ThreadPipelineRunner is used.
+        ordered: If False, the processed reads are written in the order in which the
+            worker processes finish them instead of in the input order. Paired-end
+            reads are kept in sync. Ignored if cores is 1.
+        max_buffered_bytes: Maximum total size of processed chunks that are kept in
+            memory while waiting for earlier chunks (None for no limit). When it is
+            exceeded, no more work is handed out until the writer catches up.
+            Ignored if cores is 1 or if a ThreadPipelineRunner is used (which limits
+            the number of chunks in flight instead).
+        pool: If given, a ParallelPipelineRunner that uses the worker processes of this
+            WorkerPool is used (and cores is ignored).
+        stats_callback: If given, this function is called regularly while running
+            with the statistics collected so far. Only supported by the
+            ParallelPipelineRunner and ignored otherwise.
+        stats_interval: Minimum time in seconds between calls of stats_callback
+        max_reads: If given, stop after this many reads (or read pairs). The rest
+            of the input is not read.
+        sample_fraction: If given, process only a deterministic pseudo-random
+            sample of the input chunks of approximately this fraction of the reads.
+            The chunks do not depend on the number of cores unless a buffer_size
+            or a pool is given.
 
     Returns:
         A Statistics object
@@ -442,7 +1512,39 @@ def run_pipeline(
     elif progress is True:
         progress = Progress()
     runner: PipelineRunner
-    if cores > 1:
+    if sample_fraction is not None and buffer_size is None:
+        buffer_size = _default_buffer_size(1)
+    if pool is not None:
+        runner = ParallelPipelineRunner(
+            pipeline,
+            inpaths,
+            outfiles,
+            progress,
+            n_workers=pool.n_workers,
+            min_buffer_size=min_buffer_size,
+            ordered=ordered,
+            max_buffered_bytes=max_buffered_bytes,
+            pool=pool,
+            stats_callback=stats_callback,
+            stats_interval=stats_interval,
+            max_reads=max_reads,
+            sample_fraction=sample_fraction,
+        )
+    elif (cores > 1 and _free_threading_enabled()) or (
+        cores == 1 and sample_fraction is not None
+    ):
+        runner = ThreadPipelineRunner(
+            pipeline,
+            inpaths,
+            outfiles,
+            progress,
+            n_workers=cores,
+            buffer_size=buffer_size,
+            ordered=ordered,
+            max_reads=max_reads,
+            sample_fraction=sample_fraction,
+        )
+    elif cores > 1:
         runner = ParallelPipelineRunner(
             pipeline,
             inpaths,
@@ -450,9 +1552,18 @@ def run_pipeline(
             progress,
             n_workers=cores,
             buffer_size=buffer_size,
+            min_buffer_size=min_buffer_size,
+            ordered=ordered,
+            max_buffered_bytes=max_buffered_bytes,
+            stats_callback=stats_callback,
+            stats_interval=stats_interval,
+            max_reads=max_reads,
+            sample_fraction=sample_fraction,
         )
     else:
-        runner = SerialPipelineRunner(pipeline, inpaths.open(), outfiles, progress)
+        runner = SerialPipelineRunner(
+            pipeline, inpaths.open(), outfiles, progress, max_reads
+        )
 
     with runner:
         statistics = runner.run()
@@ -0,0 +1,212 @@
+"""
+Server mode: Run jobs that are received over a Unix socket
+
+Before Cutadapt can process any reads, the Python interpreter needs to start,
+modules need to be imported, adapter indexes need to be built and, when multiple
+cores are used, worker processes need to be started. For small inputs, this
+takes longer than the actual processing. In server mode (``cutadapt --server SOCKET``),
+this is done only once and the worker processes and pipelines are re-used for all
+jobs.
+
+Pipelines are cached in the server process (see PipelineCache) and sent to the
+worker processes for every job. When adapter objects are copied or unpickled,
+their aligners and k-mer finders are re-created, which is cheap. The expensive
+part (building adapter indexes) is not repeated.
+
+A job is submitted by connecting to the socket and sending a JSON object of the form
+``{"args": [...], "cwd": "..."}``, where ``args`` is the list of command-line
+arguments (as for a normal Cutadapt invocation) and ``cwd`` is the directory
+relative to which paths are interpreted (optional). The client then shuts down the
+writing side of the connection. When the job is finished, the server responds with
+a JSON object, which is either ``{"report": ...}`` with the JSON report (as written
+by ``--json``) or ``{"error": "..."}``, and closes the connection.
+
+Jobs are run one after another. Options that concern the process as a whole
+(such as ``--cores`` and ``--debug``) are taken from the server command line and
+are ignored when given for a job.
+"""
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from cutadapt.cli import (
+    CommandLineError,
+    PipelineCache,
+    get_argument_parser,
+    json_report,
+    run_cutadapt,
+)
+from cutadapt.json import dumps as json_dumps
+from cutadapt.runners import WorkerPool
+from cutadapt.utils import DummyProgress
+
+logger = logging.getLogger()
+
+
+class JobError(Exception):
+    """Raised by submit() when the server reports that a job failed"""
+
+
+def serve(
+    path: str,
+    cores: int,
+    buffer_size: Optional[int] = None,
+    max_jobs: Optional[int] = None,
+) -> None:
+    """
+    Listen on a Unix socket at the given path and run the jobs that are received
+
+    Args:
+        path: Path of the socket. It must not exist and is removed when the
+            server stops.
+        cores: Number of worker processes to use for each job
+        buffer_size: Forwarded to WorkerPool()
+        max_jobs: Stop after this many jobs (None: run until interrupted)
+    """
+    path = os.path.abspath(path)
+    pipeline_cache = PipelineCache()
+    pool: Optional[WorkerPool] = None
+    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server_socket.bind(path)
+    except OSError:
+        server_socket.close()
+        raise
+    try:
+        server_socket.listen()
+        logger.info("Waiting for jobs on %s", path)
+        n_jobs = 0
+        while max_jobs is None or n_jobs < max_jobs:
+            # Start the workers before accepting a connection as they would
+            # otherwise inherit it and keep it open. The pool is closed if a
+            # previous job failed.
+            if cores > 1 and (pool is None or pool.closed):
+                pool = WorkerPool(cores, buffer_size)
+            connection, _ = server_socket.accept()
+            with connection:
+                request = _receive_all(connection)
+                response: Dict[str, Any]
+                try:
+                    response = {
+                        "report": _run_job(
+                            json.loads(request), cores, pool, pipeline_cache
+                        )
+                    }
+                except Exception as e:
+                    logger.debug("Job failed. Traceback:", exc_info=True)
+                    logger.error("Job failed: %s", e)
+                    response = {"error": str(e)}
+                connection.sendall(json_dumps(response).encode())
+            n_jobs += 1
+    finally:
+        server_socket.close()
+        os.unlink(path)
+        if pool is not None:
+            pool.close()
+
+
+def _run_job(
+    request: Dict[str, Any],
+    cores: int,
+    pool: Optional[WorkerPool],
+    pipeline_cache: PipelineCache,
+) -> Dict[str, Any]:
+    start_time = time.time()
+    cmdlineargs = request["args"]
+    logger.info("Running job with parameters: %s", " ".join(cmdlineargs))
+    parser = get_argument_parser()
+    try:
+        args, leftover_args = parser.parse_known_args(args=cmdlineargs)
+    except SystemExit:
+        # The parser has already printed the reason
+        raise CommandLineError("Invalid command-line arguments") from None
+    if leftover_args:
+        raise CommandLineError("unrecognized arguments: " + " ".join(leftover_args))
+    if args.server is not None or args.batch is not None:
+        raise CommandLineError("Options --server and --batch cannot be used for a job")
+    # Standard input and output belong to the server
+    if args.output is None or "-" in args.inputs or args.output == "-":
+        raise CommandLineError(
+            "In server mode, input and output must be files (use -o)"
+        )
+    cwd = os.getcwd()
+    os.chdir(request.get("cwd") or cwd)
+    try:
+        stats, input_paths, paired = run_cutadapt(
+            args, cores, DummyProgress(), None, pool, pipeline_cache, cmdlineargs
+        )
+        report = json_report(
+            stats=stats,
+            cmdlineargs=cmdlineargs,
+            path1=input_paths.paths[0],
+            path2=input_paths.paths[1] if len(input_paths.paths) > 1 else None,
+            cores=cores,
+            paired=paired,
+            gc_content=args.gc_content / 100.0,
+        )
+        if args.json is not None:
+            with open(args.json, "w") as f:
+                f.write(json_dumps(report))
+                f.write("\n")
+    finally:
+        os.chdir(cwd)
+    logger.info("Job finished in %.3f s", time.time() - start_time)
+    return report
+
+
+def _receive_all(connection: socket.socket) -> bytes:
+    parts = []
+    while True:
+        data = connection.recv(65536)
+        if not data:
+            break
+        parts.append(data)
+    return b"".join(parts)
+
+
+def submit(
+    path: str, cmdlineargs: Sequence[str], cwd: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Send a job to the server listening on the Unix socket at path, wait until it
+    has finished and return its report (in the same format as written by ``--json``).
+
+    Relative paths in cmdlineargs are interpreted relative to cwd (by default,
+    the current working directory).
+
+    Raise JobError if the job failed.
+    """
+    request = {"args": list(cmdlineargs), "cwd": os.getcwd() if cwd is None else cwd}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+        client_socket.connect(path)
+        client_socket.sendall(json.dumps(request).encode())
+        client_socket.shutdown(socket.SHUT_WR)
+        response = json.loads(_receive_all(client_socket))
+    if "error" in response:
+        raise JobError(response["error"])
+    return response["report"]
+
+
+def main(argv: Sequence[str]) -> int:  # pragma: no cover
+    """
+    Submit a job to a server from the command line:
+    python -m cutadapt.server SOCKET [cutadapt arguments]
+    """
+    if len(argv) < 1:
+        print("Usage: python -m cutadapt.server SOCKET [options]", file=sys.stderr)
+        return 2
+    try:
+        report = submit(argv[0], argv[1:])
+    except JobError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(json_dumps(report))
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,145 @@
+"""
+Read-only string index that can be shared between processes
+
+An AdapterIndex for thousands of adapters contains millions of strings. Sending
+it to each worker process as a pickled dict means that every worker needs to
+unpickle it and keep its own copy in memory. A SharedIndex instead stores the
+index in a file that is memory-mapped (on Linux, in /dev/shm, that is, in
+memory). When it is pickled, only the path to the file is sent, and the worker
+processes map the same file. The operating system shares the pages between the
+processes.
+
+The file contains an open-addressing hash table. Its layout is:
+
+- header: magic bytes, number of slots (a power of two), number of entries
+- slots: for each slot, 0 if it is empty and the entry index plus one otherwise
+- entries: for each entry, the offset and length of its key and the three
+  integer values
+- keys: all keys (ASCII strings) concatenated
+
+Lookups are somewhat slower than with a dict because they are done in Python.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import weakref
+import zlib
+from typing import Dict, Iterator, Mapping, Optional, Tuple
+
+_HEADER = struct.Struct("<4sQQ")
+_MAGIC = b"CAIX"
+_ENTRY = struct.Struct("<QHIHH")
+
+Value = Tuple[int, int, int]
+
+
+def _shared_directory() -> Optional[str]:
+    return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+class SharedIndex(Mapping[str, Value]):
+    """
+    Map strings to (int, int, int) tuples
+
+    Use SharedIndex.create() to create an index from a dict. The index file is
+    removed when the SharedIndex object that created it is garbage collected;
+    the processes that have mapped it can continue to use it.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._path = path
+        magic, n_slots, n_entries = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            raise ValueError(f"File '{path}' is not an index file")
+        self._n_slots = n_slots
+        self._n_entries = n_entries
+        self._mask = n_slots - 1
+        view = memoryview(self._mmap)
+        self._slots = view[_HEADER.size : _HEADER.size + 4 * n_slots].cast("I")
+        self._entries_offset = _HEADER.size + 4 * n_slots
+        self._keys_offset = self._entries_offset + _ENTRY.size * n_entries
+
+    @classmethod
+    def create(cls, index: Dict[str, Value]) -> "SharedIndex":
+        n_slots = 1
+        while n_slots < 2 * len(index):
+            n_slots *= 2
+        slots = [0] * n_slots
+        entries = []
+        keys = []
+        key_offset = 0
+        for entry_index, (key, value) in enumerate(index.items()):
+            encoded = key.encode("ascii")
+            slot = zlib.crc32(encoded) & (n_slots - 1)
+            while slots[slot]:
+                slot = (slot + 1) & (n_slots - 1)
+            slots[slot] = entry_index + 1
+            entries.append(_ENTRY.pack(key_offset, len(encoded), *value))
+            keys.append(encoded)
+            key_offset += len(encoded)
+        fd, path = tempfile.mkstemp(prefix="cutadapt-index-", dir=_shared_directory())
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, n_slots, len(index)))
+                f.write(struct.pack(f"<{n_slots}I", *slots))
+                f.write(b"".join(entries))
+                f.write(b"".join(keys))
+            shared_index = cls(path)
+        except BaseException:
+            os.unlink(path)
+            raise
+        weakref.finalize(shared_index, os.unlink, path)
+        return shared_index
+
+    def __reduce__(self):
+        return SharedIndex, (self._path,)
+
+    def __deepcopy__(self, memo):
+        # Read-only
+        return self
+
+    def _find(self, key: str) -> int:
+        """Return the entry index for the key or -1 if it is not in the index"""
+        try:
+            encoded = key.encode("ascii")
+        except UnicodeEncodeError:
+            return -1
+        n = len(encoded)
+        slot = zlib.crc32(encoded) & self._mask
+        while True:
+            entry_index = self._slots[slot] - 1
+            if entry_index == -1:
+                return -1
+            key_offset, key_length = _ENTRY.unpack_from(
+                self._mmap, self._entries_offset + _ENTRY.size * entry_index
+            )[:2]
+            if key_length == n:
+                start = self._keys_offset + key_offset
+                if self._mmap[start : start + n] == encoded:
+                    return entry_index
+            slot = (slot + 1) & self._mask
+
+    def __getitem__(self, key: str) -> Value:
+        entry_index = self._find(key)
+        if entry_index == -1:
+            raise KeyError(key)
+        return _ENTRY.unpack_from(
+            self._mmap, self._entries_offset + _ENTRY.size * entry_index
+        )[2:]
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._find(key) != -1
+
+    def __len__(self) -> int:
+        return self._n_entries
+
+    def __iter__(self) -> Iterator[str]:
+        for entry_index in range(self._n_entries):
+            key_offset, key_length = _ENTRY.unpack_from(
+                self._mmap, self._entries_offset + _ENTRY.size * entry_index
+            )[:2]
+            start = self._keys_offset + key_offset
+            yield self._mmap[start : start + key_length].decode("ascii")
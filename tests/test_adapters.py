@@ -1,7 +1,11 @@
+import pickle
+import random
+
 import pytest
 
 from dnaio import SequenceRecord
 from cutadapt.adapters import (
+    AdapterIndex,
     RemoveAfterMatch,
     RemoveBeforeMatch,
     FrontAdapter,
@@ -14,7 +18,10 @@ from cutadapt.adapters import (
     IndexedPrefixAdapters,
     IndexedSuffixAdapters,
     NonInternalFrontAdapter,
+    NonInternalBackAdapter,
+    AnywhereAdapter,
 )
+from cutadapt.sharedindex import SharedIndex
 
 
 def test_back_adapter_absolute_number_of_errors():
@@ -468,6 +475,125 @@ def test_multiple_adapters():
     assert match.adapter is a2
 
 
+def test_search_statistics():
+    adapter = BackAdapter("AGATCGGAAGAGC", max_errors=0.1, min_overlap=3)
+    statistics = adapter.create_statistics()
+    statistics.update_search_statistics()
+    assert statistics.search.reads_searched == 0
+    sequences = ["CCCCAGATCGGAAGAGCTT", "CCCCAGAT", "CCCCCCCC", "CCCCTTTT"]
+    matches = [adapter.match_to(sequence) for sequence in sequences]
+    statistics.update_search_statistics()
+    search = statistics.search
+    assert search.reads_searched == 4
+    assert search.prefilter_rejected == 2
+    assert search.alignments == 2
+    assert search.alignments_with_match == sum(m is not None for m in matches) == 2
+    assert search.dp_cells > 0
+
+    total = adapter.create_statistics()
+    total += statistics
+    total += statistics
+    assert total.search.reads_searched == 8
+    assert total.search.dp_cells == 2 * search.dp_cells
+
+    linked = LinkedAdapter(
+        front_adapter=PrefixAdapter("ACGT", indels=False),
+        back_adapter=BackAdapter("TTTTTTTT", min_overlap=3),
+        front_required=False,
+        back_required=False,
+        name="linked",
+    )
+    linked.match_to("ACGTCCCCTTTTTTTT")
+    linked.match_to("CCCC")
+    search = linked.search_statistics()
+    assert search.reads_searched == 4
+    assert search.alignments_with_match == 2
+
+
+def test_search_statistics_adapters_aligned_together():
+    sequences = ["CCAGATCGGAAG", "CCCCCC", "TTTTAGATCGTAGTT", "TTTTCACGTCTCC", "ACG"]
+    references = ["AGATCGGAAG", "AGATCGTAGT", "CACGTCTCCA", "GGGGGGGGGG"]
+    adapters = [BackAdapter(r, min_overlap=3) for r in references]
+    multiple_adapters = MultipleAdapters(adapters)
+    assert len(multiple_adapters._matchers) == 1
+    for sequence in sequences:
+        multiple_adapters.match_to(sequence)
+    single_adapters = [BackAdapter(r, min_overlap=3) for r in references]
+    for sequence in sequences:
+        for adapter in single_adapters:
+            adapter.match_to(sequence)
+    for adapter, single_adapter in zip(adapters, single_adapters):
+        search = adapter.search_statistics()
+        expected = single_adapter.search_statistics()
+        assert search.reads_searched == expected.reads_searched == len(sequences)
+        assert search.prefilter_rejected == expected.prefilter_rejected
+        assert search.alignments == expected.alignments
+        assert search.alignments_with_match == expected.alignments_with_match
+
+
+def test_multiple_adapters_aligned_together():
+    rng = random.Random(0)
+
+    def random_sequence(length):
+        return "".join(rng.choice("ACGT") for _ in range(length))
+
+    adapter_classes = [
+        BackAdapter,
+        FrontAdapter,
+        NonInternalBackAdapter,
+        NonInternalFrontAdapter,
+        PrefixAdapter,
+        SuffixAdapter,
+    ]
+    adapters = [
+        rng.choice(adapter_classes)(
+            random_sequence(rng.randint(5, 20)),
+            max_errors=rng.choice([0, 0.1, 0.2]),
+            indels=rng.random() < 0.8,
+        )
+        for _ in range(20)
+    ]
+    # These cannot be aligned together with the others
+    adapters.insert(7, AnywhereAdapter(random_sequence(10)))
+    adapters.insert(15, RightmostFrontAdapter(random_sequence(10)))
+    # Duplicates result in ties
+    adapters.append(BackAdapter(adapters[0].sequence))
+    multiple_adapters = MultipleAdapters(adapters)
+    assert len(multiple_adapters._matchers) < len(adapters)
+
+    sequences = []
+    for _ in range(500):
+        sequence = random_sequence(rng.randint(0, 60))
+        adapter = rng.choice(adapters)
+        i = rng.randint(0, len(sequence))
+        sequences.append(sequence[:i] + adapter.sequence + sequence[i:])
+
+    for sequence in sequences:
+        expected = None
+        for adapter in adapters:
+            match = adapter.match_to(sequence)
+            if match is not None and (
+                expected is None
+                or match.score > expected.score
+                or (match.score == expected.score and match.errors < expected.errors)
+            ):
+                expected = match
+        match = multiple_adapters.match_to(sequence)
+        assert match == expected
+        if match is not None:
+            assert match.adapter is expected.adapter
+
+    assert multiple_adapters.match_many(sequences) == [
+        multiple_adapters.match_to(sequence) for sequence in sequences
+    ]
+
+    unpickled = pickle.loads(pickle.dumps(multiple_adapters))
+    assert "_matchers" not in unpickled.__dict__
+    assert [unpickled.match_to(s) is None for s in sequences] == [
+        multiple_adapters.match_to(s) is None for s in sequences
+    ]
+
+
 def test_indexed_prefix_adapters():
     adapters = [
         PrefixAdapter("GAAC", indels=False),
@@ -571,6 +697,35 @@ def test_indexed_prefix_adapters_with_n_collision(sequence):
     assert result.adapter is a2
 
 
+def test_indexed_prefix_adapters_pickled_with_shared_index(monkeypatch):
+    monkeypatch.setattr(AdapterIndex, "shared_index_min_size", 0)
+    adapters = [
+        PrefixAdapter("GTACGT", max_errors=1, indels=True),
+        PrefixAdapter("TGCTAA", max_errors=1, indels=False),
+    ]
+    ma = IndexedPrefixAdapters(adapters)
+    unpickled = pickle.loads(pickle.dumps(ma))
+    assert isinstance(unpickled._index._index, SharedIndex)
+    for sequence in ["GTACGTCC", "GATACGTGG", "TGCTAACC", "TGGTAACC", "TGNTAACC"]:
+        match = ma.match_to(sequence)
+        unpickled_match = unpickled.match_to(sequence)
+        assert match is not None
+        assert (match.adapter.name, match.errors, match.score) == (
+            unpickled_match.adapter.name,
+            unpickled_match.errors,
+            unpickled_match.score,
+        )
+    assert unpickled.match_to("GGGGGGGG") is None
+
+
+def test_adapter_pickle_without_aligner():
+    adapter = BackAdapter("ACGTACGT")
+    assert adapter.match_to("CCCCACGTACGT") is not None
+    unpickled = pickle.loads(pickle.dumps(adapter))
+    assert "aligner" not in unpickled.__dict__
+    assert unpickled.match_to("CCCCACGTACGT").rstart == 4
+
+
 def test_inosine_wildcard():
     adapter = BackAdapter("CTGIAIT", max_errors=0, min_overlap=3)
     match = adapter.match_to("GGCTGAATTGGG")
@@ -1,3 +1,5 @@
+import pickle
+import random
 from typing import NamedTuple
 
 import pytest
@@ -5,6 +7,7 @@ import pytest
 from cutadapt.align import (
     EndSkip,
     Aligner,
+    MultipleAligner,
     PrefixComparer,
     SuffixComparer,
     hamming_sphere,
@@ -15,6 +18,8 @@ from cutadapt.align import (
     py_edit_environment,
 )
 from cutadapt.adapters import Where
+from cutadapt.kmer_heuristic import create_positions_and_kmers
+from cutadapt._kmer_finder import KmerFinder
 
 from utils import binomial
 
@@ -413,6 +418,218 @@ def test_no_match():
     assert a is None, a
 
 
+@pytest.mark.parametrize(
+    "make_aligner",
+    [
+        lambda: Aligner("ACGTTT", 0.2, Where.BACK.value),
+        lambda: Aligner("ACGTTT", 0.2, Where.BACK.value, indels=False),
+        lambda: Aligner("ACGTNT", 0.2, Where.BACK.value, wildcard_ref=True),
+        lambda: Aligner("ACGTTT", 0.2, Where.BACK.value, wildcard_query=True),
+        lambda: PrefixComparer("ACGTTT", 0.2),
+        lambda: SuffixComparer("ACGTTT", 0.2),
+    ],
+)
+def test_query_not_translated(make_aligner):
+    aligner = make_aligner()
+    query = "acgttt"
+    assert aligner.locate(query) == (0, 6, 0, 6, 6, 0)
+    # The query is unchanged
+    assert query == "acgttt"
+    with pytest.raises(ValueError) as info:
+        aligner.locate("acgttä")
+    assert "ASCII" in info.value.args[0]
+
+
+def test_locate_many():
+    aligner = Aligner("AGATCGGAAG", 0.1, Where.BACK.value)
+    sequences = ["CCCAGATCGG", "TTTT", "ACAGATCGGAAGAC", "", "AGATCGGTAG"]
+    hits = aligner.locate_many(sequences)
+    assert len(hits) % 7 == 0
+    expected = []
+    for i, sequence in enumerate(sequences):
+        result = aligner.locate(sequence)
+        if result is not None:
+            expected.extend((i,) + result)
+    assert list(hits) == expected
+    assert [hits[k] for k in range(0, len(hits), 7)] == [0, 2, 4]
+    assert len(aligner.locate_many([])) == 0
+
+
+@pytest.mark.parametrize("indels", [True, False])
+@pytest.mark.parametrize(
+    "where,back_adapter,front_adapter",
+    [(Where.BACK, True, False), (Where.FRONT, False, True)],
+)
+def test_locate_with_hits_same_result(indels, where, back_adapter, front_adapter):
+    reference = "AGATCGGAAGAGCACACGTC"
+    positions_and_kmers = create_positions_and_kmers(
+        reference, 3, 0.1, back_adapter=back_adapter, front_adapter=front_adapter
+    )
+    kmer_finder = KmerFinder(positions_and_kmers)
+    aligner = Aligner(reference, 0.1, where.value, min_overlap=3, indels=indels)
+    rng = random.Random(3)
+    n_windows = 0
+    for _ in range(300):
+        query = "".join(rng.choice("ACGT") for _ in range(200))
+        position = rng.randint(0, 200)
+        query = query[:position] + reference + query[position:]
+        query = query[rng.randint(0, 100) : rng.randint(100, 400)]
+        hits = kmer_finder.hit_positions(query)
+        if hits is None:
+            assert aligner.locate(query) is None
+            continue
+        n_windows += 1
+        assert aligner.locate(query, hits) == aligner.locate(query)
+    assert n_windows > 100
+
+
+@pytest.mark.parametrize("indels", [True, False])
+def test_aligner_counters(indels):
+    aligner = Aligner("AGATCGGAAG", 0.1, Where.BACK.value, indels=indels)
+    assert (aligner.alignments, aligner.matches, aligner.dp_cells) == (0, 0, 0)
+    assert aligner.locate("CCCAGATCGGAAG") is not None
+    assert aligner.locate("TTTT") is None
+    aligner.locate_many(["ACAGATCGGAAGAC", ""])
+    assert aligner.alignments == 4
+    assert aligner.matches == 2
+    if indels:
+        assert 0 < aligner.dp_cells <= 10 * (13 + 4 + 14)
+    else:
+        assert aligner.dp_cells == 10 * (13 + 4 + 14)
+    # Counting starts anew
+    assert pickle.loads(pickle.dumps(aligner)).alignments == 0
+
+    comparer = PrefixComparer("ACGT", 0.2)
+    assert comparer.locate("ACGTT") is not None
+    assert comparer.locate("TTTT") is None
+    assert (comparer.alignments, comparer.matches, comparer.dp_cells) == (2, 1, 8)
+
+
+def test_multiple_aligner():
+    references = ["AGATCGGAAG", "AGATCGGTAG", "CCAGTCAC", "AGATCGGAAG"]
+    aligners = [Aligner(r, 0.1, Where.BACK.value) for r in references]
+    multiple_aligner = MultipleAligner(aligners)
+    assert len(multiple_aligner) == 4
+    for query in ["CCCAGATCGG", "TTTT", "ACAGATCGGAAGAC", "", "TTAGATCGGTAG"]:
+        expected = None
+        for i, aligner in enumerate(aligners):
+            result = aligner.locate(query)
+            if result is not None and (
+                expected is None
+                or result[4] > expected[5]
+                or (result[4] == expected[5] and result[5] < expected[6])
+            ):
+                expected = (i,) + result
+        assert multiple_aligner.locate(query) == expected
+
+    assert multiple_aligner.locate("TTAGATCGGTAG") == (1, 0, 10, 2, 12, 10, 0)
+    # One mismatch
+    assert multiple_aligner.locate("TTAGATCGGTAG", candidates=[0, 2]) == (
+        0,
+        0,
+        10,
+        2,
+        12,
+        8,
+        1,
+    )
+    prefilters = [None, lambda query: False, None, None]
+    assert MultipleAligner(aligners, prefilters).locate("TTAGATCGGTAG")[0] == 0
+    with pytest.raises(ValueError):
+        MultipleAligner(aligners, [None])
+    assert pickle.loads(pickle.dumps(multiple_aligner)).locate("CCAGTCAC") == (
+        2,
+        0,
+        8,
+        0,
+        8,
+        8,
+        0,
+    )
+
+
+def test_bitvector_selected_automatically():
+    assert Aligner("ACGT" * 16, 0.1, Where.BACK.value).uses_bitvector
+    assert Aligner("ACGT" * 16, 0.1, Where.FRONT.value).uses_bitvector
+    assert not Aligner("ACGT" * 16 + "A", 0.1, Where.BACK.value).uses_bitvector
+    assert not Aligner("ACGT", 0.1, Where.BACK.value, indel_cost=2).uses_bitvector
+    assert not Aligner("ACGT", 0.1, Where.ANYWHERE.value).uses_bitvector
+
+
+@pytest.mark.parametrize("flags", range(16))
+def test_bitvector_same_result_as_dp(flags):
+    rng = random.Random(flags)
+    for _ in range(3000):
+        reference = "".join(
+            rng.choice("ACGTN" if rng.random() < 0.2 else "ACGT")
+            for _ in range(rng.randint(1, 64))
+        )
+        query = "".join(rng.choice("ACGTNacgt") for _ in range(rng.randint(0, 80)))
+        if rng.random() < 0.5:
+            # Insert a part of the reference with some mismatches
+            part = list(reference[rng.randint(0, len(reference) - 1) :])
+            if rng.random() < 0.5:
+                part = list(reference[: rng.randint(1, len(reference))])
+            for _ in range(rng.randint(0, 3)):
+                part[rng.randrange(len(part))] = rng.choice("ACGT")
+            i = rng.randint(0, len(query))
+            query = query[:i] + "".join(part) + query[i:]
+        wildcard_ref = rng.random() < 0.3 and set(reference) != {"N"}
+        kwargs = dict(
+            reference=reference,
+            max_error_rate=rng.choice([0, 0.1, 0.2, 0.3, 0.5]),
+            flags=flags,
+            wildcard_ref=wildcard_ref,
+            wildcard_query=rng.random() < 0.3,
+            min_overlap=rng.randint(1, 10),
+        )
+        aligner = Aligner(**kwargs)
+        dp_aligner = Aligner(**kwargs)
+        dp_aligner.disable_bitvector()
+        assert not dp_aligner.uses_bitvector
+        assert aligner.locate(query) == dp_aligner.locate(query), (kwargs, query)
+
+
+@pytest.mark.parametrize("flags", range(16))
+def test_no_indels_same_result_as_dp(flags):
+    rng = random.Random(flags)
+    for _ in range(3000):
+        reference = "".join(
+            rng.choice("ACGTN" if rng.random() < 0.2 else "ACGT")
+            for _ in range(rng.randint(1, 80))
+        )
+        query = "".join(rng.choice("ACGTNacgt") for _ in range(rng.randint(0, 90)))
+        if rng.random() < 0.6:
+            part = list(reference[rng.randint(0, len(reference) - 1) :])
+            if rng.random() < 0.5:
+                part = list(reference[: rng.randint(1, len(reference))])
+            for _ in range(rng.randint(0, 3)):
+                part[rng.randrange(len(part))] = rng.choice("ACGT")
+            i = rng.randint(0, len(query))
+            query = query[:i] + "".join(part) + query[i:]
+        kwargs = dict(
+            reference=reference,
+            max_error_rate=rng.choice([0, 0.1, 0.2, 0.3, 0.5, 1.0]),
+            flags=flags,
+            wildcard_ref=rng.random() < 0.3 and set(reference) != {"N"},
+            wildcard_query=rng.random() < 0.3,
+            min_overlap=rng.randint(1, 10),
+        )
+        aligner = Aligner(indels=False, **kwargs)
+        # Indels are effectively disallowed by making them very expensive
+        dp_aligner = Aligner(indel_cost=100000, **kwargs)
+        assert aligner.locate(query) == dp_aligner.locate(query), (kwargs, query)
+
+
+def test_no_indels_pickle():
+    aligner = Aligner("ACGTACGT", 0.2, Where.BACK.value, indels=False)
+    unpickled = pickle.loads(pickle.dumps(aligner))
+    assert "indels=False" in repr(unpickled)
+    assert unpickled.locate("TTTTACGAACGT") == (0, 8, 4, 12, 6, 1)
+    # Requires a deletion
+    assert unpickled.locate("TTTTACGACGTTT") is None
+
+
 def test_hamming_sphere_explicit():
     assert list(hamming_sphere("", 0)) == [""]
     assert list(hamming_sphere("A", 0)) == ["A"]
@@ -1,3 +1,5 @@
+import gzip
+import json
 import subprocess
 import sys
 import os
@@ -6,8 +8,9 @@ from io import StringIO, BytesIO
 import dnaio
 import pytest
 
+from cutadapt.adapters import AdapterIndex
 from cutadapt.cli import main
-from utils import assert_files_equal, datapath, cutpath
+from utils import assert_files_equal, bgzf_compress, datapath, cutpath
 
 # pytest.mark.timeout will not fail even if pytest-timeout is not installed
 try:
@@ -734,6 +737,16 @@ def test_multiple_prefix_adapters_noindels(run):
     )
 
 
+def test_multiple_prefix_adapters_shared_index(run, monkeypatch):
+    # The index is sent to the worker processes as a SharedIndex
+    monkeypatch.setattr(AdapterIndex, "shared_index_min_size", 0)
+    run(
+        "--cores 2 -g ^GTACGGATTGTTCAGTA -g ^TATTAAGCTCATTC",
+        "multiprefix.fasta",
+        "multi.fasta",
+    )
+
+
 def test_multiple_suffix_adapters_noindels(run):
     run(
         "--no-indels -a CGTGATTATCTTGC$ -a CCTATTAGTGGTTGAAC$",
@@ -944,6 +957,60 @@ def test_write_compressed_fastq(cores, tmp_path):
     )
 
 
+def test_write_compressed_fastq_content(cores, tmp_path):
+    main(
+        [
+            "--cores",
+            str(cores),
+            "--buffer-size=256",
+            "-a",
+            "TTAGACATATCTCCGTCG",
+            "-o",
+            str(tmp_path / "out.fastq.gz"),
+            datapath("small.fastq"),
+        ]
+    )
+    with gzip.open(tmp_path / "out.fastq.gz") as f:
+        content = f.read()
+    with open(cutpath("small.fastq"), "rb") as f:
+        assert content == f.read()
+
+
+def test_write_compressed_fastq_empty(cores, tmp_path):
+    main(
+        [
+            "--cores",
+            str(cores),
+            "-m",
+            "1000",
+            "-o",
+            str(tmp_path / "out.fastq.gz"),
+            datapath("small.fastq"),
+        ]
+    )
+    with gzip.open(tmp_path / "out.fastq.gz") as f:
+        assert f.read() == b""
+
+
+def test_bgzf_input(cores, tmp_path):
+    inpath = tmp_path / "small.fastq.gz"
+    with open(datapath("small.fastq"), "rb") as f:
+        inpath.write_bytes(bgzf_compress(f.read(), 100))
+    main(
+        [
+            "--cores",
+            str(cores),
+            "--buffer-size=256",
+            "-a",
+            "TTAGACATATCTCCGTCG",
+            "-o",
+            str(tmp_path / "out.fastq"),
+            str(inpath),
+        ]
+    )
+    assert_files_equal(cutpath("small.fastq"), tmp_path / "out.fastq")
+
+
 def test_minimal_report(run):
     run("-b TTAGACATATCTCCGTCG --report=minimal", "small.fastq", "small.fastq")
 
@@ -1113,6 +1180,30 @@ def test_terminates_correctly_on_error_in_subprocess(tmp_path):
         main(params)
 
 
+def test_json_report_search_statistics(tmp_path, cores):
+    path = tmp_path / "out.cutadapt.json"
+    main(
+        [
+            "--cores",
+            str(cores),
+            "--json",
+            str(path),
+            "-a",
+            "TTAGACATATCTCCGTCG",
+            "-o",
+            str(tmp_path / "out.fastq"),
+            datapath("small.fastq"),
+        ]
+    )
+    with open(path) as f:
+        report = json.load(f)
+    search = report["adapters_read1"][0]["search"]
+    assert search["reads_searched"] == 3
+    assert search["prefilter_rejected"] + search["alignments"] == 3
+    assert search["alignments_with_match"] == 2
+    assert search["dp_cells"] > 0
+
+
 def test_json_report_with_demultiplexing_and_discard_untrimmed(tmp_path):
     stats = main(
         [
@@ -1128,3 +1219,59 @@ def test_json_report_with_demultiplexing_and_discard_untrimmed(tmp_path):
     )
     assert stats.n == 100
     assert stats.written == 64
+
+
+def test_batch(tmp_path, cores):
+    manifest = tmp_path / "manifest.tsv"
+    with open(manifest, "w") as f:
+        print("input1", "output", "json", sep="\t", file=f)
+        for name in ("a", "b"):
+            print(
+                datapath("small.fastq"),
+                tmp_path / f"{name}.fastq",
+                tmp_path / f"{name}.json",
+                sep="\t",
+                file=f,
+            )
+    stats = main(
+        [
+            "--cores",
+            str(cores),
+            "-a",
+            "TTAGACATATCTCCGTCG",
+            "--batch",
+            str(manifest),
+        ]
+    )
+    assert stats.n == 6
+    for name in ("a", "b"):
+        assert_files_equal(cutpath("small.fastq"), tmp_path / f"{name}.fastq")
+        with open(tmp_path / f"{name}.json") as f:
+            report = json.load(f)
+        assert report["read_counts"]["input"] == 3
+        assert report["input"]["path1"] == datapath("small.fastq")
+
+
+@pytest.mark.parametrize(
+    "header,line",
+    [
+        ("input1\tunknown", "in.fastq\tout.fastq"),
+        ("input1", "in.fastq"),
+        ("input1\toutput", "in.fastq"),
+        ("input1\toutput", "in.fastq\t"),
+    ],
+)
+def test_batch_invalid_manifest(tmp_path, header, line):
+    manifest = tmp_path / "manifest.tsv"
+    manifest.write_text(f"{header}\n{line}\n")
+    with pytest.raises(SystemExit) as e:
+        main(["--batch", str(manifest)])
+    assert e.value.code == 2
+
+
+def test_batch_output_option_not_allowed(tmp_path):
+    manifest = tmp_path / "manifest.tsv"
+    manifest.write_text(f"input1\toutput\n{datapath('small.fastq')}\tout.fastq\n")
+    with pytest.raises(SystemExit) as e:
+        main(["-o", str(tmp_path / "out.fastq"), "--batch", str(manifest)])
+    assert e.value.code == 2
@@ -0,0 +1,79 @@
+import gzip
+
+import dnaio
+import pytest
+
+from cutadapt.files import (
+    BgzfReader,
+    FileOpener,
+    GzipMemberWriter,
+    compress_gzip_member,
+    is_bgzf,
+)
+from utils import bgzf_compress
+
+
+def test_gzip_member_writer(tmp_path):
+    path = tmp_path / "out.txt.gz"
+    with GzipMemberWriter(open(path, "wb"), compression_level=1) as f:
+        f.write(b"hello\n")
+        f.write_compressed(compress_gzip_member(b"world\n", 1))
+    assert gzip.decompress(path.read_bytes()) == b"hello\nworld\n"
+
+
+def test_gzip_member_writer_empty(tmp_path):
+    path = tmp_path / "empty.gz"
+    GzipMemberWriter(open(path, "wb"), compression_level=5).close()
+    assert gzip.decompress(path.read_bytes()) == b""
+
+
+def test_file_opener_compress_in_workers(tmp_path):
+    file_opener = FileOpener(compress_in_workers=True)
+    with file_opener.xopen(tmp_path / "out.fastq.gz", "wb") as f:
+        assert isinstance(f, GzipMemberWriter)
+    with file_opener.xopen(tmp_path / "out.fastq", "wb") as f:
+        assert not isinstance(f, GzipMemberWriter)
+
+
+def test_is_bgzf(tmp_path):
+    bgzf_path = tmp_path / "bgzf.gz"
+    bgzf_path.write_bytes(bgzf_compress(b"ACGT", 2))
+    gzip_path = tmp_path / "plain.gz"
+    gzip_path.write_bytes(gzip.compress(b"ACGT"))
+    assert is_bgzf(str(bgzf_path))
+    assert not is_bgzf(str(gzip_path))
+    assert not is_bgzf(str(tmp_path / "missing.gz"))
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_bgzf_reader(tmp_path, threads):
+    data = b"".join(b"@read%d\nACGTACGT\n+\nIIIIIIII\n" % i for i in range(1000))
+    path = tmp_path / "bgzf.fastq.gz"
+    path.write_bytes(bgzf_compress(data, 1000))
+    with BgzfReader(str(path), threads=threads, blocks_per_task=3) as f:
+        assert f.read() == data
+    with BgzfReader(str(path), threads=threads) as f:
+        assert len(list(dnaio.open(f))) == 1000
+
+
+def test_bgzf_reader_truncated(tmp_path):
+    path = tmp_path / "bgzf.gz"
+    path.write_bytes(bgzf_compress(b"ACGT" * 100, 100)[:-40])
+    with BgzfReader(str(path), threads=1) as f:
+        with pytest.raises(OSError):
+            f.read()
+
+
+def test_bgzf_reader_readinto_fills_buffer(tmp_path):
+    data = bytes(range(256)) * 100
+    path = tmp_path / "bgzf.gz"
+    path.write_bytes(bgzf_compress(data, 100))
+    with BgzfReader(str(path), threads=2, blocks_per_task=2) as f:
+        assert f.peek(1000) == data[:1000]
+        buf = bytearray(len(data) - 5)
+        # One call reads across many blocks and tasks
+        assert f.readinto(buf) == len(buf)
+        assert buf == data[:-5]
+        assert f.readinto(buf) == 5
+        assert buf[:5] == data[-5:]
+        assert f.readinto(buf) == 0
@@ -1,10 +1,13 @@
+import pickle
+import random
 import string
 
 import pytest
 
 from cutadapt._match_tables import matches_lookup
 from cutadapt.adapters import KmerFinder
-from cutadapt._kmer_finder import MAXIMUM_WORD_SIZE
+from cutadapt._kmer_finder import MAXIMUM_WORD_SIZE, MultipleKmerFinder
+from cutadapt.kmer_heuristic import create_positions_and_kmers
 
 
 KMER_FINDER_TESTS = [
@@ -76,11 +79,34 @@ def test_kmer_finder_per_char_matching(ref_wildcards, query_wildcards):
                 )
 
 
-def test_kmer_finder_initialize_bigword():
-    with pytest.raises(ValueError) as error:
-        KmerFinder([(0, None, ["A" * (MAXIMUM_WORD_SIZE + 1)])])
-    error.match("A" * (MAXIMUM_WORD_SIZE + 1))
-    error.match(str(MAXIMUM_WORD_SIZE))
+@pytest.mark.parametrize(
+    "length", [MAXIMUM_WORD_SIZE + 1, 2 * MAXIMUM_WORD_SIZE, 2 * MAXIMUM_WORD_SIZE + 1]
+)
+def test_kmer_finder_bigword(length):
+    kmer = ("ACGTTGCA" * length)[:length]
+    kmer_finder = KmerFinder([(0, None, ["TTT", kmer, "GGG"])])
+    assert kmer_finder.kmers_present("X" * 100 + kmer + "X")
+    assert kmer_finder.kmers_present("X" * 100 + kmer.lower())
+    assert kmer_finder.kmers_present("TTT")
+    assert kmer_finder.kmers_present("GGG")
+    assert not kmer_finder.kmers_present(kmer[:-1] + "X")
+    assert not kmer_finder.kmers_present("X" + kmer[1:])
+    assert not kmer_finder.kmers_present(
+        kmer[: length // 2] + "X" + kmer[length // 2 :]
+    )
+
+
+def test_kmer_finder_bigword_with_wildcards():
+    kmer = "ACGT" * 20 + "N"
+    kmer_finder = KmerFinder([(-100, None, [kmer])], ref_wildcards=True)
+    assert kmer_finder.kmers_present("A" * 50 + "ACGT" * 20 + "G")
+    assert not kmer_finder.kmers_present("ACGT" * 20 + "G" + "A" * 50)
+
+
+def test_kmer_finder_stop_beyond_sequence_end():
+    kmer_finder = KmerFinder([(0, 100, ["ACGT"])])
+    assert kmer_finder.kmers_present("TTACGT")
+    assert not kmer_finder.kmers_present("TTACG")
 
 
 def test_kmer_finder_initialize_total_greater_than_max():
@@ -115,3 +141,72 @@ def test_kmer_finder_finds_in_region():
     assert not kmer_finder.kmers_present(
         "And peace to be real must be unaffected by outside circumstances."
     )
+
+
+def test_kmer_finder_hit_positions():
+    kmer_finder = KmerFinder([(0, None, ["ACG", "TTTT"]), (-80, None, ["A" * 70])])
+    assert kmer_finder.hit_positions("CCCCC") is None
+    assert kmer_finder.hit_positions("ACGTT") == (3, 3)
+    assert kmer_finder.hit_positions("xxACGxxTTTTxACGx") == (5, 15)
+    assert kmer_finder.hit_positions("TTTT" + "A" * 70) == (4, 74)
+    # Occurrences outside of their search region are ignored
+    assert kmer_finder.hit_positions("A" * 70 + "x" * 20) is None
+
+
+def test_multiple_kmer_finder():
+    kmer_finders = [
+        KmerFinder([(0, None, ["teenage", "mutant"])]),
+        KmerFinder([(-10, None, ["ninja"]), (0, 10, ["turtles"])]),
+        KmerFinder([(0, None, ["A" * 70])]),
+    ]
+    multiple_kmer_finder = MultipleKmerFinder(kmer_finders)
+    assert len(multiple_kmer_finder) == 3
+    assert multiple_kmer_finder.candidates("a mutant ninja") == [0, 1]
+    assert multiple_kmer_finder.candidates("ninja at the start, then turtles") == []
+    assert multiple_kmer_finder.candidates("turtles " + "a" * 70) == [1, 2]
+    multiple_kmer_finder = pickle.loads(pickle.dumps(multiple_kmer_finder))
+    assert multiple_kmer_finder.candidates("teenage ninja") == [0, 1]
+
+
+def test_multiple_kmer_finder_same_result_as_kmer_finders():
+    rng = random.Random(42)
+    kmer_finders = []
+    for _ in range(30):
+        adapter = "".join(rng.choice("ACGT") for _ in range(rng.randint(10, 120)))
+        positions_and_kmers = create_positions_and_kmers(
+            adapter,
+            min_overlap=rng.randint(1, 5),
+            error_rate=rng.choice([0, 0.1, 0.2]),
+            back_adapter=rng.random() < 0.5,
+            front_adapter=rng.random() < 0.5,
+            internal=rng.random() < 0.8,
+        )
+        kmer_finders.append(
+            KmerFinder(positions_and_kmers, rng.random() < 0.5, rng.random() < 0.5)
+        )
+    multiple_kmer_finder = MultipleKmerFinder(kmer_finders)
+    for _ in range(200):
+        sequence = "".join(rng.choice("ACGTN") for _ in range(rng.randint(0, 200)))
+        expected = [
+            i
+            for i, kmer_finder in enumerate(kmer_finders)
+            if kmer_finder.kmers_present(sequence)
+        ]
+        assert multiple_kmer_finder.candidates(sequence) == expected
+
+
+def test_kmer_finder_counters():
+    kmer_finder = KmerFinder([(0, None, ["ACGT"])])
+    assert kmer_finder.searched == 0
+    assert kmer_finder.kmers_present("TACGTA")
+    assert not kmer_finder.kmers_present("AAAA")
+    assert kmer_finder.hit_positions("TTTT") is None
+    assert kmer_finder.hit_positions("ACGT") == (4, 4)
+    assert kmer_finder.searched == 4
+    assert kmer_finder.rejected == 2
+
+    other_kmer_finder = KmerFinder([(0, None, ["TTTT"])])
+    multiple_kmer_finder = MultipleKmerFinder([kmer_finder, other_kmer_finder])
+    assert multiple_kmer_finder.candidates("TTTTT") == [1]
+    assert (kmer_finder.searched, kmer_finder.rejected) == (5, 3)
+    assert (other_kmer_finder.searched, other_kmer_finder.rejected) == (1, 0)
@@ -1,6 +1,10 @@
+import pickle
+import random
+
 import pytest
 
 from cutadapt.kmer_heuristic import (
+    KmerModel,
     kmer_chunks,
     minimize_kmer_search_list,
     create_back_overlap_searchsets,
@@ -19,6 +23,57 @@ def test_kmer_chunks(sequence, chunks, expected):
     assert kmer_chunks(sequence, chunks) == expected
 
 
+@pytest.mark.parametrize("chunks", [1, 2, 3, 4])
+@pytest.mark.parametrize("length", [5, 8, 13, 20, 33])
+def test_kmer_chunks_uniform_probability(chunks, length):
+    sequence = "".join(random.Random(length).choice("ACGT") for _ in range(length))
+    model = KmerModel()
+    assert kmer_chunks(sequence, chunks, model.probability) == kmer_chunks(
+        sequence, chunks
+    )
+
+
+def test_kmer_model():
+    model = KmerModel()
+    assert model.probability("ACGT") == pytest.approx(1 / 4**4)
+    assert model.probability("ACGTACGTAC") == pytest.approx(1 / 4**10)
+    # Wildcards match any base
+    assert model.probability("ACNNGT") == pytest.approx(1 / 4**4)
+    model = KmerModel(gc_content=0.6)
+    assert model.probability("GC") == pytest.approx(0.3**2)
+    assert model.probability("AT") == pytest.approx(0.2**2)
+    with pytest.raises(ValueError):
+        KmerModel(gc_content=1.5)
+
+
+def test_kmer_model_from_sequences():
+    rng = random.Random(0)
+    sequences = [
+        "".join(rng.choice("ACGT") for _ in range(80)) + "G" * 20 for _ in range(500)
+    ]
+    model = KmerModel(sequences=sequences)
+    # Poly-G occurs at the 3' end only
+    assert model.probability("GGGGGG", -20, None) > 0.4
+    assert model.probability("GGGGGG", 0, 20) < 0.001
+    assert model.probability("GGGGGG") > 100 * model.probability("ACGTCA")
+    # Chunks with long runs of G are avoided
+    assert kmer_chunks("ACGTACTGGGGGGGACTT", 3) == {"ACGTAC", "TGGGGG", "GGACTT"}
+    assert kmer_chunks("ACGTACTGGGGGGGACTT", 3, model.probability) == {
+        "ACGTA",
+        "CTGGGG",
+        "GGGACTT",
+    }
+    # Front adapters are searched at the 5' end, where poly-G does not occur
+    adapter = "AAGCAGTGGTATCAACGCAGAGTGGGG"
+    kwargs = dict(back_adapter=False, front_adapter=True, internal=False)
+    assert create_positions_and_kmers(
+        adapter, 3, 0.1, kmer_probability=model.probability, **kwargs
+    ) == create_positions_and_kmers(adapter, 3, 0.1, **kwargs)
+    assert pickle.loads(pickle.dumps(model)).probability("GGGG") == pytest.approx(
+        model.probability("GGGG")
+    )
+
+
 @pytest.mark.parametrize(
     ["kmer_search_list", "expected"],
     [
@@ -177,6 +177,46 @@ class TestPairedAdapterCutter:
         assert "ACACttttacac" == trimmed2.sequence
 
 
+@pytest.mark.parametrize("action", ["trim", "mask", "lowercase", "retain", None])
+@pytest.mark.parametrize("times", [1, 2])
+def test_adapter_cutter_process_batch(action, times):
+    if action == "retain" and times > 1:
+        return
+    adapters: List[Adapter] = [
+        BackAdapter("AACCGG"),
+        FrontAdapter("GGTTAACC"),
+        PrefixAdapter("TTTT"),
+        BackAdapter("TTAACCG"),
+    ]
+    sequences = [
+        "ATTGCCAACCGGTATATAT",
+        "GGTTAACCTATATAACCG",
+        "TTTTACGTACGT",
+        "CCCCCCCC",
+        "ACGTTAACCGGTTAACCGG",
+        "ggttaaccACGTaaccgg",
+    ]
+
+    def make_reads():
+        return [SequenceRecord(f"r{i}", s) for i, s in enumerate(sequences)]
+
+    cutter = AdapterCutter(adapters, times=times, action=action)
+    expected_reads = make_reads()
+    expected_infos = [ModificationInfo(read) for read in expected_reads]
+    expected = [
+        cutter(read, info) for read, info in zip(expected_reads, expected_infos)
+    ]
+
+    batch_cutter = AdapterCutter(adapters, times=times, action=action)
+    reads = make_reads()
+    infos = [ModificationInfo(read) for read in reads]
+    trimmed = batch_cutter.process_batch(reads, infos)
+
+    assert trimmed == expected
+    assert [info.matches for info in infos] == [info.matches for info in expected_infos]
+    assert batch_cutter.with_adapters == cutter.with_adapters
+
+
 def test_retain_times():
     with pytest.raises(ValueError) as e:
         AdapterCutter([BackAdapter("ACGT")], times=2, action="retain")
@@ -1,8 +1,10 @@
+import gzip
 import os
 import os.path
 import shutil
 from itertools import product
 
+import dnaio
 import pytest
 
 from cutadapt.cli import main
@@ -76,6 +78,63 @@ def test_paired_end_no_legacy(run_paired, cores):
     )
 
 
+def test_paired_end_compressed_input(tmp_path, cores):
+    inpaths = []
+    for name in ("paired.1.fastq", "paired.2.fastq"):
+        with open(datapath(name), "rb") as f:
+            (tmp_path / (name + ".gz")).write_bytes(gzip.compress(f.read()))
+        inpaths.append(os.fspath(tmp_path / (name + ".gz")))
+    main(
+        [
+            "--cores",
+            str(cores),
+            "--buffer-size=512",
+            "-a",
+            "TTAGACATAT",
+            "-m",
+            "14",
+            "-q",
+            "10",
+            "-o",
+            os.fspath(tmp_path / "out.1.fastq"),
+            "-p",
+            os.fspath(tmp_path / "out.2.fastq"),
+            *inpaths,
+        ]
+    )
+    assert_files_equal(cutpath("paired.m14.1.fastq"), tmp_path / "out.1.fastq")
+    assert_files_equal(cutpath("paired.m14.2.fastq"), tmp_path / "out.2.fastq")
+
+
+def test_paired_end_unordered(tmp_path):
+    path1 = os.fspath(tmp_path / "out.1.fastq")
+    path2 = os.fspath(tmp_path / "out.2.fastq")
+    main(
+        [
+            "--cores=2",
+            "--buffer-size=512",
+            "--unordered",
+            "-a",
+            "TTAGACATAT",
+            "-m",
+            "14",
+            "-q",
+            "10",
+            "-o",
+            path1,
+            "-p",
+            path2,
+            datapath("paired.1.fastq"),
+            datapath("paired.2.fastq"),
+        ]
+    )
+    with dnaio.open(path1, path2) as f:
+        pairs = [(r1.name, r2.name, r1.sequence, r2.sequence) for r1, r2 in f]
+    with dnaio.open(cutpath("paired.m14.1.fastq"), cutpath("paired.m14.2.fastq")) as f:
+        expected = [(r1.name, r2.name, r1.sequence, r2.sequence) for r1, r2 in f]
+    assert sorted(pairs) == sorted(expected)
+
+
 def test_untrimmed_paired_output(tmp_path, run_paired):
     untrimmed1 = os.fspath(tmp_path / "untrimmed.1.fastq")
     untrimmed2 = os.fspath(tmp_path / "untrimmed.2.fastq")
@@ -824,3 +883,60 @@ def test_revcomp_r1_and_r2(run_paired):
         expected2="revcomp-r1r2.2.fastq",
         cores=1,
     )
+
+
+def test_paired_end_long_record(tmp_path, cores):
+    # The first record is larger than the minimum chunk size
+    for i in (1, 2):
+        with open(tmp_path / f"in.{i}.fastq", "w") as f:
+            for j in range(20):
+                length = 100_000 if j == 0 and i == 1 else 50
+                f.write(f"@r{j}/{i}\n{'A' * length}\n+\n{'I' * length}\n")
+    main(
+        [
+            "--cores",
+            str(cores),
+            "-o",
+            os.fspath(tmp_path / "out.1.fastq"),
+            "-p",
+            os.fspath(tmp_path / "out.2.fastq"),
+            os.fspath(tmp_path / "in.1.fastq"),
+            os.fspath(tmp_path / "in.2.fastq"),
+        ]
+    )
+    for i in (1, 2):
+        assert (tmp_path / f"out.{i}.fastq").read_bytes() == (
+            tmp_path / f"in.{i}.fastq"
+        ).read_bytes()
+
+
+def test_paired_batch(tmp_path, cores):
+    manifest = tmp_path / "manifest.tsv"
+    with open(manifest, "w") as f:
+        print("input1", "input2", "output", "paired-output", sep="\t", file=f)
+        for name in ("a", "b"):
+            print(
+                datapath("paired.1.fastq"),
+                datapath("paired.2.fastq"),
+                tmp_path / f"{name}.1.fastq",
+                tmp_path / f"{name}.2.fastq",
+                sep="\t",
+                file=f,
+            )
+    main(
+        [
+            "--cores",
+            str(cores),
+            "-a",
+            "TTAGACATAT",
+            "-m",
+            "14",
+            "-q",
+            "10",
+            "--batch",
+            os.fspath(manifest),
+        ]
+    )
+    for name in ("a", "b"):
+        assert_files_equal(cutpath("paired.m14.1.fastq"), tmp_path / f"{name}.1.fastq")
+        assert_files_equal(cutpath("paired.m14.2.fastq"), tmp_path / f"{name}.2.fastq")
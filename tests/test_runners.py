@@ -0,0 +1,452 @@
+import json
+import io
+import logging
+import multiprocessing
+
+import dnaio
+import pytest
+
+from cutadapt.cli import main
+from cutadapt.runners import (
+    ChunkSizeTuner,
+    LimitedReader,
+    MemoryViewReader,
+    OrderedChunkWriter,
+    ParallelPipelineRunner,
+    WorkerPool,
+    _limit_chunks,
+    _sample_chunks,
+    _pack_chunks,
+    _unpack_chunks,
+)
+from utils import assert_files_equal, datapath, cutpath
+
+
+def test_memory_view_reader():
+    data = b"@r1\nACGT\n+\n####\n@r2\nTTTT\n+\n####\n"
+    records = list(dnaio.open(MemoryViewReader(memoryview(data))))
+    assert [record.name for record in records] == ["r1", "r2"]
+    assert records[1].sequence == "TTTT"
+
+
+def test_memory_view_reader_readinto():
+    reader = MemoryViewReader(memoryview(b"ABCDE"))
+    assert reader.peek(2) == b"AB"
+    buf = bytearray(3)
+    assert reader.readinto(buf) == 3
+    assert buf == b"ABC"
+    assert reader.readinto(buf) == 2
+    assert buf[:2] == b"DE"
+    assert reader.readinto(buf) == 0
+
+
+def test_parallel_runner_without_shared_memory(monkeypatch, run):
+    monkeypatch.setattr(
+        WorkerPool,
+        "_create_shared_buffers",
+        staticmethod(lambda n, size: None),
+    )
+    run("--cores 2 -a TTAGACATATCTCCGTCG", "small.fastq", "small.fastq")
+
+
+def test_chunk_size_tuner():
+    tuner = ChunkSizeTuner(100, 10000, target_time=1.0)
+    assert tuner.size == 100
+    # First request of a worker: No processing time available yet
+    tuner.update(0, None, wait_time=0.0)
+    assert tuner.size == 100
+    assert tuner.target_time == pytest.approx(1.1)
+
+    # The reader had to wait, so the target time is decreased
+    tuner.update(1000, 1.0, wait_time=0.5)
+    assert tuner.target_time == pytest.approx(1.0)
+    assert tuner.size == 1000
+
+    # Slower workers result in smaller chunks, but not below the minimum
+    for _ in range(100):
+        tuner.update(1000, 100.0, wait_time=0.5)
+    assert tuner.target_time == pytest.approx(ChunkSizeTuner.min_target_time)
+    assert tuner.size == 100
+
+    # Fast workers that are waiting for work get larger chunks up to the maximum
+    for _ in range(100):
+        tuner.update(1000, 0.001, wait_time=0.0)
+    assert tuner.size == 10000
+
+
+def test_limited_reader():
+    data = b"".join(b"@r%d\nACGT\n+\n####\n" % i for i in range(100))
+    reader = LimitedReader(io.BytesIO(data), limit=50)
+    chunks = [bytes(chunk) for chunk in dnaio.read_chunks(reader, 10000)]
+    assert b"".join(chunks) == data
+    assert len(chunks) > 10
+    assert all(len(chunk) <= 50 + 18 for chunk in chunks)
+
+
+def test_adaptive_chunk_size(run):
+    run(
+        "--cores 2 --min-buffer-size 100 --buffer-size 2000 -a TTAGACATATCTCCGTCG",
+        "small.fastq",
+        "small.fastq",
+    )
+
+
+def test_ordered_chunk_writer():
+    f = io.BytesIO()
+    writer = OrderedChunkWriter(f)
+    writer.write(b"CC", 2)
+    writer.write(b"B", 1)
+    assert f.getvalue() == b""
+    assert writer.buffered_bytes == 3
+    assert not writer.wrote_everything()
+    writer.write(b"AAAA", 0)
+    assert f.getvalue() == b"AAAABCC"
+    assert writer.buffered_bytes == 0
+    assert writer.wrote_everything()
+
+
+def test_ordered_chunk_writer_sparse():
+    f = io.BytesIO()
+    writer = OrderedChunkWriter(f)
+    # Chunks 0 and 2 contain no data for this file
+    writer.write(b"D", 3)
+    writer.write(b"B", 1)
+    assert f.getvalue() == b""
+    writer.skip_to(2)
+    assert f.getvalue() == b"B"
+    assert not writer.wrote_everything()
+    writer.skip_to(4)
+    assert f.getvalue() == b"BD"
+    assert writer.wrote_everything()
+    writer.write(b"E", 4)
+    assert f.getvalue() == b"BDE"
+
+
+def test_pack_chunks():
+    message = _pack_chunks(17, [b"", b"ACGT", b"", b"", b"TT", b""])
+    n_reads, chunks = _unpack_chunks(message)
+    assert n_reads == 17
+    assert [(i, bytes(data)) for i, data in chunks] == [(1, b"ACGT"), (4, b"TT")]
+    assert _unpack_chunks(_pack_chunks(0, [b"", b""])) == (0, [])
+
+
+def test_max_buffered_bytes(run, caplog):
+    caplog.set_level(logging.DEBUG)
+    run(
+        "--cores 2 --buffer-size 200 --max-buffered-bytes 1 -a TTAGACATATCTCCGTCG",
+        "small.fastq",
+        "small.fastq",
+    )
+    assert "Peak size of processed chunks waiting to be written" in caplog.text
+
+
+def test_writer_ready_backpressure():
+    writer_ready = multiprocessing.Event()
+    writer_ready.set()
+    f = io.BytesIO()
+    writers = [OrderedChunkWriter(f)]
+    update = ParallelPipelineRunner._update_writer_ready
+
+    writers[0].write(b"BBBB", 1)
+    assert update(writer_ready, writers, 3) == 4
+    assert not writer_ready.is_set()
+
+    # Without a limit, the Event is left alone
+    assert update(writer_ready, writers, None) == 4
+    assert not writer_ready.is_set()
+
+    writers[0].write(b"AA", 0)
+    assert update(writer_ready, writers, 3) == 0
+    assert writer_ready.is_set()
+    assert f.getvalue() == b"AABBBB"
+
+
+def test_thread_pipeline_runner(monkeypatch, run, cores):
+    monkeypatch.setattr("cutadapt.runners._free_threading_enabled", lambda: True)
+    run(
+        f"--cores {cores + 1} --buffer-size 200 -a TTAGACATATCTCCGTCG",
+        "small.fastq",
+        "small.fastq",
+    )
+
+
+def test_thread_pipeline_runner_unordered(monkeypatch, tmp_path):
+    monkeypatch.setattr("cutadapt.runners._free_threading_enabled", lambda: True)
+    out = tmp_path / "out.fastq"
+    main(
+        [
+            "--cores=2",
+            "--unordered",
+            "--buffer-size=200",
+            "-a",
+            "TTAGACATATCTCCGTCG",
+            "-o",
+            str(out),
+            datapath("small.fastq"),
+        ]
+    )
+    with dnaio.open(cutpath("small.fastq")) as f:
+        expected = sorted(record.name for record in f)
+    with dnaio.open(out) as f:
+        assert sorted(record.name for record in f) == expected
+
+
+def test_thread_pipeline_runner_paired(monkeypatch, tmp_path):
+    monkeypatch.setattr("cutadapt.runners._free_threading_enabled", lambda: True)
+    monkeypatch.setattr("cutadapt.runners.ParallelPipelineRunner", None)
+    out1 = tmp_path / "out.1.fastq"
+    out2 = tmp_path / "out.2.fastq"
+    main(
+        [
+            "--cores=2",
+            "-a",
+            "TTAGACATAT",
+            "-m",
+            "14",
+            "-q",
+            "10",
+            "-o",
+            str(out1),
+            "-p",
+            str(out2),
+            datapath("paired.1.fastq"),
+            datapath("paired.2.fastq"),
+        ]
+    )
+    assert_files_equal(cutpath("paired.m14.1.fastq"), out1)
+    assert_files_equal(cutpath("paired.m14.2.fastq"), out2)
+
+
+def test_limited_reader_min_newlines():
+    data = b"@r1\n" + b"A" * 1000 + b"\n+\n" + b"#" * 1000 + b"\n@r2\nA\n+\n#\n"
+    reader = LimitedReader(io.BytesIO(data), limit=50, min_newlines=8)
+    buf = bytearray(10000)
+    assert reader.readinto(buf) == len(data)
+    assert buf[: len(data)] == data
+
+
+def test_thread_pipeline_runner_empty_input(monkeypatch, tmp_path):
+    reports = []
+    for free_threading in (False, True):
+        monkeypatch.setattr(
+            "cutadapt.runners._free_threading_enabled", lambda: free_threading
+        )
+        json_path = tmp_path / f"report-{free_threading}.json"
+        main(
+            [
+                "--cores=2",
+                "-q",
+                "20",
+                "-a",
+                "adapter=TTAGACATATCTCCGTCG",
+                "--json",
+                str(json_path),
+                "-o",
+                str(tmp_path / "out.fastq"),
+                datapath("empty.fastq"),
+            ]
+        )
+        report = json.loads(json_path.read_text())
+        del report["command_line_arguments"]
+        reports.append(report)
+    assert reports[1]["adapters_read1"][0]["total_matches"] == 0
+    assert reports[1]["basepair_counts"]["quality_trimmed"] == 0
+    assert reports[0] == reports[1]
+
+
+def test_demultiplex_sparse_chunks(tmp_path):
+    # With small chunks, most chunks contain no reads for most of the output files
+    for cores in (1, 2):
+        outdir = tmp_path / str(cores)
+        outdir.mkdir()
+        main(
+            [
+                "--cores",
+                str(cores),
+                "--buffer-size=1000",
+                "-a",
+                "first=AGATCGGAAG",
+                "-a",
+                "second=CCAGC",
+                "-a",
+                "third=GGGGGGGG",
+                "-o",
+                str(outdir / "{name}.fastq"),
+                datapath("illumina.fastq.gz"),
+            ]
+        )
+    for name in ("first", "second", "third", "unknown"):
+        assert_files_equal(
+            tmp_path / "1" / f"{name}.fastq", tmp_path / "2" / f"{name}.fastq"
+        )
+
+
+def test_json_snapshot(tmp_path, monkeypatch):
+    import cutadapt.cli
+
+    snapshots = []
+    write_json_report = cutadapt.cli.write_json_report
+
+    def record_snapshot(path, stats, *args, **kwargs):
+        if path.endswith("snapshot.json"):
+            snapshots.append((stats.n, stats.with_adapters[0]))
+        write_json_report(path, stats, *args, **kwargs)
+
+    monkeypatch.setattr(cutadapt.cli, "write_json_report", record_snapshot)
+    main(
+        [
+            "--cores=2",
+            "--buffer-size=1000",
+            "--json-snapshot",
+            str(tmp_path / "snapshot.json"),
+            "--json-snapshot-interval=0",
+            "--json",
+            str(tmp_path / "report.json"),
+            "-a",
+            "AGATCGGAAG",
+            "-o",
+            str(tmp_path / "out.fastq"),
+            datapath("illumina.fastq.gz"),
+        ]
+    )
+    # Updates while running and the final statistics
+    assert len(snapshots) > 2
+    assert snapshots == sorted(snapshots)
+    assert 0 < snapshots[0][0] < 100
+    assert snapshots[-1][0] == 100
+    with open(tmp_path / "snapshot.json") as f:
+        snapshot = json.load(f)
+    with open(tmp_path / "report.json") as f:
+        report = json.load(f)
+    assert snapshot == report
+
+
+@pytest.mark.parametrize("max_records", [0, 1, 2, 3, 5, 6, 10])
+def test_limit_chunks_fastq(max_records):
+    records = [f"@r{i}\nACGT\n+\nIIII\n".encode() for i in range(6)]
+    chunks = [b"".join(records[:4]), b"".join(records[4:])]
+
+    def chunk_tuples():
+        yield (memoryview(chunks[0]),)
+        yield (memoryview(chunks[1]),)
+        # Chunks after the limit must not be read
+        assert max_records > 6
+        yield from ()
+
+    limited = [bytes(chunk) for (chunk,) in _limit_chunks(chunk_tuples(), max_records)]
+    assert b"".join(limited) == b"".join(records[:max_records])
+    assert b"" not in limited
+
+
+def test_limit_chunks_fasta_paired():
+    records1 = [f">r{i}\nACGT\nAC\n".encode() for i in range(5)]
+    records2 = [f">r{i}\nTT\n".encode() for i in range(5)]
+    chunks = [(memoryview(b"".join(records1)), memoryview(b"".join(records2)))]
+    ((chunk1, chunk2),) = _limit_chunks(chunks, 3)
+    assert bytes(chunk1) == b"".join(records1[:3])
+    assert bytes(chunk2) == b"".join(records2[:3])
+
+
+def test_limit_chunks_bam():
+    records = [
+        (length).to_bytes(4, "little") + bytes([i]) * length
+        for i, length in enumerate([5, 300, 1, 7])
+    ]
+    chunks = [(memoryview(b"".join(records)),)]
+    ((chunk,),) = _limit_chunks(chunks, 2)
+    assert bytes(chunk) == b"".join(records[:2])
+
+
+def test_max_reads(tmp_path, cores):
+    main(
+        [
+            "-a",
+            "AGATCGGAAG",
+            "-o",
+            str(tmp_path / "all.fastq"),
+            datapath("illumina.fastq.gz"),
+        ]
+    )
+    stats = main(
+        [
+            "--cores",
+            str(cores),
+            "--buffer-size=1000",
+            "--max-reads=13",
+            "-a",
+            "AGATCGGAAG",
+            "-o",
+            str(tmp_path / "head.fastq"),
+            datapath("illumina.fastq.gz"),
+        ]
+    )
+    assert stats.n == 13
+    with dnaio.open(tmp_path / "all.fastq") as f:
+        expected = [record for record, _ in zip(f, range(13))]
+    with dnaio.open(tmp_path / "head.fastq") as f:
+        assert list(f) == expected
+
+
+def test_max_reads_paired(tmp_path, cores):
+    stats = main(
+        [
+            "--cores",
+            str(cores),
+            "--buffer-size=512",
+            "--max-reads=3",
+            "-o",
+            str(tmp_path / "out.1.fastq"),
+            "-p",
+            str(tmp_path / "out.2.fastq"),
+            datapath("paired.1.fastq"),
+            datapath("paired.2.fastq"),
+        ]
+    )
+    assert stats.n == 3
+    for i in (1, 2):
+        with dnaio.open(tmp_path / f"out.{i}.fastq") as f:
+            names = [record.name for record in f]
+        with dnaio.open(datapath(f"paired.{i}.fastq")) as f:
+            assert names == [record.name for record, _ in zip(f, range(3))]
+
+
+def test_sample_chunks():
+    chunks = [(memoryview(i.to_bytes(2, "little")),) for i in range(1000)]
+    sample = [bytes(chunk) for (chunk,) in _sample_chunks(chunks, 0.3)]
+    assert 200 < len(sample) < 400
+    assert sample == [bytes(chunk) for (chunk,) in _sample_chunks(chunks, 0.3)]
+    assert len(list(_sample_chunks(chunks, 1))) == 1000
+    assert len(list(_sample_chunks(chunks, None))) == 1000
+
+
+def test_sample(tmp_path):
+    reports = []
+    for cores in (1, 2):
+        path = tmp_path / f"report{cores}.json"
+        stats = main(
+            [
+                "--cores",
+                str(cores),
+                "--buffer-size=2000",
+                "--sample=0.4",
+                "--json",
+                str(path),
+                "-a",
+                "adapter=CCAGC",
+                datapath("illumina.fastq.gz"),
+            ]
+        )
+        assert 0 < stats.n < 100
+        assert 0 < stats.with_adapters[0] < stats.n
+        with open(path) as f:
+            reports.append(json.load(f))
+    assert reports[0]["read_counts"] == reports[1]["read_counts"]
+    assert reports[0]["adapters_read1"] == reports[1]["adapters_read1"]
+
+
+def test_sample_without_output(tmp_path):
+    with pytest.raises(SystemExit) as e:
+        main(
+            ["--sample=0.5", "-o", str(tmp_path / "out.fastq"), datapath("small.fastq")]
+        )
+    assert e.value.code == 2
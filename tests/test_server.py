@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+
+import pytest
+
+from cutadapt.server import JobError, serve, submit
+from utils import assert_files_equal, datapath, cutpath
+
+
+@pytest.fixture
+def server(tmp_path, cores):
+    path = os.fspath(tmp_path / "cutadapt.sock")
+    thread = threading.Thread(
+        target=serve, args=(path, cores), kwargs=dict(max_jobs=3), daemon=True
+    )
+    thread.start()
+    # Wait until the server is listening
+    deadline = time.monotonic() + 10
+    while not os.path.exists(path):
+        assert thread.is_alive(), "server did not start"
+        assert time.monotonic() < deadline, "timeout while waiting for server"
+        thread.join(0.01)
+    yield path
+    # Submit invalid jobs until the server has stopped
+    while thread.is_alive() and os.path.exists(path):
+        try:
+            submit(path, ["--invalid-option"])
+        except (JobError, OSError):
+            pass
+    thread.join(10)
+    assert not thread.is_alive()
+    assert not os.path.exists(path)
+
+
+def test_server(server, tmp_path):
+    for name in ("out1.fastq", "out2.fastq"):
+        report = submit(
+            server,
+            ["-a", "TTAGACATATCTCCGTCG", "-o", name, datapath("small.fastq")],
+            cwd=os.fspath(tmp_path),
+        )
+        assert_files_equal(cutpath("small.fastq"), tmp_path / name)
+        assert report["read_counts"]["input"] == 3
+        assert report["read_counts"]["output"] == 3
+        assert report["adapters_read1"][0]["total_matches"] == 2
+
+    with pytest.raises(JobError):
+        submit(
+            server, ["-o", "out.fastq", "nonexisting.fastq"], cwd=os.fspath(tmp_path)
+        )
@@ -0,0 +1,42 @@
+import gc
+import os
+import pickle
+
+import pytest
+
+from cutadapt.sharedindex import SharedIndex
+
+
+def test_shared_index():
+    d = {"ACGT": (0, 1, 3), "TTTT": (1, 0, 4), "A": (2, 0, 1), "": (3, 2, 0)}
+    index = SharedIndex.create(d)
+    assert len(index) == 4
+    assert dict(index) == d
+    for key, value in d.items():
+        assert key in index
+        assert index[key] == value
+    assert "ACGG" not in index
+    assert index.get("ACGG") is None
+    with pytest.raises(KeyError):
+        index["ACG"]
+    assert "Ä" not in index
+
+
+def test_shared_index_many_keys():
+    d = {f"{i:06d}": (i, i % 3, i % 7) for i in range(5000)}
+    index = SharedIndex.create(d)
+    assert all(index[key] == value for key, value in d.items())
+
+
+def test_shared_index_pickle():
+    index = SharedIndex.create({"ACGT": (0, 1, 3)})
+    path = index._path
+    unpickled = pickle.loads(pickle.dumps(index))
+    assert unpickled["ACGT"] == (0, 1, 3)
+    assert os.path.exists(path)
+    # The file is removed when the index that created it is gone,
+    # but remains usable where it is mapped
+    del index
+    gc.collect()
+    assert not os.path.exists(path)
+    assert unpickled["ACGT"] == (0, 1, 3)
@@ -1,6 +1,8 @@
 import sys
 import os.path
+import struct
 import subprocess
+import zlib
 
 
 def datapath(path):
@@ -46,3 +48,21 @@ def binomial(n, k):
         r *= n - j
         r //= j + 1
     return r
+
+
+def bgzf_compress(data: bytes, block_size: int) -> bytes:
+    """Compress data in BGZF format using blocks of block_size uncompressed bytes"""
+    blocks = []
+    for i in range(0, len(data), block_size):
+        piece = data[i : i + block_size]
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        deflated = compressor.compress(piece) + compressor.flush()
+        header = b"\x1f\x8b\x08\x04\0\0\0\0\0\xff\x06\0BC\x02\0"
+        header += struct.pack("<H", len(deflated) + 25)
+        trailer = struct.pack("<II", zlib.crc32(piece), len(piece))
+        blocks.append(header + deflated + trailer)
+    # End-of-file marker
+    blocks.append(
+        bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+    )
+    return b"".join(blocks)